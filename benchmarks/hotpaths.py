@@ -0,0 +1,250 @@
+"""Benchmark the hot paths of the generator - font sizing, drawing, augmentation and dataset generation.
+
+Every case is timed call by call, reported are images per second, latency percentiles of a call and peak
+memory allocated by the call (as traced by tracemalloc). Results can be saved as JSON and are compared against
+a baseline, the script then fails if any case got slower than the baseline by more than the tolerance.
+By default the results are compared against `benchmarks/baseline.json`, recorded with the default font
+and charset, update it with `-o benchmarks/baseline.json` when a change is expected to affect performance.
+
+Usage: python benchmarks/hotpaths.py [--font PATH] [-n REPEAT] [-o results.json] [--baseline baseline.json]
+"""
+
+import argparse
+import json
+import os
+import platform
+import shutil
+import statistics
+import sys
+import tempfile
+import time
+import tracemalloc
+
+import numpy as np
+
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT_DIR)
+
+from src.generator import data_augmentation  # noqa: E402
+from src.generator import utils  # noqa: E402
+from src.generator.imgen import DEFAULT_FONT_PATH, CharImageGenerator  # noqa: E402
+
+DEFAULT_CHARSET_PATH = os.path.join(ROOT_DIR, 'data', 'simple-charset.txt')
+DEFAULT_BASELINE_PATH = os.path.join(ROOT_DIR, 'benchmarks', 'baseline.json')
+DEFAULT_TOLERANCE = 0.2
+PERCENTILES = (50, 90, 99)
+
+
+class Context:
+    """Shared inputs of the benchmark cases."""
+
+    def __init__(self, font_path, charset, sample_size=(32, 32)):
+        self.font_path = font_path
+        self.charset = charset
+        self.sample_size = sample_size
+        self.tmp_dir = tempfile.mkdtemp(prefix='bench_')
+
+    def generator(self, out_dir=None) -> CharImageGenerator:
+        from PIL import ImageFont
+
+        font_dct = {'bench': ImageFont.truetype(self.font_path, size=20)}
+        return CharImageGenerator(out_dir=out_dir or self.out_dir(), font_dct=font_dct, charset=self.charset)
+
+    def out_dir(self) -> str:
+        return tempfile.mkdtemp(dir=self.tmp_dir)
+
+    def gray_image(self) -> np.ndarray:
+        """Grayscale float image of a character, the input of the data augmentation transforms."""
+        image = self.generator().create_char_image(self.charset[0], 'bench', sample_size=self.sample_size)
+        return np.asarray(image.convert('L'), dtype=np.float64) / 255
+
+
+def case_estimate_font_size(ctx):
+    from PIL import ImageFont
+
+    font = ImageFont.truetype(ctx.font_path, size=20)
+    # no font cache is shared between the calls, every call searches from scratch
+    return lambda: utils.estimate_font_size(font, 'H', fit_size=ctx.sample_size), 1
+
+
+def case_create_char_image(ctx):
+    gen = ctx.generator()
+
+    def run():
+        for char in ctx.charset:
+            gen.create_char_image(char, 'bench', sample_size=ctx.sample_size)
+
+    return run, len(ctx.charset)
+
+
+def case_generate_char_images(ctx):
+    gen = ctx.generator()
+    return lambda: sum(1 for _ in gen.generate_char_images(sample_size=ctx.sample_size)), len(ctx.charset)
+
+
+def case_generate_char_images_augmented(ctx):
+    gen = ctx.generator()
+    n_samples = 5
+
+    def run():
+        return sum(1 for _ in gen.generate_char_images(sample_size=ctx.sample_size, augment=True,
+                                                       n_samples=n_samples))
+
+    return run, len(ctx.charset) * n_samples
+
+
+def case_create_sprites(ctx):
+    def run():
+        ctx.generator().create_sprites(sample_size=ctx.sample_size)
+
+    return run, len(ctx.charset)
+
+
+def _transform_case(transform):
+    def case(ctx):
+        image = ctx.gray_image()
+        return lambda: transform(image), 1
+
+    case.__name__ = 'case_' + transform.__name__
+    return case
+
+
+def case_create_and_save_charsets(ctx):
+    n_samples = 5
+
+    def run():
+        gen = ctx.generator()
+        gen.create_and_save_charsets(sample_size=ctx.sample_size, n_samples=n_samples, augment=True, seed=0)
+
+    return run, len(ctx.charset) * n_samples
+
+
+CASES = {
+    'estimate_font_size': case_estimate_font_size,
+    'create_char_image': case_create_char_image,
+    'generate_char_images': case_generate_char_images,
+    'generate_char_images[augment]': case_generate_char_images_augmented,
+    'create_sprites': case_create_sprites,
+    'random_rotation': _transform_case(data_augmentation.random_rotation),
+    'random_noise': _transform_case(data_augmentation.random_noise),
+    'random_translation': _transform_case(data_augmentation.random_translation),
+    'random_warp': _transform_case(data_augmentation.random_warp),
+    'create_and_save_charsets': case_create_and_save_charsets,
+}
+
+
+def measure(fn, n_images, repeat=10, warmup=1) -> dict:
+    """Call `fn` `repeat` times, return throughput, latency percentiles and peak traced memory."""
+    for _ in range(warmup):
+        fn()
+
+    latencies, peaks = list(), list()
+    for _ in range(repeat):
+        tracemalloc.start()
+        start = time.perf_counter()
+        fn()
+        latencies.append(time.perf_counter() - start)
+        peaks.append(tracemalloc.get_traced_memory()[1])
+        tracemalloc.stop()
+
+    # tracing slows the allocations down, throughput is measured without it
+    start = time.perf_counter()
+    for _ in range(repeat):
+        fn()
+    elapsed = time.perf_counter() - start
+
+    percentiles = np.percentile(latencies, PERCENTILES)
+    result = {
+        'images_per_s': n_images * repeat / elapsed,
+        'calls': repeat,
+        'images_per_call': n_images,
+        'latency_mean_ms': statistics.mean(latencies) * 1e3,
+        'peak_mem_mb': max(peaks) / 2 ** 20,
+    }
+    result.update({'latency_p{}_ms'.format(p): v * 1e3 for p, v in zip(PERCENTILES, percentiles)})
+
+    return result
+
+
+def compare(results: dict, baseline: dict, tolerance=DEFAULT_TOLERANCE) -> list:
+    """Return names of the cases whose throughput dropped below (1 - tolerance) of the baseline."""
+    regressions = list()
+    for name, result in results.items():
+        base = baseline.get('cases', baseline).get(name)
+        if base is None:
+            continue
+
+        ratio = result['images_per_s'] / base['images_per_s']
+        result['baseline_ratio'] = ratio
+        if ratio < 1 - tolerance:
+            regressions.append(name)
+
+    return regressions
+
+
+def main(argv):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--font', default=DEFAULT_FONT_PATH, help="Font file the benchmarks render with.")
+    parser.add_argument('--charset', default=DEFAULT_CHARSET_PATH, help="Charset file the benchmarks render.")
+    parser.add_argument('-n', '--repeat', type=int, default=10, help="Number of timed calls of each case.")
+    parser.add_argument('-k', '--cases', nargs='+', choices=sorted(CASES), help="Run only the given cases.")
+    parser.add_argument('-o', '--output', help="Write results into the given JSON file.")
+    parser.add_argument('--baseline', default=DEFAULT_BASELINE_PATH,
+                        help="Compare the results with the given JSON file written by `-o` (default the baseline"
+                             " of the default font and charset in benchmarks/baseline.json).")
+    parser.add_argument('--no-baseline', dest='baseline', action='store_const', const=None,
+                        help="Do not compare the results with any baseline.")
+    parser.add_argument('--tolerance', type=float, default=DEFAULT_TOLERANCE,
+                        help="Allowed relative drop of throughput against the baseline (default 0.2).")
+    args = parser.parse_args(argv)
+
+    if not os.path.isfile(args.font):
+        parser.error("font file '%s' not found, see --font" % args.font)
+
+    charset = CharImageGenerator.load_char_set(args.charset)
+    ctx = Context(args.font, charset)
+
+    results = dict()
+    print("{:<32} {:>10} {:>9} {:>9} {:>9} {:>9}".format('case', 'images/s', 'p50 ms', 'p90 ms', 'p99 ms', 'peak MB'))
+    try:
+        for name in args.cases or list(CASES):
+            fn, n_images = CASES[name](ctx)
+            results[name] = result = measure(fn, n_images, repeat=args.repeat)
+            print("{:<32} {:>10.1f} {:>9.2f} {:>9.2f} {:>9.2f} {:>9.2f}".format(
+                name, result['images_per_s'], result['latency_p50_ms'], result['latency_p90_ms'],
+                result['latency_p99_ms'], result['peak_mem_mb']))
+    finally:
+        shutil.rmtree(ctx.tmp_dir, ignore_errors=True)
+
+    regressions = list()
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+
+        inputs = (os.path.basename(args.font), os.path.basename(args.charset))
+        if inputs != (baseline.get('font'), baseline.get('charset')):
+            print("Baseline '{}' was recorded with font '{}' and charset '{}', results are not compared".format(
+                args.baseline, baseline.get('font'), baseline.get('charset')), file=sys.stderr)
+        else:
+            regressions = compare(results, baseline, tolerance=args.tolerance)
+        for name in regressions:
+            print("Regression: {} runs at {:.0%} of the baseline".format(name, results[name]['baseline_ratio']),
+                  file=sys.stderr)
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump({
+                'created': time.time(),
+                'python': platform.python_version(),
+                'machine': platform.machine(),
+                'font': os.path.basename(args.font),
+                'charset': os.path.basename(args.charset),
+                'cases': results,
+            }, f, indent=2)
+
+    if regressions:
+        exit(1)
+
+
+if __name__ == '__main__':
+    main(sys.argv[1:])
@@ -0,0 +1,88 @@
+"""Measure startup time and peak memory of the generator package and its CLIs.
+
+Every target is run in a fresh interpreter, so that nothing is cached by the previous runs.
+
+Usage: python benchmarks/startup.py [-n REPEAT] [-o results.json]
+"""
+
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import time
+
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+TARGETS = {
+    'import src.generator': [sys.executable, '-c', 'import src.generator'],
+    'import src.generator.imgen': [sys.executable, '-c', 'import src.generator.imgen'],
+    'import src.generator.data_augmentation': [sys.executable, '-c', 'import src.generator.data_augmentation'],
+    'run.py --help': [sys.executable, 'run.py', '--help'],
+    'data_augmentation --help': [sys.executable, '-m', 'src.generator.data_augmentation', '--help'],
+}
+
+
+def measure(cmd, repeat=5) -> dict:
+    """Run the command `repeat` times, return median wall time and peak RSS of the child process."""
+    times, peaks = list(), list()
+    for _ in range(repeat):
+        start = time.perf_counter()
+        proc = subprocess.Popen(cmd, cwd=ROOT_DIR, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+        # wait4 gives resource usage of this particular child (ru_maxrss is in kB on Linux)
+        _, status, rusage = os.wait4(proc.pid, 0)
+        times.append(time.perf_counter() - start)
+        peaks.append(rusage.ru_maxrss)
+
+        proc.returncode = os.waitstatus_to_exitcode(status)
+        if proc.returncode:
+            raise RuntimeError("Command {} failed with exit code {}".format(cmd, proc.returncode))
+
+    return {
+        'time_s': statistics.median(times),
+        'time_min_s': min(times),
+        'peak_rss_mb': max(peaks) / 1024,
+    }
+
+
+def top_imports(cmd, n=10) -> list:
+    """Return the `n` most expensive imports (cumulative microseconds) as reported by -X importtime."""
+    cmd = [cmd[0], '-X', 'importtime'] + cmd[1:]
+    proc = subprocess.run(cmd, cwd=ROOT_DIR, stdout=subprocess.DEVNULL, stderr=subprocess.PIPE, check=True)
+
+    imports = list()
+    for line in proc.stderr.decode().splitlines():
+        if not line.startswith('import time:') or 'cumulative' in line:
+            continue
+        _, cumulative_us, name = line[len('import time:'):].split('|')
+        imports.append((name.strip(), int(cumulative_us)))
+
+    return sorted(imports, key=lambda t: t[1], reverse=True)[:n]
+
+
+def main(argv):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('-n', '--repeat', type=int, default=5, help="Number of runs of each target.")
+    parser.add_argument('-o', '--output', help="Write results into the given JSON file.")
+    parser.add_argument('--top-imports', type=int, default=0, help="Show N most expensive imports of each target.")
+    args = parser.parse_args(argv)
+
+    results = dict()
+    for name, cmd in TARGETS.items():
+        results[name] = measure(cmd, repeat=args.repeat)
+        print("{:<42} {:>8.1f} ms {:>8.1f} MB".format(name, results[name]['time_s'] * 1e3,
+                                                      results[name]['peak_rss_mb']))
+
+        if args.top_imports:
+            results[name]['top_imports'] = top_imports(cmd, n=args.top_imports)
+            for module, cumulative_us in results[name]['top_imports']:
+                print("    {:<38} {:>8.1f} ms".format(module, cumulative_us / 1e3))
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(results, f, indent=2)
+
+
+if __name__ == '__main__':
+    main(sys.argv[1:])
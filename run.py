@@ -4,15 +4,51 @@ This script assumes that the fonts have already been obtained using scraper.
 """
 
 import argparse
-import colorama
+import os
+import sys
 
-from src.generator import CharImageGenerator
 
+def parse_stage_workers(value: str) -> dict:
+    """Parse 'stage=N,...' into a dictionary."""
+    stage_workers = dict()
+    for item in value.split(','):
+        stage, _, workers = item.partition('=')
+        if stage not in ('render', 'augment', 'encode') or not workers.isdigit() or int(workers) < 1:
+            raise argparse.ArgumentTypeError("invalid stage workers '%s', expected e.g. 'render=2,encode=4'" % item)
+        stage_workers[stage] = int(workers)
 
-def main():
-    # Initialize colored output
-    colorama.init()
+    return stage_workers
+
+
+def generate(gen, args):
+    """Create the sprite sheets and the dataset."""
+    import colorama
+    from src.generator import sinks
+    from src.generator.manifest import MANIFEST_FILE
+
+    print(f"{colorama.Fore.YELLOW}Creating sprite sheets ...")
+    # Generates sprite sheets as a preview of fonts - no augmentation performed, boards are single band
+    gen.create_sprites(workers=args.workers, atlas=args.sprite_atlas, mode='1' if args.mode == '1' else 'L')
+    print(f"{colorama.Fore.GREEN}Sprite sheets have been created successfully.")
+
+    print(f"{colorama.Fore.YELLOW}Generating character images ...")
+    sink = None
+    if args.output_format != 'png':
+        sink = sinks.create_shard_sink(args.output_format, out_dir=gen.out_dir, shard_size=args.shard_size)
 
+    # Shards can not be appended to, the manifest is kept by default only for the PNG output
+    manifest_path = args.manifest
+    if manifest_path is None and args.output_format == 'png':
+        manifest_path = os.path.join(gen.out_dir, MANIFEST_FILE)
+
+    # Also creates default charset dir if not existent
+    gen.create_and_save_charsets(test_train_split=True, workers=args.workers, sink=sink, manifest_path=manifest_path,
+                                 stage_workers=args.stage_workers, queue_size=args.queue_size, mode=args.mode,
+                                 holdout_ratio=args.holdout_ratio)
+    print(f"{colorama.Fore.GREEN}Image generation completed successfully.")
+
+
+def main():
     parser = argparse.ArgumentParser()
 
     parser.add_argument(
@@ -30,17 +66,173 @@ def main():
         help="If provided, generated directory will be prefixed with the value of `prefix`."
     )
 
+    parser.add_argument(
+        '--font-size-cache',
+        help="Path to a JSON file to store fitted font sizes in, reused by subsequent runs."
+    )
+
+    parser.add_argument(
+        '--font-catalog',
+        help="Path to the font catalog (default '<font-dir>/font-catalog.json'), metadata of the fonts are read"
+             " only for the font files which are new or have changed since the previous run."
+    )
+
+    parser.add_argument(
+        '-j', '--workers',
+        type=int,
+        default=None,
+        help="Number of worker processes to read new font files and archives and to generate the character images"
+             " with (one font per task)."
+    )
+
+    parser.add_argument(
+        '--sprite-atlas',
+        action='store_true',
+        help="Write also a combined sprite atlas of all fonts into '<prefix>/sprites/atlas.npy', memory-mappable"
+             " array of shape (fonts, chars, height, width) listed in 'atlas.json'."
+    )
+
+    parser.add_argument(
+        '--mode',
+        choices=['RGB', 'L', '1'],
+        default='RGB',
+        help="Mode of the generated images - 8-bit RGB (default), 8-bit grayscale or bilevel, single band images"
+             " take a third (a byte per pixel in .npy shards) of the space of the RGB ones."
+    )
+
+    parser.add_argument(
+        '--output-format',
+        choices=['png', 'npy', 'tar'],
+        default='png',
+        help="Format of the generated dataset - PNG file per image (default), or fixed-size shards of"
+             " memory-mappable .npy arrays or WebDataset-style tar archives."
+    )
+
+    parser.add_argument(
+        '--shard-size',
+        type=int,
+        default=10000,
+        help="Number of images per shard (only applies to the sharded output formats)."
+    )
+
+    parser.add_argument(
+        '--manifest',
+        help="Path to the manifest of generated images (default '<prefix>/manifest.jsonl' for the PNG output),"
+             " images recorded in the manifest are not generated again unless their font file or the parameters"
+             " change."
+    )
+
+    parser.add_argument(
+        '--stage-workers',
+        type=parse_stage_workers,
+        default=None,
+        help="Number of threads of the generation pipeline stages in each process, e.g. 'render=2,encode=4'"
+             " (stages 'render', 'augment' and 'encode', images are written by a single thread)."
+    )
+
+    parser.add_argument(
+        '--queue-size',
+        type=int,
+        default=8,
+        help="Capacity of the queues in between the pipeline stages."
+    )
+
+    parser.add_argument(
+        '--seed',
+        type=int,
+        default=None,
+        help="Seed of the generation, the dataset is then the same for any number of workers and any sample can be"
+             " regenerated with `CharImageGenerator.generate_sample`."
+    )
+
+    parser.add_argument(
+        '--holdout-ratio',
+        type=float,
+        default=0.,
+        help="Fraction of the fonts all samples of which go into the test set, fonts are held out by a stable hash"
+             " of their names."
+    )
+
+    parser.add_argument(
+        '--num-shards',
+        type=int,
+        default=1,
+        help="Number of nodes the generation is split among, fonts are assigned to the shards by a stable hash of"
+             " their names. Every node writes into '<prefix>/shard-<index>-of-<num-shards>', use the same --seed"
+             " on all nodes to get the dataset of a single run."
+    )
+
+    parser.add_argument(
+        '--shard-index',
+        type=int,
+        default=0,
+        help="Index of the shard generated by this node (0 <= index < --num-shards)."
+    )
+
+    parser.add_argument(
+        '--merge-shards',
+        action='store_true',
+        help="Merge manifests and shard indexes of all --num-shards shards in '<prefix>' into one dataset index"
+             " and exit, once all nodes are done."
+    )
+
+    parser.add_argument(
+        '--profile',
+        action='store_true',
+        help="Time font sizing, drawing, augmentation, encoding and writes for each font and print a summary,"
+             " slow and failing fonts are flagged."
+    )
+
+    parser.add_argument(
+        '--cprofile',
+        metavar='PATH',
+        help="Profile the run with cProfile and write the statistics into PATH (worker processes are not"
+             " profiled, combine with '-j 1')."
+    )
+
     args = parser.parse_args()
+    if args.num_shards < 1 or not 0 <= args.shard_index < args.num_shards:
+        parser.error("--shard-index must be in the range [0, --num-shards)")
 
-    gen = CharImageGenerator.load(charset_path=args.charset, fonts_path=args.font_dir, out_dir=args.prefix)
+    # Import only once the arguments are parsed, so that `--help` does not load the generator
+    import colorama
+    from src.generator import CharImageGenerator, sharding
+    from src.generator.imgen import DEFAULT_OUT_DIR
+    from src.generator.pipeline import format_stats
+    from src.generator.profiling import cprofile
 
-    print(f"{colorama.Fore.YELLOW}Creating sprite sheets ...")
-    gen.create_sprites()  # Generates sprite sheets as a preview of fonts - no augmentation performed
-    print(f"{colorama.Fore.GREEN}Sprite sheets have been created successfully.")
+    # Initialize colored output
+    colorama.init()
 
-    print(f"{colorama.Fore.YELLOW}Generating character images ...")
-    gen.create_and_save_charsets(test_train_split=True)  # Also creates default charset dir if not existent
-    print(f"{colorama.Fore.GREEN}Image generation completed successfully.")
+    prefix = args.prefix or DEFAULT_OUT_DIR
+    if args.merge_shards:
+        try:
+            summary = sharding.merge_shards(prefix, args.num_shards)
+        except ValueError as e:
+            print(e, file=sys.stderr)
+            exit(1)
+
+        print(f"{colorama.Fore.GREEN}Merged {summary['shards']} shards into {prefix}.{colorama.Style.RESET_ALL}")
+        return
+
+    out_dir = args.prefix
+    if args.num_shards > 1:
+        out_dir = sharding.shard_dir(prefix, args.shard_index, args.num_shards)
+
+    gen = CharImageGenerator.load(charset_path=args.charset, fonts_path=args.font_dir, out_dir=out_dir,
+                                  font_size_cache=args.font_size_cache, font_catalog=args.font_catalog,
+                                  profile=args.profile, seed=args.seed, workers=args.workers)
+    if args.num_shards > 1:
+        gen.select_fonts(sharding.shard_fonts(gen.font_dct, args.shard_index, args.num_shards))
+        print("Shard {} of {}: {} fonts".format(args.shard_index, args.num_shards, len(gen.font_dct)))
+
+    with cprofile(args.cprofile):
+        generate(gen, args)
+
+    print(f"{colorama.Style.RESET_ALL}{format_stats(gen.stage_stats)}")
+    if args.profile:
+        print()
+        print(gen.profiler.summary())
 
 
 if __name__ == '__main__':
@@ -1 +1,23 @@
-from .imgen import CharImageGenerator
+"""Character image generator.
+
+Submodules are imported lazily on first access, so that importing the package does not pay
+for dependencies of the code paths which are not used.
+"""
+
+import importlib
+
+_LAZY_ATTRIBUTES = {
+    'CharImageGenerator': '.imgen',
+}
+
+
+def __getattr__(name):
+    if name in _LAZY_ATTRIBUTES:
+        module = importlib.import_module(_LAZY_ATTRIBUTES[name], __name__)
+        return getattr(module, name)
+
+    raise AttributeError("module {!r} has no attribute {!r}".format(__name__, name))
+
+
+def __dir__():
+    return sorted(list(globals()) + list(_LAZY_ATTRIBUTES))
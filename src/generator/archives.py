@@ -0,0 +1,110 @@
+"""Font files packed in zip archives - fonts are read straight out of the archives, nothing is extracted.
+
+A font inside an archive is addressed by a virtual path `<archive path>!/<member name>`, e.g.
+`fonts/Lato/Lato.zip!/Lato-Bold.ttf`. Virtual paths can be used anywhere a path to a font file is expected
+by the generator, the functions of this module accept plain paths as well.
+"""
+
+import functools
+import hashlib
+import io
+import os
+import re
+import sys
+import zipfile
+
+ARCHIVE_SEPARATOR = '!/'
+ARCHIVE_PATTERN = r'.+\.zip$'
+# number of font files kept in memory, fonts are opened once per size while the font size is being fitted
+MEMBER_CACHE_SIZE = 32
+
+
+def is_archive(path: str) -> bool:
+    return re.match(ARCHIVE_PATTERN, path, flags=re.IGNORECASE) is not None
+
+
+def split_path(path: str) -> tuple:
+    """Split virtual path into (archive path, member name), member name is None for plain paths."""
+    archive, separator, member = path.partition(ARCHIVE_SEPARATOR)
+    if not separator:
+        return path, None
+
+    return archive, member
+
+
+def join_path(archive: str, member: str) -> str:
+    """Return virtual path of the archive member."""
+    return archive + ARCHIVE_SEPARATOR + member
+
+
+def getmtime(path: str) -> float:
+    """Return mtime of the file, archive members get the mtime of their archive."""
+    archive, _ = split_path(path)
+    return os.path.getmtime(archive)
+
+
+@functools.lru_cache(maxsize=MEMBER_CACHE_SIZE)
+def _read_member(archive: str, member: str, mtime: float) -> bytes:
+    try:
+        with zipfile.ZipFile(archive) as f:
+            return f.read(member)
+    except (KeyError, zipfile.BadZipFile) as e:
+        raise OSError("Invalid archive member '%s'" % join_path(archive, member), *e.args) from None
+
+
+def read_bytes(path: str) -> bytes:
+    """Read content of the file or the archive member.
+
+    :raises OSError: if the file can not be read
+    """
+    archive, member = split_path(path)
+    if member is None:
+        with open(path, 'rb') as f:
+            return f.read()
+
+    # mtime is a part of the cache key, so that changed archives are read again
+    return _read_member(archive, member, os.path.getmtime(archive))
+
+
+def read_archive(archive: str, members: list = None):
+    """Iterate over (virtual path, content) of the members (default all files) of the archive opened once.
+
+    Members which can not be read are reported and skipped.
+    """
+    with zipfile.ZipFile(archive) as f:
+        if members is None:
+            members = [name for name in f.namelist() if not name.endswith('/')]
+
+        for member in members:
+            try:
+                yield join_path(archive, member), f.read(member)
+            except (KeyError, zipfile.BadZipFile, OSError) as e:
+                print("Skipping invalid archive member: '%s'" % join_path(archive, member), e.args, file=sys.stderr)
+
+
+def data_hash(data: bytes, algorithm='sha1') -> str:
+    """Return hex digest of the content, the same as `utils.file_hash` of a file with the content."""
+    return hashlib.new(algorithm, data).hexdigest()
+
+
+def file_hash(path: str, algorithm='sha1') -> str:
+    """Return hex digest of the content of the file or the archive member."""
+    from .utils import file_hash as plain_file_hash
+
+    if split_path(path)[1] is None:
+        return plain_file_hash(path, algorithm=algorithm)
+
+    return data_hash(read_bytes(path), algorithm=algorithm)
+
+
+def open_font(path: str, size=None, **kwargs):
+    """Open font file or archive member with FreeType, see `PIL.ImageFont.truetype`."""
+    from PIL import ImageFont
+
+    if size is not None:
+        kwargs['size'] = size
+
+    if split_path(path)[1] is None:
+        return ImageFont.truetype(path, **kwargs)
+
+    return ImageFont.truetype(io.BytesIO(read_bytes(path)), **kwargs)
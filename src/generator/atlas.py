@@ -0,0 +1,229 @@
+"""Glyph atlas - cache of clean glyph bitmaps to be positioned and augmented many times"""
+
+import collections
+import random
+import threading
+import typing
+
+import numpy as np
+
+from PIL import Image, ImageColor, ImageDraw, ImageFont
+
+from . import utils
+
+DEFAULT_ATLAS_SIZE = 64 * 1024 ** 2  # bytes
+# output modes - 8-bit RGB, 8-bit grayscale and bilevel (1-bit) images
+MODES = ('RGB', 'L', '1')
+
+
+class Glyph(typing.NamedTuple):
+    """Clean glyph bitmap together with its metrics."""
+
+    bitmap: np.ndarray  # ink coverage, uint8 array of shape (h, w)
+    origin: tuple  # position of the bitmap relative to the text location
+    text_size: tuple  # font.getsize(char)
+    text_offset: tuple  # font.getoffset(char)
+
+    @property
+    def nbytes(self):
+        return self.bitmap.nbytes
+
+
+def rasterize_glyph(font: ImageFont.FreeTypeFont, char: chr, sample_size=(32, 32)) -> Glyph:
+    """Draw the character and crop its bitmap.
+
+    The canvas is padded by the maximum random offset, so that no ink which might be shifted
+    into the sample gets lost.
+    """
+    text_size = font.getsize(char)
+    text_offset = font.getoffset(char)
+
+    pad = min(sample_size) // 10
+    canvas = Image.new(mode='L', color=0, size=(sample_size[0] + 2 * pad, sample_size[1] + 2 * pad))
+
+    char_loc = utils.get_text_loc(text_size=text_size, text_offset=text_offset,
+                                  sample_size=sample_size, offset=None)
+    draw_loc = (int(char_loc[0]) + pad, int(char_loc[1]) + pad)
+    ImageDraw.Draw(canvas).text(xy=draw_loc, text=char, font=font, fill=255)
+
+    bbox = canvas.getbbox()
+    if bbox is None:  # blank glyph, e.g. space
+        return Glyph(np.zeros((0, 0), dtype=np.uint8), (0, 0), text_size, text_offset)
+
+    bitmap = np.asarray(canvas.crop(bbox))
+    origin = (bbox[0] - draw_loc[0], bbox[1] - draw_loc[1])
+
+    return Glyph(bitmap, origin, text_size, text_offset)
+
+
+class CompiledCharset:
+    """Metrics of all characters of the charset in the font, computed in one pass.
+
+    Locations of the characters in the samples are then derived for whole batches at once,
+    instead of calling `utils.get_text_loc` for every sample.
+    """
+
+    def __init__(self, font: ImageFont.FreeTypeFont, charset: list, sample_size=(32, 32), index: dict = None):
+        """Compute metrics of the charset.
+
+        :param index: index of each character in the charset, may be shared by the charsets of all fonts
+        """
+        self.charset = charset
+        self.sample_size = tuple(sample_size)
+        self.index = {char: i for i, char in enumerate(charset)} if index is None else index
+        # columns - text width, text height, text offset x, text offset y
+        self.metrics = np.array([font.getsize(char) + font.getoffset(char) for char in self.charset],
+                                dtype=np.int32).reshape(-1, 4)
+
+    def jitter(self, n: int, seeds: list = None) -> np.ndarray:
+        """Random offsets of `n` samples, int32 array of shape (n, 2).
+
+        :param seeds: seed of each sample, the offsets are then drawn as by `utils.get_text_loc`
+        with `random.Random(seed)`
+        """
+        factor = min(self.sample_size) // 10
+        if seeds is None:
+            return np.random.randint(-factor, factor + 1, size=(n, 2)).astype(np.int32)
+
+        offsets = np.empty((n, 2), dtype=np.int32)
+        for i, seed in enumerate(seeds):
+            rng = random.Random(seed)
+            offsets[i] = rng.randint(-factor, factor), rng.randint(-factor, factor)
+
+        return offsets
+
+    def locations(self, chars, seeds: list = None, offset='random') -> np.ndarray:
+        """Locations of the characters in their samples, same as those given by `utils.get_text_loc`.
+
+        :param chars: indices of the characters in the charset, one for each sample
+        :param seeds: seed of the random offset of each sample (default unseeded)
+        :param offset: offset of the characters in the sample, 'random' adds a little bit of entropy
+
+        :returns: int32 array of shape (n, 2)
+        """
+        metrics = self.metrics[np.asarray(chars, dtype=np.intp)]
+        offsets = metrics[:, 2:]
+        if offset == 'random':
+            offsets = offsets + self.jitter(len(metrics), seeds)
+
+        return (np.asarray(self.sample_size, dtype=np.int32) - metrics[:, :2] - offsets) // 2
+
+
+def check_mode(mode: str):
+    """Raise ValueError if the mode is not one of the output `MODES`."""
+    if mode not in MODES:
+        raise ValueError("Unsupported image mode '%s', expected one of %s" % (mode, MODES))
+
+
+def compose_mode(mode: str) -> str:
+    """Mode the samples of the output `mode` are composed and augmented in, bilevel samples in grayscale."""
+    return 'L' if mode == '1' else mode
+
+
+def to_mode(samples: np.ndarray, mode: str) -> np.ndarray:
+    """Convert uint8 samples composed in `compose_mode(mode)` into the output mode.
+
+    Bilevel samples are thresholded into bool arrays (True is white), which PIL and the sinks
+    store as 1-bit images, other samples are returned as they are.
+    """
+    if mode == '1':
+        return samples >= 128
+
+    return samples
+
+
+def compose_glyph(out: np.ndarray, glyph: Glyph, char_loc, bgcolor='#f6f6f6', fontcolor='black', mode='RGB'):
+    """Fill `out` with background and blend the glyph into it at `char_loc`.
+
+    :param out: uint8 array of shape (H, W) or (H, W, C) matching the `mode`
+    :param char_loc: location of the text in the sample as given by `utils.get_text_loc`
+    """
+    bg = np.asarray(ImageColor.getcolor(bgcolor, mode), dtype=np.uint16)
+    fg = np.asarray(ImageColor.getcolor(fontcolor, mode), dtype=np.uint16)
+
+    out[...] = bg
+
+    height, width = out.shape[:2]
+    gh, gw = glyph.bitmap.shape
+    x0, y0 = int(char_loc[0]) + glyph.origin[0], int(char_loc[1]) + glyph.origin[1]
+
+    # clip the glyph to the sample
+    ox0, oy0 = max(x0, 0), max(y0, 0)
+    ox1, oy1 = min(x0 + gw, width), min(y0 + gh, height)
+    if ox0 >= ox1 or oy0 >= oy1:
+        return out
+
+    alpha = glyph.bitmap[oy0 - y0:oy1 - y0, ox0 - x0:ox1 - x0].astype(np.uint16)
+    if out.ndim == 3:
+        alpha = alpha[..., np.newaxis]
+
+    out[oy0:oy1, ox0:ox1] = (bg * (255 - alpha) + fg * alpha + 127) // 255
+
+    return out
+
+
+class GlyphAtlas:
+    """Cache of glyphs keyed by (font, char, sample_size) bounded by memory budget.
+
+    Least recently used glyphs are evicted once the budget is exceeded.
+    """
+
+    def __init__(self, max_bytes=DEFAULT_ATLAS_SIZE):
+        self.max_bytes = max_bytes
+        self.nbytes = 0
+        self.hits = 0
+        self.misses = 0
+
+        self._glyphs = collections.OrderedDict()
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._glyphs)
+
+    def get(self, font: ImageFont.FreeTypeFont, char: chr, sample_size=(32, 32)) -> Glyph:
+        """Return cached glyph, rasterize it if it is not cached yet."""
+        key = (font.path, font.size, char, tuple(sample_size))
+        with self._lock:
+            glyph = self._glyphs.get(key)
+            if glyph is not None:
+                self._glyphs.move_to_end(key)
+                self.hits += 1
+                return glyph
+
+        glyph = rasterize_glyph(font, char, sample_size=sample_size)
+
+        with self._lock:
+            self.misses += 1
+            if key not in self._glyphs:
+                self._glyphs[key] = glyph
+                self.nbytes += glyph.nbytes
+
+            while self.nbytes > self.max_bytes and len(self._glyphs) > 1:
+                _, evicted = self._glyphs.popitem(last=False)
+                self.nbytes -= evicted.nbytes
+
+        return glyph
+
+    def render(self, font: ImageFont.FreeTypeFont, char: chr, sample_size=(32, 32),
+               bgcolor='#f6f6f6', fontcolor='black', mode='RGB', offset='random') -> Image.Image:
+        """Create sample image of the character positioned in the sample.
+
+        :param mode: one of `MODES`
+        """
+        check_mode(mode)
+        glyph = self.get(font, char, sample_size=sample_size)
+        char_loc = utils.get_text_loc(text_size=glyph.text_size, text_offset=glyph.text_offset,
+                                      sample_size=sample_size, offset=offset)
+
+        channels = Image.getmodebands(mode)
+        shape = (sample_size[1], sample_size[0]) + ((channels,) if channels > 1 else ())
+        out = np.empty(shape, dtype=np.uint8)
+        compose_glyph(out, glyph, char_loc, bgcolor, fontcolor, mode=compose_mode(mode))
+
+        return Image.fromarray(to_mode(out, mode))
+
+    def clear(self):
+        """Drop all cached glyphs."""
+        with self._lock:
+            self._glyphs.clear()
+            self.nbytes = 0
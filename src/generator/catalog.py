@@ -0,0 +1,526 @@
+"""Persistent font catalog - metadata of the font files collected once and reused by the subsequent runs.
+
+For every font file the catalog keeps its path, mtime, size, content hash, family and style names, whether
+the font could be loaded and its glyph coverage read from the `cmap` table. Rebuilding the catalog only
+reads the files which have been added or changed since the last build.
+
+Font files packed in zip archives are cataloged in place under their virtual paths (see `archives`),
+archives are read in parallel and fonts with identical content can be left out of the font dictionary.
+"""
+
+import collections.abc
+import concurrent.futures
+import json
+import os
+import re
+import struct
+import sys
+import threading
+import time
+import typing
+import zipfile
+
+import numpy as np
+
+from . import archives, utils
+
+CATALOG_FILE = 'font-catalog.json'
+CATALOG_VERSION = 1
+FONT_FILE_PATTERN = r'(.+)\.[odtfOTF]{3}$'
+# number of plain font files read by a single worker task, archives are read by a task each
+FONTS_PER_TASK = 64
+
+# preferred cmap subtables (platform ID, encoding ID) - full unicode first
+CMAP_PREFERENCE = [(3, 10), (0, 6), (0, 4), (3, 1), (0, 3), (0, 2), (0, 1), (0, 0), (3, 0), (1, 0)]
+
+
+def _find_table(data: bytes, tag: bytes) -> tuple:
+    """Return (offset, length) of the table in the sfnt font data, the first font is used from collections."""
+    offset = 0
+    if data[:4] == b'ttcf':
+        offset, = struct.unpack_from('>L', data, 12)
+
+    num_tables, = struct.unpack_from('>H', data, offset + 4)
+    for i in range(num_tables):
+        table_tag, _, table_offset, length = struct.unpack_from('>4sLLL', data, offset + 12 + 16 * i)
+        if table_tag == tag:
+            return table_offset, length
+
+    raise ValueError("Table '%s' not found" % tag.decode())
+
+
+def _cmap_format_4(data: bytes, offset: int) -> np.ndarray:
+    seg_count = struct.unpack_from('>H', data, offset + 6)[0] // 2
+
+    def array(start):
+        return np.frombuffer(data, dtype='>u2', count=seg_count, offset=start).astype(np.int64)
+
+    end_codes = array(offset + 14)
+    start_codes = array(offset + 16 + 2 * seg_count)
+    id_deltas = array(offset + 16 + 4 * seg_count)
+    range_offsets_start = offset + 16 + 6 * seg_count
+    id_range_offsets = array(range_offsets_start)
+
+    codes = list()
+    for i in range(seg_count):
+        if start_codes[i] > end_codes[i]:
+            continue
+
+        segment = np.arange(start_codes[i], end_codes[i] + 1)
+        if id_range_offsets[i] == 0:
+            glyphs = (segment + id_deltas[i]) & 0xFFFF
+        else:
+            # idRangeOffset is relative to its own position in the idRangeOffset array
+            address = range_offsets_start + 2 * i + id_range_offsets[i] + 2 * (segment - start_codes[i])
+            glyphs = np.array([struct.unpack_from('>H', data, a)[0] if a + 2 <= len(data) else 0
+                               for a in address], dtype=np.int64)
+            glyphs = np.where(glyphs != 0, (glyphs + id_deltas[i]) & 0xFFFF, 0)
+
+        codes.append(segment[glyphs != 0])
+
+    codes = np.concatenate(codes) if codes else np.empty(0, dtype=np.int64)
+    return codes[codes != 0xFFFF]
+
+
+def _cmap_format_12(data: bytes, offset: int) -> np.ndarray:
+    n_groups, = struct.unpack_from('>L', data, offset + 12)
+    groups = np.frombuffer(data, dtype='>u4', count=3 * n_groups, offset=offset + 16).reshape(-1, 3)
+
+    codes = [
+        np.arange(start + (start_glyph == 0), int(end) + 1, dtype=np.int64)
+        for start, end, start_glyph in groups.astype(np.int64)
+    ]
+    return np.concatenate(codes) if codes else np.empty(0, dtype=np.int64)
+
+
+def _cmap_format_6(data: bytes, offset: int) -> np.ndarray:
+    first_code, entry_count = struct.unpack_from('>HH', data, offset + 6)
+    glyphs = np.frombuffer(data, dtype='>u2', count=entry_count, offset=offset + 10)
+
+    return first_code + np.flatnonzero(glyphs)
+
+
+def _cmap_format_0(data: bytes, offset: int) -> np.ndarray:
+    glyphs = np.frombuffer(data, dtype=np.uint8, count=256, offset=offset + 6)
+
+    return np.flatnonzero(glyphs)
+
+
+CMAP_FORMATS = {
+    0: _cmap_format_0,
+    4: _cmap_format_4,
+    6: _cmap_format_6,
+    12: _cmap_format_12,
+}
+
+
+def read_cmap(data: bytes) -> np.ndarray:
+    """Read code points mapped to a glyph by the `cmap` table of the sfnt (TrueType/OpenType) font data.
+
+    :returns: sorted array of code points
+    :raises ValueError: if the data is not a sfnt font or no supported cmap subtable is found
+    """
+    try:
+        cmap_offset, _ = _find_table(data, b'cmap')
+
+        n_subtables, = struct.unpack_from('>H', data, cmap_offset + 2)
+        subtables = dict()
+        for i in range(n_subtables):
+            platform_id, encoding_id, offset = struct.unpack_from('>HHL', data, cmap_offset + 4 + 8 * i)
+            fmt, = struct.unpack_from('>H', data, cmap_offset + offset)
+            if fmt in CMAP_FORMATS:
+                subtables.setdefault((platform_id, encoding_id), (fmt, cmap_offset + offset))
+
+        for key in CMAP_PREFERENCE + sorted(subtables):
+            if key in subtables:
+                fmt, offset = subtables[key]
+                return np.unique(CMAP_FORMATS[fmt](data, offset))
+    except struct.error as e:
+        raise ValueError("Corrupted font data", *e.args) from None
+
+    raise ValueError("No supported cmap subtable found")
+
+
+def _to_ranges(codes: np.ndarray) -> list:
+    """Compress sorted code points into a list of inclusive [start, end] ranges."""
+    if not len(codes):
+        return list()
+
+    breaks = np.flatnonzero(np.diff(codes) != 1)
+    starts = np.concatenate([codes[:1], codes[breaks + 1]])
+    ends = np.concatenate([codes[breaks], codes[-1:]])
+
+    return [[int(start), int(end)] for start, end in zip(starts, ends)]
+
+
+def _from_ranges(ranges: list) -> np.ndarray:
+    if not ranges:
+        return np.empty(0, dtype=np.int64)
+
+    return np.concatenate([np.arange(start, end + 1, dtype=np.int64) for start, end in ranges])
+
+
+def read_font_entry(path: str, data: bytes = None) -> dict:
+    """Collect catalog entry of the font file or archive member.
+
+    :param data: content of the font file if it has been read already
+    """
+    import io
+    from PIL import ImageFont
+
+    mtime = archives.getmtime(path)
+    data = archives.read_bytes(path) if data is None else data
+    entry = {
+        'path': path,
+        'name': utils.get_file_name(path),
+        'mtime': mtime,
+        'size': len(data),
+        'hash': archives.data_hash(data),
+        'family': None,
+        'style': None,
+        'valid': True,
+        'error': None,
+        'coverage': None,
+    }
+
+    try:
+        font = ImageFont.truetype(io.BytesIO(data))
+        entry['family'], entry['style'] = font.getname()
+    except OSError as e:
+        entry['valid'] = False
+        entry['error'] = str(e)
+        return entry
+
+    try:
+        entry['coverage'] = _to_ranges(read_cmap(data))
+    except ValueError as e:  # the font can be loaded, its coverage is just unknown
+        entry['error'] = " ".join(str(arg) for arg in e.args)
+
+    return entry
+
+
+def read_font_entries(paths: list) -> list:
+    """Collect catalog entries of the font files, members of an archive are read with the archive opened once."""
+    entries = list()
+    by_archive = dict()
+    for path in paths:
+        archive, member = archives.split_path(path)
+        if member is None:
+            try:
+                entries.append(read_font_entry(path))
+            except OSError as e:
+                print("Skipping unreadable font: '%s'" % path, e.args, file=sys.stderr)
+        else:
+            by_archive.setdefault(archive, list()).append(member)
+
+    for archive, members in by_archive.items():
+        try:
+            for path, data in archives.read_archive(archive, members):
+                entries.append(read_font_entry(path, data=data))
+        except (OSError, zipfile.BadZipFile) as e:
+            print("Skipping invalid archive: '%s'" % archive, e.args, file=sys.stderr)
+
+    return entries
+
+
+class FontCatalog:
+    """Catalog of font files keyed by their absolute paths."""
+
+    def __init__(self, path: str = None):
+        """Initialize catalog.
+
+        :param path: path to a JSON file the catalog is loaded from and saved to (default None,
+        the catalog is kept in memory only)
+        """
+        self.path = path
+        self.fonts = dict()
+
+        self._coverage = dict()
+        self._dirty = False
+        self._lock = threading.Lock()
+
+        if path and os.path.isfile(path):
+            self.load(path)
+
+    def __len__(self):
+        return len(self.fonts)
+
+    def __contains__(self, path):
+        return os.path.abspath(path) in self.fonts
+
+    def load(self, path):
+        """Load catalog from JSON file."""
+        try:
+            with open(path) as f:
+                catalog = json.load(f)
+            if catalog.get('version') != CATALOG_VERSION:
+                raise ValueError("Unsupported catalog version", catalog.get('version'))
+            self.fonts = catalog['fonts']
+        except (OSError, ValueError, KeyError) as e:
+            print("Ignoring invalid font catalog: '%s'" % path, e.args, file=sys.stderr)
+            self.fonts = dict()
+
+        self._coverage = dict()
+
+    def save(self, path=None):
+        """Save catalog into JSON file (only if there is anything new to save)."""
+        path = path or self.path
+        if path is None or not self._dirty:
+            return
+
+        with self._lock:
+            os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+            tmp_path = "{}.{}.tmp".format(path, os.getpid())
+            with open(tmp_path, 'w') as f:
+                json.dump({'version': CATALOG_VERSION, 'updated': time.time(), 'fonts': self.fonts}, f)
+            os.replace(tmp_path, path)
+
+            self._dirty = False
+
+    @staticmethod
+    def _scan(font_dir: str) -> dict:
+        """Return paths to the font files and the fonts in archives under `font_dir` mapped to (mtime, size)."""
+        stats = dict()
+        for root, _, files in os.walk(font_dir):
+            for file in files:
+                path = os.path.abspath(os.path.join(root, file))
+                if archives.is_archive(file):
+                    try:
+                        mtime = os.path.getmtime(path)
+                        with zipfile.ZipFile(path) as f:
+                            infos = f.infolist()
+                    except (OSError, zipfile.BadZipFile) as e:
+                        print("Skipping invalid archive: '%s'" % path, e.args, file=sys.stderr)
+                        continue
+
+                    for info in infos:
+                        if (not info.is_dir() and not info.filename.startswith('__MACOSX/')
+                                and re.match(FONT_FILE_PATTERN, os.path.basename(info.filename))):
+                            stats[archives.join_path(path, info.filename)] = (mtime, info.file_size)
+                elif re.match(FONT_FILE_PATTERN, file):
+                    try:
+                        stat = os.stat(path)
+                    except OSError:
+                        continue
+                    stats[path] = (stat.st_mtime, stat.st_size)
+
+        return stats
+
+    @classmethod
+    def find_fonts(cls, font_dir: str) -> list:
+        """Walk through the font directory and search for font files, including the fonts in zip archives."""
+        return sorted(cls._scan(font_dir))
+
+    def update(self, font_dir: str, prune=True, workers: int = None) -> list:
+        """Add new and changed fonts found in `font_dir` into the catalog.
+
+        Files with unchanged mtime and size are not read again. Fonts in zip archives are read without
+        being extracted, the archives are distributed among `workers` processes.
+
+        :param prune: whether to remove entries of the fonts under `font_dir` which no longer exist (default True)
+        :param workers: number of worker processes to read the new fonts with (default None, reads in this process)
+
+        :returns: paths to the fonts which have been (re)read
+        """
+        stats = self._scan(font_dir)
+        paths = sorted(stats)
+
+        changed = [
+            path for path in paths
+            if path not in self.fonts or (self.fonts[path]['mtime'], self.fonts[path]['size']) != stats[path]
+        ]
+
+        # a task per archive, plain font files are read in chunks
+        by_archive, plain = dict(), list()
+        for path in changed:
+            archive, member = archives.split_path(path)
+            if member is None:
+                plain.append(path)
+            else:
+                by_archive.setdefault(archive, list()).append(path)
+        tasks = list(by_archive.values()) + [plain[i:i + FONTS_PER_TASK] for i in range(0, len(plain), FONTS_PER_TASK)]
+
+        if not workers or workers <= 1 or len(tasks) <= 1:
+            entries = read_font_entries(changed)
+        else:
+            with concurrent.futures.ProcessPoolExecutor(max_workers=workers) as executor:
+                entries = [entry for task in executor.map(read_font_entries, tasks) for entry in task]
+
+        updated = list()
+        for entry in sorted(entries, key=lambda e: e['path']):
+            path = entry['path']
+            if not entry['valid']:
+                print("Invalid font: '%s'" % path, file=sys.stderr)
+
+            self.fonts[path] = entry
+            self._coverage.pop(path, None)
+            updated.append(path)
+
+        if prune:
+            root = os.path.join(os.path.abspath(font_dir), '')
+            existing = set(paths)
+            for path in [p for p in self.fonts if p.startswith(root) and p not in existing]:
+                del self.fonts[path]
+                self._coverage.pop(path, None)
+                updated.append(path)
+
+        self._dirty = self._dirty or bool(updated)
+        return updated
+
+    def entries(self, valid=True) -> list:
+        """Return catalog entries sorted by path, only of the valid fonts by default."""
+        return [entry for _, entry in sorted(self.fonts.items()) if not valid or entry['valid']]
+
+    def coverage(self, path: str) -> np.ndarray:
+        """Return sorted code points covered by the font, None if the coverage is unknown."""
+        path = os.path.abspath(path)
+        if path not in self._coverage:
+            ranges = self.fonts[path]['coverage']
+            self._coverage[path] = None if ranges is None else _from_ranges(ranges)
+
+        return self._coverage[path]
+
+    def covers(self, path: str, chars) -> bool:
+        """Whether the font has glyphs for all the characters (True if the coverage is unknown)."""
+        coverage = self.coverage(path)
+        if coverage is None:
+            return True
+
+        return bool(np.isin([ord(c) for c in chars], coverage).all())
+
+    def duplicates(self) -> dict:
+        """Return content hashes of the valid fonts cataloged more than once mapped to the sorted paths."""
+        paths = dict()
+        for entry in self.entries(valid=True):
+            paths.setdefault(entry['hash'], list()).append(entry['path'])
+
+        return {digest: group for digest, group in paths.items() if len(group) > 1}
+
+    def font_dict(self, families: list = None, unique=False) -> 'LazyFontDict':
+        """Return font dictionary of the valid fonts, fonts are opened only once they are accessed.
+
+        :param families: include only fonts of the given families (default all)
+        :param unique: whether to include only the first (by path) of the fonts with identical content,
+        e.g. of the same font repackaged in several archives (default False)
+        """
+        paths, hashes = dict(), dict()
+        seen = set()
+        for entry in self.entries(valid=True):
+            if families is not None and entry['family'] not in families:
+                continue
+            if unique:
+                if entry['hash'] in seen:
+                    continue
+                seen.add(entry['hash'])
+            paths[entry['name']] = entry['path']
+            hashes[entry['name']] = entry['hash']
+
+        return LazyFontDict(paths, hashes=hashes, catalog=self)
+
+
+def _font_coverage(path: str, catalog: FontCatalog = None) -> np.ndarray:
+    if catalog is not None and path in catalog:
+        return catalog.coverage(path)
+
+    try:
+        return read_cmap(archives.read_bytes(path))
+    except (OSError, ValueError):
+        return None
+
+
+def coverage_matrix(font_paths: list, charset: list, catalog: FontCatalog = None) -> np.ndarray:
+    """Compute font x char coverage matrix.
+
+    The cmap of each font is read only once (or taken from the `catalog`), all characters are then
+    looked up at once. Fonts of unknown coverage are assumed to cover all characters.
+
+    :param font_paths: paths to the font files
+    :param charset: characters, a character consisting of multiple code points is covered if all of them are
+    :param catalog: catalog to take the coverage of the fonts from (default None, cmaps are read from the files)
+
+    :returns: bool array of shape (len(font_paths), len(charset))
+    """
+    charset = list(charset)
+    codes = np.array([ord(c) if len(c) == 1 else -1 for c in charset], dtype=np.int64)
+    multi = [j for j, c in enumerate(charset) if len(c) != 1]
+
+    matrix = np.ones((len(font_paths), len(charset)), dtype=bool)
+    for i, path in enumerate(font_paths):
+        coverage = _font_coverage(path, catalog)
+        if coverage is None:
+            continue
+
+        matrix[i] = np.isin(codes, coverage)
+        for j in multi:
+            matrix[i, j] = np.isin([ord(c) for c in charset[j]], coverage).all()
+
+    return matrix
+
+
+class LazyFontDict(collections.abc.Mapping):
+    """Mapping of font names to fonts, font files are opened on the first access."""
+
+    def __init__(self, paths: dict, hashes: dict = None, catalog: FontCatalog = None, size=None):
+        """Initialize dictionary.
+
+        :param paths: font names mapped to the paths to the font files
+        :param hashes: font names mapped to the hashes of the font files (default None, unknown)
+        :param catalog: catalog the fonts come from
+        :param size: size the fonts are opened with (default PIL default)
+        """
+        self.paths = paths
+        self.hashes = hashes
+        self.catalog = catalog
+        self.size = size
+
+        self._fonts = dict()
+        self._lock = threading.Lock()
+
+    def __getitem__(self, font_name):
+        font = self._fonts.get(font_name)
+        if font is None:
+            font = archives.open_font(self.paths[font_name], size=self.size)
+            with self._lock:
+                font = self._fonts.setdefault(font_name, font)
+
+        return font
+
+    def __iter__(self):
+        return iter(self.paths)
+
+    def __len__(self):
+        return len(self.paths)
+
+    def __contains__(self, font_name):
+        return font_name in self.paths
+
+    def subset(self, font_names: typing.Iterable) -> 'LazyFontDict':
+        """Return dictionary of the given fonts, fonts opened already are shared."""
+        font_names = list(font_names)
+        font_dct = LazyFontDict({font_name: self.paths[font_name] for font_name in font_names},
+                                hashes=None if self.hashes is None else {
+                                    font_name: self.hashes[font_name] for font_name in font_names
+                                    if font_name in self.hashes},
+                                catalog=self.catalog, size=self.size)
+        font_dct._fonts = {font_name: font for font_name, font in self._fonts.items() if font_name in font_dct}
+
+        return font_dct
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        state['_fonts'] = dict()
+        state['_lock'] = None
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self._lock = threading.Lock()
+
+
+def font_path(font_dct, font_name) -> str:
+    """Return path to the font file without opening the font if the dictionary is lazy."""
+    paths = getattr(font_dct, 'paths', None)
+    if paths is not None:
+        return paths[font_name]
+
+    return font_dct[font_name].path
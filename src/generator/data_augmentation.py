@@ -1,56 +1,260 @@
 """Data augmentation module."""
 
 import argparse
+import collections
+import functools
 import os
 import sys
 import random
 
 import numpy as np
 
-from scipy import ndarray
+from .profiling import Profiler, cprofile
 
-# image processing library
-from skimage import transform
-from skimage import util
-from skimage import io
+# image processing library (scikit-image) is imported lazily by the functions which need it,
+# so that importing this module (or running it with --help) stays cheap
 
 
-def random_rotation(image_array: ndarray):
+def random_rotation(image_array: np.ndarray):
     """Pick a random degree of rotation between 25% on the left and 25% on the right."""
-    random_degree = random.uniform(-25, 25)
-    return transform.rotate(image_array, random_degree, mode='symmetric')
+    return batch_random_rotation(image_array[np.newaxis], rng=_module_rng())[0]
 
 
-def random_noise(image_array: ndarray):
+def random_noise(image_array: np.ndarray):
     """Add random noise to the image."""
-    return util.random_noise(image_array)
+    return batch_random_noise(image_array[np.newaxis], rng=_module_rng())[0]
 
 
-def random_translation(image_array: ndarray):
+def random_translation(image_array: np.ndarray):
     """Apply random translation transformation to the image."""
-    tform = transform.SimilarityTransform(
-        translation=(random.randint(-5, 5), random.randint(-5, 5))
-    )
-    translated = transform.warp(image_array, tform, mode='symmetric')
-
-    return translated
+    return batch_random_translation(image_array[np.newaxis], rng=_module_rng())[0]
 
 
-def random_warp(image_array: ndarray):
+def random_warp(image_array: np.ndarray):
     """Apply random warp transformation to the image."""
+    return batch_random_warp(image_array[np.newaxis])[0]
 
-    a = image_array.shape[1] / random.randint(4, 8)
-    w = random.uniform(-1.0, 1.0) / image_array.shape[0]
 
-    warped = image_array.copy()
-    for i in range(image_array.shape[0]):
-        shift = int(np.ceil(a * np.sin(2.0 * np.pi * i * w)))
-        warped[i, :] = np.roll(
-            warped[i, :],
-            shift=shift
-        )
+def _module_rng() -> np.random.Generator:
+    """Generator seeded from module `random`, so that `random.seed` still seeds the single image transformations."""
+    return np.random.default_rng(random.getrandbits(64))
+
+
+def _draw(rng, n, draw) -> np.ndarray:
+    """Draw random parameters of `n` images by `draw(generator, n)`.
+
+    :param rng: random number generator of the whole stack, or list of generators of each image,
+    the parameters of an image then depend only on its own generator (default new generator)
+    """
+    if isinstance(rng, list):
+        return np.concatenate([draw(r, 1) for r in rng]) if rng else draw(np.random.default_rng(), 0)
+
+    return draw(rng or np.random.default_rng(), n)
+
+
+def _rotation_matrices(rng, n, shape) -> np.ndarray:
+    from .transforms import transform_matrix
+
+    degrees = _draw(rng, n, lambda r, k: r.uniform(-25, 25, k))
+    # skimage rotates counter-clockwise, i.e. in the opposite direction of the transformation matrix
+    return transform_matrix(-degrees, np.zeros(n), np.ones(n), np.ones(n), shape=shape)
+
+
+def _translation_matrices(rng, n) -> np.ndarray:
+    matrices = np.tile(np.eye(3), (n, 1, 1))
+    matrices[:, :2, 2] = _draw(rng, n, lambda r, k: r.integers(-5, 5, size=(k, 2), endpoint=True))
+    return matrices
+
+
+def _warp_params(rng, images) -> tuple:
+    """Amplitudes and frequencies of the sine waves the rows of the images are shifted along."""
+    params = _draw(rng, images.shape[0], lambda r, k: np.stack(
+        [r.integers(4, 8, size=k, endpoint=True), r.uniform(-1.0, 1.0, size=k)], axis=1))
+    return images.shape[2] / params[:, 0], params[:, 1] / images.shape[1]
+
+
+def _noise(rng, shape, var=0.01, dtype=np.float32) -> np.ndarray:
+    return _draw(rng, shape[0], lambda r, k: r.normal(0., var ** 0.5, size=(k,) + shape[1:]).astype(dtype))
+
+
+def batch_random_rotation(images: np.ndarray, rng: np.random.Generator = None) -> np.ndarray:
+    """Rotate each image of the stack by a random degree between -25 and 25, see `random_rotation`."""
+    from .transforms import affine_transform
+
+    matrices = _rotation_matrices(rng, images.shape[0], shape=images.shape[1:3])
+    return affine_transform(images, matrices, fill_mode='reflect')
+
+
+def batch_random_noise(images: np.ndarray, rng: np.random.Generator = None, var=0.01) -> np.ndarray:
+    """Add gaussian noise to the stack of float images in range [0, 1] or uint8 images, see `random_noise`.
+
+    Variance `var` is relative to the range of the images, uint8 images stay uint8.
+    """
+    noise = _noise(rng, images.shape, var=var, dtype=np.float64)
+
+    if images.dtype == np.uint8:
+        noisy = images + 255 * noise.astype(np.float32)
+        return np.clip(np.rint(noisy, out=noisy), 0, 255, out=noisy).astype(np.uint8)
+
+    noisy = images + noise.astype(images.dtype)
+    return np.clip(noisy, 0., 1., out=noisy)
+
+
+def batch_random_translation(images: np.ndarray, rng: np.random.Generator = None) -> np.ndarray:
+    """Translate each image of the stack by up to 5 pixels in both directions, see `random_translation`."""
+    from .transforms import affine_transform
+
+    return affine_transform(images, _translation_matrices(rng, images.shape[0]), fill_mode='reflect')
+
+
+def batch_random_warp(images: np.ndarray, rng: np.random.Generator = None) -> np.ndarray:
+    """Shift rows of each image of the stack along a random sine wave, see `random_warp`.
+
+    Row shifts of all images are applied at once as a single indexed gather.
+    """
+    if rng is None:
+        a = np.array([images.shape[2] / random.randint(4, 8) for _ in range(images.shape[0])])
+        w = np.array([random.uniform(-1.0, 1.0) / images.shape[1] for _ in range(images.shape[0])])
+    else:
+        a, w = _warp_params(rng, images)
+
+    rows = np.arange(images.shape[1])
+    shifts = np.ceil(a[:, np.newaxis] * np.sin(2.0 * np.pi * rows * w[:, np.newaxis])).astype(np.intp)
+
+    # np.roll by `shift` takes the element at (j - shift) mod width
+    cols = (np.arange(images.shape[2]) - shifts[..., np.newaxis]) % images.shape[2]
+    cols = cols.reshape(cols.shape + (1,) * (images.ndim - 3))
+
+    return np.take_along_axis(images, cols, axis=2)
+
+
+BATCH_TRANSFORMATIONS = {
+    random_rotation: batch_random_rotation,
+    random_noise: batch_random_noise,
+    random_translation: batch_random_translation,
+    random_warp: batch_random_warp,
+}
+# transformations of the fused chain in the order they are applied (see `batch_random_chain`)
+DEFAULT_CHAIN = (random_rotation, random_translation, random_warp, random_noise)
+
+
+def random_chain(image_array: np.ndarray, chain=DEFAULT_CHAIN):
+    """Apply all transformations of the chain to the image, see `batch_random_chain`."""
+    return batch_random_chain(image_array[np.newaxis], rng=_module_rng(), chain=chain)[0]
+
+
+def batch_random_chain(images: np.ndarray, rng: np.random.Generator = None, chain=DEFAULT_CHAIN,
+                       var=0.01) -> np.ndarray:
+    """Apply the chain of transformations to each image of the stack of float or uint8 images in a single pass.
+
+    Geometric transformations of the chain (rotation, translation and warp) are composed into one mapping
+    of the output pixels to the input ones, the images are then interpolated once in float32 and the noise
+    is added into the interpolated images in place. Parameters of each transformation are drawn as by its
+    own batch transformation, the result differs from applying them one by one only by the rounding
+    of the intermediate images.
+
+    :param chain: transformations out of `BATCH_TRANSFORMATIONS` in the order they are applied
+    :param var: variance of the noise, see `batch_random_noise`
+    """
+    from .transforms import cast_like, interpolate, pixel_grid
+
+    unsupported = [t.__name__ for t in chain if t not in BATCH_TRANSFORMATIONS]
+    if unsupported:
+        raise ValueError("Unsupported transformations %s, expected any of %s"
+                         % (unsupported, [t.__name__ for t in BATCH_TRANSFORMATIONS]))
+
+    n, height, width = images.shape[:3]
+
+    # draw parameters in the order of the chain, so that they match those of the separate transformations
+    steps = list()
+    noise = None
+    for transformation in chain:
+        if transformation is random_rotation:
+            steps.append(_rotation_matrices(rng, n, shape=(height, width)).astype(np.float32))
+        elif transformation is random_translation:
+            steps.append(_translation_matrices(rng, n).astype(np.float32))
+        elif transformation is random_warp:
+            a, w = _warp_params(rng, images)
+            steps.append((a.astype(np.float32), w.astype(np.float32)))
+        else:
+            noise = _noise(rng, images.shape, var=var)
+
+    # map output coordinates through the steps in reverse order, consecutive affine steps are multiplied
+    src = np.broadcast_to(pixel_grid(height, width), (n, 2, height * width))
+    matrix = None
+    for step in reversed(steps):
+        if isinstance(step, np.ndarray):
+            matrix = step if matrix is None else step @ matrix
+            continue
+
+        if matrix is not None:
+            src = matrix[:, :2, :2] @ src + matrix[:, :2, 2:]
+            matrix = None
+        # the warp takes the pixel of the column shifted along the sine wave of the row, as np.roll does
+        a, w = step
+        shifts = np.ceil(a[:, np.newaxis] * np.sin(2 * np.pi * w[:, np.newaxis] * src[:, 0]))
+        src = np.stack([src[:, 0], (src[:, 1] - shifts) % width], axis=1)
+
+    if matrix is not None:
+        src = matrix[:, :2, :2] @ src + matrix[:, :2, 2:]
 
-    return warped
+    out = interpolate(images, src.astype(np.float32, copy=False), fill_mode='reflect')
+
+    if noise is not None:
+        high = 255 if images.dtype == np.uint8 else 1
+        if high != 1:
+            noise *= high
+        out += noise
+        np.clip(out, 0, high, out=out)
+
+    return cast_like(out, images)
+
+
+def _read_image(image_path):
+    from skimage import io, util
+
+    # read image as an two dimensional array of uint8 pixels, the batch transformations keep the dtype
+    return util.img_as_ubyte(io.imread(image_path, as_gray=True))
+
+
+def _write_image(image_path, image):
+    from skimage import io
+
+    io.imsave(image_path, image)
+
+
+def _transform_batch(images: list, transformations: list, rng: np.random.Generator = None,
+                     profiler: Profiler = None, seeds: list = None) -> list:
+    """Apply the transformation chosen for each image, images sharing the transformation are stacked.
+
+    :param transformations: transformation of each image, either one of `BATCH_TRANSFORMATIONS`
+    or a tuple of them applied as a fused chain (see `batch_random_chain`)
+
+    :param seeds: seed of each image, the transformed image then depends only on its seed and not on the batch
+    """
+    profiler = profiler or Profiler(enabled=False)
+    transformed = [None] * len(images)
+
+    groups = dict()
+    for i, (image, transformation) in enumerate(zip(images, transformations)):
+        groups.setdefault((transformation, image.shape), list()).append(i)
+
+    for (transformation, _), indices in groups.items():
+        if isinstance(transformation, tuple):
+            name = '+'.join(t.__name__[len('random_'):] for t in transformation)
+            batch_transformation = functools.partial(batch_random_chain, chain=transformation)
+        else:
+            name = transformation.__name__
+            batch_transformation = BATCH_TRANSFORMATIONS[transformation]
+
+        with profiler.timer(name, items=len(indices)):
+            stack = np.stack([images[i] for i in indices])
+            if seeds is not None:
+                rng = [np.random.default_rng(seeds[i]) for i in indices]
+            for i, image in zip(indices, batch_transformation(stack, rng=rng)):
+                transformed[i] = image
+
+    return transformed
 
 
 def apply_random_transformation(
@@ -59,8 +263,38 @@ def apply_random_transformation(
         recurse=False,
         limit=None,
         ignore_label=False,
-        img_type='png'):
-    """Load images from directory."""
+        img_type='png',
+        workers=None,
+        batch_size=64,
+        profiler: Profiler = None,
+        seed: int = None,
+        chain: tuple = None):
+    """Load images from directory.
+
+    Images are processed in batches of `batch_size`, images of the batch sharing the same transformation
+    are transformed at once. Decoding and encoding of the images runs in a pool of `workers` threads
+    and overlaps with the transformations of the previous batch.
+
+    :param profiler: profiler to record time spent reading, transforming and writing the images into
+    :param seed: seed of the run (default None, module `random`), the images, their transformations and
+    the random parameters of each image are then the same for any `workers` and `batch_size`
+    :param chain: transformations applied to every image as a fused chain (see `batch_random_chain`),
+    by default a single random transformation is applied to each image
+    """
+    from .utils import derive_seed
+
+    import concurrent.futures
+
+    profiler = profiler or Profiler(enabled=False)
+
+    def read_image(image_path):
+        with profiler.timer('read'):
+            return _read_image(image_path)
+
+    def write_image(image_path, image):
+        with profiler.timer('write'):
+            _write_image(image_path, image)
+
     if not os.path.isdir(output_folder):
         os.makedirs(output_folder, exist_ok=True)
 
@@ -87,34 +321,70 @@ def apply_random_transformation(
 
     limit = limit or len(image_files)
 
-    num_generated_files = 0
-    while num_generated_files < limit:
-        # random image from the input_folder
-        image_path: str = random.choice(image_files)
-        # read image as an two dimensional array of pixels
-        image_to_transform = io.imread(image_path, as_grey=True)
-        # random num of transformation to apply
-
-        transformation = random.choice(available_transformations)
+    # random images from the input_folder and the transformation to apply to each of them
+    rng = random if seed is None else random.Random(seed)
+    image_files.sort()
+    image_paths = [rng.choice(image_files) for _ in range(limit)]
+    if chain:
+        transformations = [tuple(chain)] * limit
+    else:
+        transformations = [rng.choice(available_transformations) for _ in range(limit)]
+    seeds = None if seed is None else [derive_seed(seed, num) for num in range(limit)]
 
-        # apply transformation
-        transformed_image = transformation(image_to_transform)
+    out_dirs = set()
 
+    def output_path(num, image_path):
         label = ""
         if not ignore_label:
             label = image_path.rsplit('/')[-2]
         out_dir = os.path.join(output_folder, label)
-        os.makedirs(out_dir, exist_ok=True)
+        if out_dir not in out_dirs:
+            os.makedirs(out_dir, exist_ok=True)
+            out_dirs.add(out_dir)
 
-        new_file_path = "{out_dir}/augmented_image_{id}.jpg".format(
+        return "{out_dir}/augmented_image_{id}.jpg".format(
             out_dir=out_dir,
-            id=num_generated_files
+            id=num
         )
 
-        # write image to the disk
-        io.imsave(new_file_path, transformed_image)
+    batch_starts = range(0, limit, batch_size)
+    with concurrent.futures.ThreadPoolExecutor(max_workers=workers or os.cpu_count()) as executor:
+
+        def read_batch(start):
+            return [executor.submit(read_image, path) for path in image_paths[start:start + batch_size]]
+
+        writes = collections.deque()
+        pending = read_batch(0) if limit else list()
+        for start in batch_starts:
+            images = [future.result() for future in pending]
+            # prefetch the next batch while the current one is being transformed
+            pending = read_batch(start + batch_size) if start + batch_size < limit else list()
+
+            transformed = _transform_batch(images, transformations[start:start + batch_size], profiler=profiler,
+                                           seeds=None if seeds is None else seeds[start:start + batch_size])
+
+            for num, image in enumerate(transformed, start=start):
+                # write image to the disk
+                writes.append(executor.submit(write_image, output_path(num, image_paths[num]), image))
+
+            # keep memory bounded - do not let the writes fall behind by more than one batch
+            while len(writes) > 2 * batch_size:
+                writes.popleft().result()
+
+        for future in writes:
+            future.result()
+
 
-        num_generated_files += 1
+CHAIN_NAMES = {t.__name__[len('random_'):]: t for t in BATCH_TRANSFORMATIONS}
+
+
+def parse_chain(value: str) -> tuple:
+    """Parse comma separated names of the transformations of the fused chain, e.g. 'rotation,noise'."""
+    try:
+        return tuple(CHAIN_NAMES[name.strip()] for name in value.split(','))
+    except KeyError as e:
+        raise argparse.ArgumentTypeError("unknown transformation %s, expected any of %s"
+                                         % (e, ', '.join(CHAIN_NAMES)))
 
 
 def parse_args(argv):
@@ -146,6 +416,42 @@ def parse_args(argv):
         action='store_true',
         help="Recursively find images in the input directory."
     )
+    parser.add_argument(
+        '-j', '--workers',
+        type=int,
+        default=None,
+        help="Number of threads reading and writing the images (number of CPUs by default)."
+    )
+    parser.add_argument(
+        '-b', '--batch-size',
+        type=int,
+        default=64,
+        help="Number of images transformed at once (64 by default)."
+    )
+    parser.add_argument(
+        '-c', '--chain',
+        type=parse_chain,
+        default=None,
+        help="Apply the given transformations to every image in a single pass, e.g. 'rotation,translation,noise'"
+             " (any of %s in the order they are applied), by default one random transformation is applied"
+             " to each image." % ', '.join(CHAIN_NAMES)
+    )
+    parser.add_argument(
+        '--seed',
+        type=int,
+        default=None,
+        help="Seed of the run, the output is then the same for any number of workers and batch size."
+    )
+    parser.add_argument(
+        '--profile',
+        action='store_true',
+        help="Print time spent reading, transforming and writing the images."
+    )
+    parser.add_argument(
+        '--cprofile',
+        metavar='PATH',
+        help="Profile the run with cProfile and write the statistics into PATH."
+    )
 
     return parser.parse_args(argv)
 
@@ -153,14 +459,27 @@ def parse_args(argv):
 def main(argv):
     """Run."""
     args = parse_args(argv)
+    profiler = Profiler(enabled=args.profile)
+    if args.seed is not None:
+        # the single image transformations draw from the module generator
+        random.seed(args.seed)
+
+    with cprofile(args.cprofile):
+        apply_random_transformation(
+            input_folder=args.input_dir,
+            output_folder=args.output_dir,
+            recurse=args.recurse,
+            limit=args.limit,
+            img_type=args.format,
+            workers=args.workers,
+            batch_size=args.batch_size,
+            profiler=profiler,
+            seed=args.seed,
+            chain=args.chain
+        )
 
-    apply_random_transformation(
-        input_folder=args.input_dir,
-        output_folder=args.output_dir,
-        recurse=args.recurse,
-        limit=args.limit,
-        img_type=args.format
-    )
+    if args.profile:
+        print(profiler.summary())
 
 
 if __name__ == '__main__':
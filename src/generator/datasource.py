@@ -0,0 +1,271 @@
+"""On-the-fly training data - samples are rendered and augmented per batch instead of being stored.
+
+`GeneratedDataset` enumerates the (font, char, sample) triples of a `CharImageGenerator`, every triple is
+rendered from its own random stream, see `CharImageGenerator.sample_seed`. Batches are produced in background
+threads and prefetched, the dataset can be consumed as an iterator of batches (one epoch or an endless stream)
+or as a Keras `Sequence`.
+"""
+
+import concurrent.futures
+import itertools
+import os
+import threading
+import typing
+
+import numpy as np
+
+from . import utils
+from .atlas import check_mode, compose_mode, to_mode
+from .imgen import DEFAULT_AUGMENTATION, CharImageGenerator
+from .transforms import AUGMENTATION_PARAMS, AffineAugmenter
+
+DEFAULT_PREFETCH = 4
+
+# thread pools shared by the Keras sequences, keyed by the number of workers
+_EXECUTORS = dict()
+_EXECUTORS_LOCK = threading.Lock()
+
+
+def _default_workers() -> int:
+    return min(4, os.cpu_count() or 1)
+
+
+def _shared_executor(workers: int = None) -> concurrent.futures.ThreadPoolExecutor:
+    """Return thread pool with `workers` threads, reused by all the sequences instead of one pool per sequence."""
+    workers = workers or _default_workers()
+    with _EXECUTORS_LOCK:
+        executor = _EXECUTORS.get(workers)
+        if executor is None:
+            executor = _EXECUTORS[workers] = concurrent.futures.ThreadPoolExecutor(
+                max_workers=workers, thread_name_prefix='generated-dataset')
+        return executor
+
+
+def prefetch(fn: typing.Callable, args: typing.Iterable, workers: int = None,
+             depth=DEFAULT_PREFETCH) -> typing.Iterator:
+    """Yield `fn(arg)` for each of the `args` in order, computing up to `depth` results ahead in `workers` threads."""
+    args = iter(args)
+    with concurrent.futures.ThreadPoolExecutor(max_workers=workers or _default_workers()) as executor:
+        pending = [executor.submit(fn, arg) for arg in itertools.islice(args, depth)]
+        try:
+            while pending:
+                result = pending.pop(0).result()
+                pending.extend(executor.submit(fn, arg) for arg in itertools.islice(args, 1))
+                yield result
+        finally:
+            # the consumer stopped early, do not wait for the batches it will never get
+            for future in pending:
+                future.cancel()
+
+
+class GeneratedDataset:
+    """Character image dataset generated on demand.
+
+    An epoch consists of `n_samples` of each character covered by each font. By default every epoch gets
+    fresh random positions and augmentations, with `fresh=False` the samples are those `create_and_save_charsets`
+    would write with the same seed.
+    """
+
+    def __init__(self, generator: CharImageGenerator, n_samples=5, augment=True, sample_size=(32, 32),
+                 mode='RGB', bgcolor='#f6f6f6', fontcolor='black', font_names: typing.Iterable = None,
+                 seed: int = None, fresh=True, **kwargs):
+        """Initialize dataset.
+
+        :param generator: generator with the fonts and the charset to render
+        :param n_samples: number of samples of each character in an epoch, if more than 1 sample is
+        requested, the first sample is not augmented (default 5)
+        :param mode: mode of the images, one of 'RGB' (default), 'L' (8-bit grayscale) or '1' (bilevel)
+        :param font_names: names of the fonts to render (default all fonts of the generator)
+        :param seed: base seed (default the generator's seed, random if None)
+        :param fresh: whether every epoch gets new samples (default True)
+        :param kwargs: augmentation parameters listed in `AUGMENTATION_PARAMS`
+        """
+        assert generator.charset is not None, "Character set has not been provided."
+
+        unsupported = sorted(set(kwargs) - set(AUGMENTATION_PARAMS))
+        if unsupported:
+            raise ValueError("Unsupported augmentation parameters %s, expected any of %s"
+                             % (unsupported, list(AUGMENTATION_PARAMS)))
+
+        self.generator = generator
+        self.n_samples = n_samples if augment else 1
+        self.augment = augment
+        self.sample_size = tuple(sample_size)
+        check_mode(mode)
+        self.mode = mode
+        self.bgcolor = bgcolor
+        self.fontcolor = fontcolor
+        self.fresh = fresh
+        self.augmenter = AffineAugmenter(**dict(DEFAULT_AUGMENTATION, **kwargs))
+
+        seed = generator.seed if seed is None else seed
+        self.seed = int(np.random.default_rng().integers(2 ** 32)) if seed is None else seed
+
+        self.font_names = list(generator.font_dct) if font_names is None else list(font_names)
+        # (font, char) pairs the fonts have glyphs for, coverage is computed here once for all the workers
+        self.font_indices, self.char_indices = np.nonzero(generator.coverage(self.font_names))
+
+        self.classes = np.unique([ord(char) for char in generator.charset])
+
+    def __len__(self):
+        """Number of samples in an epoch."""
+        return len(self.font_indices) * self.n_samples
+
+    def key(self, i: int) -> tuple:
+        """Return (font_name, char, sample index) of the `i`th sample of an epoch."""
+        pair, index = divmod(int(i), self.n_samples)
+        return (self.font_names[self.font_indices[pair]], self.generator.charset[self.char_indices[pair]],
+                index)
+
+    def epoch_seed(self, epoch: int) -> int:
+        """Base seed of the samples of the epoch."""
+        return utils.derive_seed(self.seed, 'epoch', epoch) if self.fresh else self.seed
+
+    def get_batch(self, idx: typing.Iterable, epoch=0) -> tuple:
+        """Render and augment the samples at the given indices of the epoch.
+
+        :returns: tuple (images, labels), images is uint8 array of shape (N, H, W, 3) for 'RGB', (N, H, W)
+        for 'L' and bool array of shape (N, H, W) for '1', labels are char ordinals
+        """
+        idx = np.asarray(idx, dtype=np.intp)
+        width, height = self.sample_size
+        mode = compose_mode(self.mode)
+        channels = () if mode == 'L' else (3,)
+        images = np.empty((len(idx), height, width) + channels, dtype=np.uint8)
+        labels = np.empty(len(idx), dtype=np.int32)
+
+        seed = self.epoch_seed(epoch)
+        seeds = list()
+        augmented = np.zeros(len(idx), dtype=bool)
+        first = 1 if self.n_samples > 1 else 0
+        for k, i in enumerate(idx):
+            font_name, char, index = self.key(i)
+            seeds.append(self.generator.sample_seed(font_name, char, index, seed=seed))
+            images[k] = self.generator.render_char_samples(char, font_name, 1, sample_size=self.sample_size,
+                                                           bgcolor=self.bgcolor, fontcolor=self.fontcolor,
+                                                           mode=mode, seeds=seeds[-1:])[0]
+            labels[k] = ord(char)
+            augmented[k] = self.augment and index >= first
+
+        if augmented.any():
+            images[augmented] = self.augmenter.transform_batch(images[augmented],
+                                                               seeds=list(itertools.compress(seeds, augmented)))
+
+        return to_mode(images, self.mode), labels
+
+    def epoch_order(self, epoch=0, shuffle=True) -> np.ndarray:
+        """Return order of the samples in the epoch, the shuffle depends only on the seed and the epoch."""
+        order = np.arange(len(self))
+        if shuffle:
+            np.random.default_rng(utils.derive_seed(self.seed, 'order', epoch)).shuffle(order)
+
+        return order
+
+    def batches(self, batch_size=32, shuffle=True, epoch=0, drop_last=False, workers: int = None,
+                prefetch_depth=DEFAULT_PREFETCH) -> typing.Iterator:
+        """Iterate over batches of (images, labels) of one epoch.
+
+        :param drop_last: whether to drop the last incomplete batch (default False)
+        :param workers: number of threads producing the batches
+        :param prefetch_depth: number of batches produced ahead of the consumer
+        """
+        order = self.epoch_order(epoch, shuffle=shuffle)
+        stop = len(order) - len(order) % batch_size if drop_last else len(order)
+        chunks = (order[start:start + batch_size] for start in range(0, stop, batch_size))
+
+        return prefetch(lambda chunk: self.get_batch(chunk, epoch=epoch), chunks, workers=workers,
+                        depth=prefetch_depth)
+
+    def stream(self, batch_size=32, shuffle=True, epochs: int = None, workers: int = None,
+               prefetch_depth=DEFAULT_PREFETCH) -> typing.Iterator:
+        """Iterate over batches of (images, labels) of `epochs` epochs (default endlessly).
+
+        Batches do not cross the epoch boundaries, the last batch of an epoch may be incomplete.
+        """
+        def chunks():
+            for epoch in itertools.count() if epochs is None else range(epochs):
+                order = self.epoch_order(epoch, shuffle=shuffle)
+                for start in range(0, len(order), batch_size):
+                    yield epoch, order[start:start + batch_size]
+
+        return prefetch(lambda chunk: self.get_batch(chunk[1], epoch=chunk[0]), chunks(), workers=workers,
+                        depth=prefetch_depth)
+
+    def keras_sequence(self, batch_size=32, shuffle=True, rescale=None, workers: int = None,
+                       prefetch_depth=DEFAULT_PREFETCH):
+        """Return Keras `Sequence` yielding (images, class indices) batches, every epoch is generated anew.
+
+        :param rescale: factor the images are multiplied by, e.g. 1/255 (default None, keeps uint8),
+        bilevel images are 0 or 1 and need no rescaling
+        """
+        return _sequence_class()(self, batch_size=batch_size, shuffle=shuffle, rescale=rescale, workers=workers,
+                                 prefetch_depth=prefetch_depth)
+
+    def class_indices(self, labels: np.ndarray) -> np.ndarray:
+        """Map char ordinals to indices into `classes`."""
+        return np.searchsorted(self.classes, labels)
+
+
+_SEQUENCE_CLASS = None
+
+
+def _sequence_class():
+    """Create `keras.utils.Sequence` subclass, Keras is imported only once it is needed."""
+    global _SEQUENCE_CLASS
+    if _SEQUENCE_CLASS is not None:
+        return _SEQUENCE_CLASS
+
+    from tensorflow import keras
+
+    class GeneratedSequence(keras.utils.Sequence):
+        """Keras Sequence adapter of `GeneratedDataset`, batches following the requested one are prefetched."""
+
+        def __init__(self, dataset: GeneratedDataset, batch_size=32, shuffle=True, rescale=None, workers=None,
+                     prefetch_depth=DEFAULT_PREFETCH):
+            super().__init__()
+            self.dataset = dataset
+            self.batch_size = batch_size
+            self.shuffle = shuffle
+            self.rescale = rescale
+            self.prefetch_depth = prefetch_depth
+
+            self.epoch = 0
+            self.order = dataset.epoch_order(0, shuffle=shuffle)
+            self._executor = _shared_executor(workers)
+            self._pending = dict()
+
+        def __len__(self):
+            return int(np.ceil(len(self.dataset) / self.batch_size))
+
+        def _submit(self, i):
+            if i < len(self) and i not in self._pending:
+                chunk = self.order[i * self.batch_size:(i + 1) * self.batch_size]
+                self._pending[i] = self._executor.submit(self.dataset.get_batch, chunk, epoch=self.epoch)
+
+        def __getitem__(self, i):
+            for k in range(i, i + self.prefetch_depth + 1):
+                self._submit(k)
+            images, labels = self._pending.pop(i).result()
+
+            if self.rescale is not None:
+                images = images.astype(np.float32) * self.rescale
+
+            return images, self.dataset.class_indices(labels)
+
+        def close(self):
+            """Cancel the prefetched batches, the threads are shared with the other sequences."""
+            for future in self._pending.values():
+                future.cancel()
+            self._pending.clear()
+
+        def __del__(self):
+            self.close()
+
+        def on_epoch_end(self):
+            self.close()
+
+            self.epoch += 1
+            self.order = self.dataset.epoch_order(self.epoch, shuffle=self.shuffle)
+
+    _SEQUENCE_CLASS = GeneratedSequence
+    return _SEQUENCE_CLASS
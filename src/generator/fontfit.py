@@ -0,0 +1,223 @@
+"""Font size fitting - bisection search with font cache and persistent fit table"""
+
+import collections
+import copy
+import json
+import os
+import sys
+import threading
+import typing
+
+from PIL import ImageFont
+
+from . import archives
+
+DEFAULT_CACHE_SIZE = 256
+DEFAULT_FIT_TEXT = 'H'
+MAX_FONT_SIZE = 4096
+
+
+class FontCache:
+    """LRU cache of loaded fonts keyed by (font path, size)."""
+
+    def __init__(self, maxsize=DEFAULT_CACHE_SIZE):
+        self.maxsize = maxsize
+        self.hits = 0
+        self.misses = 0
+
+        self._fonts = collections.OrderedDict()
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._fonts)
+
+    def get(self, path, size) -> ImageFont.FreeTypeFont:
+        """Return font of the given size, load it if it is not cached yet."""
+        key = (path, int(size))
+        with self._lock:
+            font = self._fonts.get(key)
+            if font is not None:
+                self._fonts.move_to_end(key)
+                self.hits += 1
+                return font
+
+        # load outside of the lock, FreeType might take a while for large fonts
+        font = archives.open_font(path, encoding='utf-8', size=int(size))
+
+        with self._lock:
+            self.misses += 1
+            self._fonts[key] = font
+            while len(self._fonts) > self.maxsize:
+                self._fonts.popitem(last=False)
+
+        return font
+
+    def clear(self):
+        """Drop all cached fonts."""
+        with self._lock:
+            self._fonts.clear()
+
+
+def fit_font_size(path, text, fit_size, eps=0, font_cache: FontCache = None, size_hint=None) -> int:
+    """Find the largest font size for which `text` fits into `fit_size` using bisection.
+
+    :param path: path to the font file
+    :param text: text to be fitted
+    :param fit_size: size of the box the text should fit into
+    :param eps: tolerance in pixels, search stops as soon as the text is within `eps` from the box
+    :param font_cache: FontCache used to load fonts (default creates a temporary one)
+    :param size_hint: initial guess of the font size (default `max(fit_size)`)
+
+    :returns: font size
+    """
+    font_cache = FontCache(maxsize=8) if font_cache is None else font_cache
+    target = max(fit_size)
+
+    def err(size):
+        return target - max(font_cache.get(path, size).getsize(text))
+
+    # find bracket [lo, hi] such that text at `lo` fits and at `hi` does not
+    size = max(1, int(size_hint or target))
+    _err = err(size)
+    if 0 <= _err <= eps:
+        return size
+
+    if _err > 0:
+        lo, hi = size, size * 2
+        while hi < MAX_FONT_SIZE and err(hi) >= 0:
+            lo, hi = hi, hi * 2
+        hi = min(hi, MAX_FONT_SIZE)
+    else:
+        lo, hi = size // 2, size
+        while lo > 1 and err(lo) < 0:
+            lo, hi = lo // 2, lo
+        lo = max(lo, 1)
+
+    while hi - lo > 1:
+        mid = (lo + hi) // 2
+        _err = err(mid)
+        if _err < 0:
+            hi = mid
+        elif _err <= eps:
+            return mid
+        else:
+            lo = mid
+
+    return lo
+
+
+class FontSizeEstimator:
+    """Estimate font sizes fitting given sample size.
+
+    Fitted sizes are kept per (font, sample_size) and can be persisted to disk,
+    so that the subsequent runs do not have to search for them again.
+    """
+
+    def __init__(self, cache_path: str = None, font_cache: FontCache = None, fit_text=DEFAULT_FIT_TEXT):
+        """Initialize estimator.
+
+        :param cache_path: path to a JSON file the fitted sizes are loaded from and saved to (default None,
+        sizes are kept in memory only)
+        :param font_cache: FontCache to load fonts with (default creates a new one)
+        :param fit_text: reference text the size is fitted for - assume that what works for it,
+        works for everything else (default 'H')
+        """
+        self.cache_path = cache_path
+        self.fonts = FontCache() if font_cache is None else font_cache
+        self.fit_text = fit_text
+
+        self._sizes = dict()
+        self._dirty = False
+        self._lock = threading.Lock()
+
+        if cache_path and os.path.isfile(cache_path):
+            self.load(cache_path)
+
+    @staticmethod
+    def _size_key(sample_size, text):
+        return "{}x{}:{}".format(sample_size[0], sample_size[1], text)
+
+    @staticmethod
+    def _font_mtime(path):
+        try:
+            return archives.getmtime(path)
+        except (OSError, TypeError):
+            return None
+
+    def load(self, path):
+        """Load fitted sizes from JSON file."""
+        try:
+            with open(path) as f:
+                self._sizes = json.load(f)
+        except (OSError, ValueError) as e:
+            print("Ignoring invalid font size cache: '%s'" % path, e.args, file=sys.stderr)
+            self._sizes = dict()
+
+    def save(self, path=None):
+        """Save fitted sizes into JSON file (only if there is anything new to save)."""
+        path = path or self.cache_path
+        if path is None or not self._dirty:
+            return
+
+        with self._lock:
+            tmp_path = "{}.{}.tmp".format(path, os.getpid())
+            with open(tmp_path, 'w') as f:
+                json.dump(self._sizes, f, indent=1, sort_keys=True)
+            os.replace(tmp_path, path)
+
+            self._dirty = False
+
+    def export(self, paths: typing.Iterable = None) -> dict:
+        """Export fitted sizes of fonts at `paths` (default all fonts)."""
+        with self._lock:
+            if paths is None:
+                paths = list(self._sizes)
+
+            return {
+                str(path): copy.deepcopy(self._sizes[str(path)])
+                for path in paths if str(path) in self._sizes
+            }
+
+    def merge(self, sizes: dict):
+        """Merge fitted sizes exported by another estimator."""
+        with self._lock:
+            for path, entry in sizes.items():
+                current = self._sizes.get(path)
+                if current is None or current.get('mtime') != entry.get('mtime'):
+                    self._sizes[path] = copy.deepcopy(entry)
+                else:
+                    current['sizes'].update(entry['sizes'])
+
+                self._dirty = True
+
+    def estimate(self, path, sample_size=(32, 32), text=None, eps=None) -> int:
+        """Return font size for the font at `path` fitting the `sample_size`.
+
+        :param path: path to the font file
+        :param sample_size: size of the sample the text should fit into
+        :param text: text to be fitted (default `fit_text`)
+        :param eps: tolerance in pixels (default 10% of the sample size)
+        """
+        text = text or self.fit_text
+        eps = max(sample_size) // 10 if eps is None else eps
+        key = self._size_key(sample_size, text)
+        mtime = self._font_mtime(path)
+
+        entry = self._sizes.get(str(path))
+        if entry is not None and entry.get('mtime') == mtime and key in entry['sizes']:
+            return entry['sizes'][key]
+
+        size = fit_font_size(path, text, fit_size=sample_size, eps=eps, font_cache=self.fonts)
+
+        with self._lock:
+            entry = self._sizes.get(str(path))
+            if entry is None or entry.get('mtime') != mtime:
+                entry = self._sizes[str(path)] = {'mtime': mtime, 'sizes': dict()}
+            entry['sizes'][key] = size
+            self._dirty = True
+
+        return size
+
+    def get_font(self, path, sample_size=(32, 32), text=None) -> ImageFont.FreeTypeFont:
+        """Return font loaded in the size fitting the `sample_size`."""
+        return self.fonts.get(path, self.estimate(path, sample_size=sample_size, text=text))
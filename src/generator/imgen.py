@@ -1,21 +1,58 @@
 """Generate character images for different fonts and stores them"""
 
+import collections
+import concurrent.futures
+import itertools
 import os
-import re
+import random
 import sys
+import threading
+import time
 
 import numpy as np
 import typing
 
+from . import archives
+from . import sinks
 from . import utils
+from .atlas import DEFAULT_ATLAS_SIZE, CompiledCharset, GlyphAtlas, check_mode, compose_glyph, compose_mode, to_mode
+from .catalog import CATALOG_FILE, FontCatalog, LazyFontDict, coverage_matrix, font_path
+from .fontfit import FontSizeEstimator
+from .manifest import Manifest, params_hash
+from .pipeline import DEFAULT_QUEUE_SIZE, Pipeline, Stage
+from .profiling import Profiler
+from .split import SPLIT_FILE, SplitTable
+from .transforms import AUGMENTATION_PARAMS, AffineAugmenter
 
-from tensorflow import keras
-from PIL import Image, ImageFont, ImageDraw
+from PIL import Image, ImageColor, ImageFont
 
 DEFAULT_OUT_DIR = 'dataset'
 DEFAULT_FONT_NAME = 'default'
 DEFAULT_FONT_PATH = 'fonts/default.ttf'
 DEFAULT_FONT_SIZE = 20
+DEFAULT_AUGMENTATION = dict(
+    shear_range=0.2,
+    zoom_range=0.2,
+    rotation_range=15,
+)
+SPRITES_DIR = 'sprites'
+SPRITE_ATLAS_FILE = 'atlas.npy'
+SPRITE_ATLAS_INDEX = 'atlas.json'
+SPRITE_BOARD_COLOR = '#f4f4f4'
+# sprite boards are single band
+SPRITE_MODES = ('L', '1')
+# number of threads of the generation pipeline stages, see `save_font_charsets`
+DEFAULT_STAGE_WORKERS = dict(
+    render=1,
+    augment=1,
+    encode=2,
+)
+
+# number of fonts the charset metrics are cached for, see `CharImageGenerator.compile_charset`
+COMPILED_CHARSETS = 256
+
+# Generator of the worker process, see `_init_worker`
+_worker_generator = None
 
 
 class CharImageGenerator:
@@ -24,9 +61,22 @@ class CharImageGenerator:
     directory structure.
     """
 
-    def __init__(self, out_dir: str = None, font_dct: dict = None, charset: typing.Iterable = None):
-        """Initialize class."""
+    def __init__(self, out_dir: str = None, font_dct: dict = None, charset: typing.Iterable = None,
+                 font_size_cache: str = None, atlas_size=DEFAULT_ATLAS_SIZE, check_coverage=True, profile=False,
+                 seed: int = None):
+        """Initialize class.
+
+        :param font_size_cache: path to a JSON file used to persist fitted font sizes between runs (default None)
+        :param atlas_size: memory budget of the glyph atlas in bytes
+        :param check_coverage: whether to skip characters the font has no glyph for (default True),
+        otherwise the `.notdef` glyph is rendered for them
+        :param profile: whether to record time spent in each stage and font into `profiler` (default False)
+        :param seed: base seed of the generated samples (default None, random), every (font, char, sample)
+        gets its own random stream derived from it, see `sample_seed`
+        """
         self.out_dir = out_dir or DEFAULT_OUT_DIR
+        self.font_sizer = FontSizeEstimator(cache_path=font_size_cache)
+        self.atlas = GlyphAtlas(max_bytes=atlas_size)
         # Initialize default font if no fonts provided
         self.font_dct = font_dct or {
             DEFAULT_FONT_NAME: ImageFont.truetype(font=DEFAULT_FONT_PATH,
@@ -39,24 +89,89 @@ class CharImageGenerator:
         self.charset = charset
         self.charset_size = 0 if charset is None else len(charset)
 
+        self.check_coverage = check_coverage
+        self._coverage = dict()
+        self._compiled = collections.OrderedDict()
+        self._compiled_lock = threading.Lock()
+
+        # throughput of the pipeline stages of the last `create_and_save_charsets` run
+        self.stage_stats = list()
+        self.profiler = Profiler(enabled=profile)
+        self.seed = seed
+
     @classmethod
-    def load(cls, charset_path, fonts_path, out_dir=None):
-        """Loads characters and fonts and initializes CharImageGenerator class."""
+    def load(cls, charset_path, fonts_path, out_dir=None, font_size_cache=None, font_catalog=None, profile=False,
+             seed: int = None, workers: int = None):
+        """Loads characters and fonts and initializes CharImageGenerator class.
+
+        :param font_catalog: path to the font catalog (default `<fonts_path>/font-catalog.json`)
+        :param workers: number of worker processes to read the new font files and archives with
+        :param profile: whether to profile the generator, see `CharImageGenerator.__init__`
+        :param seed: base seed of the generated samples, see `CharImageGenerator.__init__`
+        """
 
         charset = cls.load_char_set(path=charset_path)
-        font_dct = cls.load_font_set(path=fonts_path)
+        font_dct = cls.load_font_set(path=fonts_path, catalog_path=font_catalog, workers=workers)
 
-        return cls(out_dir=out_dir, font_dct=font_dct, charset=charset)
+        return cls(out_dir=out_dir, font_dct=font_dct, charset=charset, font_size_cache=font_size_cache,
+                   profile=profile, seed=seed)
 
     def load_charset_from_array(self, charset: typing.Iterable):
         """Loads the charset into the generator."""
         assert type(charset, typing.Iterable)
 
         self.charset = charset
+        self._coverage = dict()
+        self._compiled.clear()
 
     def load_fonts_from_dct(self, font_dct: dict):
         """Loads the fontset into the generator."""
         self.font_dct = font_dct
+        self._coverage = dict()
+
+    def select_fonts(self, font_names: typing.Iterable):
+        """Restrict the fontset of the generator to the given fonts, e.g. to the fonts of a shard."""
+        subset = getattr(self.font_dct, 'subset', None)
+        if subset is not None:
+            self.load_fonts_from_dct(subset(font_names))
+        else:
+            self.load_fonts_from_dct({font_name: self.font_dct[font_name] for font_name in font_names})
+
+    def coverage(self, font_names: typing.Iterable = None) -> np.ndarray:
+        """Return font x char coverage matrix of the given fonts (default all fonts) and the charset.
+
+        Rows are computed once per font and cached, all characters are covered if `check_coverage` is False.
+
+        :returns: bool array of shape (len(font_names), charset_size)
+        """
+        assert self.charset is not None, "Character set has not been provided."
+
+        font_names = list(self.font_dct) if font_names is None else list(font_names)
+        missing = [font_name for font_name in font_names if font_name not in self._coverage]
+        if missing:
+            if self.check_coverage:
+                rows = coverage_matrix([font_path(self.font_dct, font_name) for font_name in missing], self.charset,
+                                       catalog=getattr(self.font_dct, 'catalog', None))
+            else:
+                rows = np.ones((len(missing), self.charset_size), dtype=bool)
+
+            self._coverage.update(zip(missing, rows))
+
+        if not font_names:
+            return np.empty((0, self.charset_size), dtype=bool)
+
+        return np.stack([self._coverage[font_name] for font_name in font_names])
+
+    def _base_seed(self, seed: int = None) -> typing.Optional[int]:
+        """Return the given seed, or the generator's seed if None."""
+        return self.seed if seed is None else seed
+
+    def sample_seed(self, font_name: str, char: chr, index: int, seed: int = None) -> int:
+        """Seed of the `index`th sample of the character, the sample depends only on this seed.
+
+        :param seed: base seed (default the generator's seed)
+        """
+        return utils.derive_seed(self._base_seed(seed), font_name, char, index)
 
     @staticmethod
     def load_char_set(path) -> list:
@@ -68,20 +183,29 @@ class CharImageGenerator:
         return chars
 
     @staticmethod
-    def load_font_set(path) -> dict:
-        """Walk through the default font directory and search for font files."""
-        font_dct = dict()
-        for root, _, files in os.walk(path):
-            for file in files:
-                if re.match(r'(.+)\.[odtfOTF]{3}', file):
-                    font_name = utils.get_file_name(file)
-                    try:
-                        font_dct[font_name] = ImageFont.truetype(os.path.join(root, file))
-                    except OSError:
-                        print("Invalid font: '%s'" % os.path.join(root, file), file=sys.stderr)
-                        continue
-
-        return font_dct
+    def load_font_set(path, catalog_path=None, workers: int = None) -> dict:
+        """Walk through the default font directory and search for font files.
+
+        Font metadata is kept in the font catalog, only new and changed font files are read and
+        fonts are opened once they are used. Fonts in zip archives are read from the archives directly,
+        fonts with identical content (e.g. the same font repackaged in several archives) are loaded once.
+
+        :param catalog_path: path to the font catalog (default `<path>/font-catalog.json`)
+        :param workers: number of worker processes to read the new font files and archives with
+        """
+        catalog = FontCatalog(catalog_path or os.path.join(path, CATALOG_FILE))
+        catalog.update(path, workers=workers)
+        try:
+            catalog.save()
+        except OSError as e:
+            print("Failed to save font catalog: '%s'" % catalog.path, e.args, file=sys.stderr)
+
+        duplicates = catalog.duplicates()
+        if duplicates:
+            print("Skipping {} duplicate font files".format(sum(len(paths) - 1 for paths in duplicates.values())),
+                  file=sys.stderr)
+
+        return catalog.font_dict(unique=True)
 
     def create_charset_dir(self,
                            charset: list = None,
@@ -129,59 +253,145 @@ class CharImageGenerator:
 
         return dir_paths
 
-    def create_char_image(self, char: chr, font_name: str, sample_size=(32, 32), bgcolor='#f6f6f6', fontcolor='black'):
-        """Generate image of given size and font for each character."""
+    def create_char_image(self, char: chr, font_name: str, sample_size=(32, 32), bgcolor='#f6f6f6', fontcolor='black',
+                          mode='RGB'):
+        """Generate image of given size and font for each character.
 
-        font = self.font_dct[font_name]
+        :param mode: image mode, one of 'RGB' (default), 'L' (grayscale) or '1' (bilevel)
+        """
 
-        try:
-            font_size = utils.estimate_font_size(
-                font=font,
-                text=char,  # for sake of performance, assume that what works
-                # for H, works for everything else
-                fit_size=(32, 32),
-                eps=max(sample_size) // 10
-            )
-            # Sadly, setting font.size is not sufficient and it is necessary create a new font
-            if font_size != font.size:
-                # replace it in the dict to be estimated in the future faster
-                font = ImageFont.truetype(font=font.path, size=font_size)
-                self.font_dct[font_name] = font
+        font = self._get_font(font_name, sample_size)
 
+        # The clean glyph is rasterized only once, samples differ only in its position
+        with self.profiler.timer('render', font_name):
+            return self.atlas.render(font, char, sample_size=sample_size, bgcolor=bgcolor, fontcolor=fontcolor,
+                                     mode=mode)
+
+    def compile_charset(self, font_name: str, font: ImageFont.FreeTypeFont, sample_size=(32, 32)) -> CompiledCharset:
+        """Return metrics of the charset in the font of the size fitted to the sample size.
+
+        Metrics are cached by the path of the font file and its size for the `COMPILED_CHARSETS` most recently
+        used fonts.
+        """
+        key = (font_path(self.font_dct, font_name), font.size, tuple(sample_size))
+        with self._compiled_lock:
+            compiled = self._compiled.get(key)
+            if compiled is not None:
+                self._compiled.move_to_end(key)
+                return compiled
+            index = next(iter(self._compiled.values())).index if self._compiled else None
+
+        compiled = CompiledCharset(font, self.charset, sample_size=sample_size, index=index)
+
+        with self._compiled_lock:
+            self._compiled[key] = compiled
+            while len(self._compiled) > COMPILED_CHARSETS:
+                self._compiled.popitem(last=False)
+
+        return compiled
+
+    def _get_font(self, font_name: str, sample_size) -> ImageFont.FreeTypeFont:
+        """Return font of the size fitted to the sample size, raise OSError if the font can not be loaded."""
+        try:
+            # Fitted size is shared by all characters of the font, fonts of that size are cached
+            with self.profiler.timer('font_size', font_name, items=0):
+                return self.font_sizer.get_font(font_path(self.font_dct, font_name), sample_size=sample_size)
         except OSError as e:
             print("Skipping", font_name, e.args, file=sys.stderr)
             raise OSError from e
 
-        char_bg = Image.new(mode='RGB', color=bgcolor, size=sample_size)
-        draw = ImageDraw.Draw(char_bg)
+    def render_batch(self, font_names: typing.Iterable = None, sample_size=(32, 32), grayscale=False,
+                     bgcolor='#f6f6f6', fontcolor='black', offset='random', seed: int = None,
+                     mode: str = None) -> tuple:
+        """Rasterize the whole charset for each font into a single preallocated array.
 
-        char_loc = utils.get_text_loc_in_sample(text=char, font=font, sample_size=sample_size)
-        draw.text(
-            xy=char_loc,
-            text=char,
-            font=font,
-            fill=fontcolor
-        )
+        Glyphs from the atlas are composed into the array directly, no per-image PIL objects are created.
+
+        :param font_names: names of the fonts to render (default all fonts in the font set)
+        :param grayscale: whether to render single channel images (default False), same as `mode='L'`
+        :param offset: offset of the characters in the sample, 'random' adds a little bit of entropy
+        :param seed: base seed of the random offsets (default the generator's seed), characters are then
+        positioned as the first samples of `create_and_save_charsets`
+        :param mode: one of 'RGB', 'L' or '1' (default 'L' if `grayscale` else 'RGB')
+
+        :returns: tuple (images, labels, font_indices), images is `uint8` array of shape (N, H, W, 3) for 'RGB',
+        (N, H, W) for 'L' and bool array of shape (N, H, W) for '1', labels are char ordinals and font_indices
+        are indices into the font set
+        """
+        assert self.charset is not None, "Character set has not been provided."
+
+        font_indices_of = {font_name: i for i, font_name in enumerate(self.font_dct)}
+        font_names = list(self.font_dct) if font_names is None else list(font_names)
+
+        out_mode = mode or ('L' if grayscale else 'RGB')
+        check_mode(out_mode)
+        mode = compose_mode(out_mode)
+        width, height = sample_size
+        shape = (len(font_names) * self.charset_size, height, width) + (() if mode == 'L' else (3,))
 
-        return char_bg
+        images = np.empty(shape, dtype=np.uint8)
+        labels = np.empty(shape[0], dtype=np.int32)
+        font_indices = np.empty(shape[0], dtype=np.int32)
+
+        seed = self._base_seed(seed)
+
+        k = 0
+        for font_name in font_names:
+            try:
+                font = self._get_font(font_name, sample_size)
+            except OSError:
+                continue
+
+            font_start = k
+            font_index = font_indices_of[font_name]
+            start = time.perf_counter()
+            try:
+                compiled = self.compile_charset(font_name, font, sample_size=sample_size)
+                chars = np.flatnonzero(self.coverage([font_name])[0])
+                seeds = None
+                if seed is not None:
+                    seeds = [self.sample_seed(font_name, self.charset[i], 0, seed=seed) for i in chars]
+                char_locs = compiled.locations(chars, seeds=seeds, offset=offset)
+
+                for i, char_loc in zip(chars, char_locs):
+                    glyph = self.atlas.get(font, self.charset[i], sample_size=sample_size)
+                    compose_glyph(images[k], glyph, char_loc, bgcolor=bgcolor, fontcolor=fontcolor, mode=mode)
+                    labels[k] = ord(self.charset[i])
+                    k += 1
+
+                font_indices[font_start:k] = font_index
+            except OSError as e:  # Skip the font completely
+                print("Skipping", font_name, e.args, file=sys.stderr)
+                self.profiler.failure(font_name, e, stage='render')
+                k = font_start
+
+            self.profiler.add('render', time.perf_counter() - start, items=k - font_start, font_name=font_name)
+
+        return to_mode(images[:k], out_mode), labels[:k], font_indices[:k]
 
     def generate_char_images(self, sample_size=(32, 32), bgcolor='#f6f6f6', fontcolor='black',
-                             augment=False, n_samples=1, **kwargs) -> tuple:
+                             augment=False, n_samples=1, font_names: typing.Iterable = None, seed: int = None,
+                             mode='RGB', **kwargs) -> tuple:
         """Generate character images for each character in the charset using given font.
 
         :param augment: whether to apply random transformations to the generated images (default False)
         :param n_samples: number of samples to produce per character, every `n`th image will be augmented (default 1),
         this parameter is ignored if `augment` is False
+        :param font_names: names of the fonts to generate the images for (default all fonts in the font set)
+        :param seed: base seed of the samples (default the generator's seed), the samples are then the same
+        as those of `create_and_save_charsets` with the default augmentation and the same seed
+        :param mode: mode of the images, one of 'RGB' (default), 'L' (grayscale) or '1' (bilevel)
+        :param kwargs: augmentation parameters of Keras ImageDataGenerator listed in `AUGMENTATION_PARAMS`
 
         :returns: generator object, tuples of type (char, font_name, char_img)
         """
-        image_generator = keras.preprocessing.image.ImageDataGenerator(
-            rescale=1. / 255,
-            shear_range=0.2,
-            zoom_range=0.2,
-            rotation_range=15,
-            **kwargs
-        )
+        unsupported = sorted(set(kwargs) - set(AUGMENTATION_PARAMS))
+        if unsupported:
+            raise ValueError("Unsupported augmentation parameters %s, expected any of %s"
+                             % (unsupported, list(AUGMENTATION_PARAMS)))
+
+        augmenter = AffineAugmenter(**dict(DEFAULT_AUGMENTATION, **kwargs))
+        check_mode(mode)
 
         assert self.charset is not None, "Character set has not been provided."
 
@@ -189,23 +399,100 @@ class CharImageGenerator:
             # Ignore the n_samples arguments - makes no sense to produce n same samples
             n_samples = 1
 
-        for font_name, font in self.font_dct.items():
-            for char in self.charset:
-                for i in range(n_samples):
-                    try:
-                        char_img = self.create_char_image(char, font_name, sample_size, bgcolor, fontcolor)
-                    except OSError:  # Skip the font completely
-                        break
+        seed = self._base_seed(seed)
+        for font_name in font_names or list(self.font_dct):
+            # characters the font has no glyph for would render as `.notdef` boxes
+            for char in itertools.compress(self.charset, self.coverage([font_name])[0]):
+                seeds = None
+                if seed is not None:
+                    seeds = [self.sample_seed(font_name, char, i, seed=seed) for i in range(n_samples)]
+                try:
+                    samples = self._generate_char_samples(char, font_name, n_samples, augment, augmenter,
+                                                          seeds=seeds, sample_size=sample_size, bgcolor=bgcolor,
+                                                          fontcolor=fontcolor, mode=mode)
+                except OSError:  # Skip the font completely
+                    continue
+
+                for sample in samples:
+                    yield char, font_name, Image.fromarray(sample)
+
+    def _generate_char_samples(self, char, font_name, n_samples, augment, augmenter: AffineAugmenter,
+                               seeds: list = None, mode='RGB', **render_kwargs) -> np.ndarray:
+        """Render and augment `n_samples` of the character.
+
+        If more than 1 sample is requested, the first sample is not augmented. Bilevel samples are
+        augmented in grayscale and thresholded at last.
+        """
+        samples = self.render_char_samples(char, font_name, n_samples, seeds=seeds, mode=compose_mode(mode),
+                                           **render_kwargs)
+
+        first = 1 if n_samples > 1 else 0
+        if augment:
+            with self.profiler.timer('augment', font_name, items=n_samples - first):
+                samples[first:] = augmenter.transform_batch(samples[first:],
+                                                            seeds=None if seeds is None else seeds[first:])
+
+        return to_mode(samples, mode)
 
-                    # if more than 1 sample is specified, the first sample will be skipped
-                    if n_samples > 1 and not i:
-                        yield char, font_name, char_img
-                        continue
+    def generate_sample(self, font_name: str, char: chr, index: int, n_samples=5, augment=True, sample_size=(32, 32),
+                        bgcolor='#f6f6f6', fontcolor='black', seed: int = None, mode='RGB') -> np.ndarray:
+        """Regenerate the `index`th sample of the character written by `create_and_save_charsets`.
 
-                    if augment:
-                        char_img = Image.fromarray(image_generator.random_transform(np.array(char_img)))
+        With the same parameters and seed the sample is bit-identical to the one in the dataset,
+        so that any sample can be regenerated on demand instead of being stored.
 
-                    yield char, font_name, char_img
+        :param seed: base seed of the dataset (default the generator's seed)
+        :param mode: mode of the dataset, one of 'RGB' (default), 'L' or '1'
+
+        :returns: uint8 array of shape (H, W, 3) for 'RGB', (H, W) for 'L' and bool array of shape (H, W) for '1'
+        """
+        seed = self._base_seed(seed)
+        if seed is None:
+            raise ValueError("Sample can not be regenerated without a seed")
+
+        if n_samples and not augment:
+            n_samples = 1
+        if not 0 <= index < n_samples:
+            raise ValueError("Sample index %d out of range of %d samples" % (index, n_samples))
+
+        seeds = [self.sample_seed(font_name, char, index, seed=seed)]
+        sample = self.render_char_samples(char, font_name, 1, sample_size=sample_size, bgcolor=bgcolor,
+                                          fontcolor=fontcolor, mode=compose_mode(mode), seeds=seeds)
+        # If more than 1 sample is generated, the first sample is not augmented
+        if augment and index >= (1 if n_samples > 1 else 0):
+            sample = AffineAugmenter(**DEFAULT_AUGMENTATION).transform_batch(sample, seeds=seeds)
+
+        return to_mode(sample[0], mode)
+
+    def render_char_samples(self, char: chr, font_name: str, n_samples=1, sample_size=(32, 32),
+                            bgcolor='#f6f6f6', fontcolor='black', mode='RGB', seeds: list = None) -> np.ndarray:
+        """Render `n_samples` of the character, each randomly positioned in the sample.
+
+        :param mode: one of 'RGB' (default), 'L' or '1'
+        :param seeds: seed of each sample, the random position of a sample then depends only on its seed
+
+        :returns: uint8 array of shape (n_samples, H, W, 3) for 'RGB', (n_samples, H, W) for 'L'
+        and bool array of shape (n_samples, H, W) for '1'
+        """
+        check_mode(mode)
+        out_mode, mode = mode, compose_mode(mode)
+        font = self._get_font(font_name, sample_size)
+
+        with self.profiler.timer('render', font_name, items=n_samples):
+            glyph = self.atlas.get(font, char, sample_size=sample_size)
+            compiled = self.compile_charset(font_name, font, sample_size=sample_size)
+            if char not in compiled.index:
+                compiled = CompiledCharset(font, [char], sample_size=sample_size)
+            char_locs = compiled.locations(np.full(n_samples, compiled.index[char]), seeds=seeds)
+
+            channels = Image.getmodebands(mode)
+            shape = (n_samples, sample_size[1], sample_size[0]) + ((channels,) if channels > 1 else ())
+            samples = np.empty(shape, dtype=np.uint8)
+
+            for sample, char_loc in zip(samples, char_locs):
+                compose_glyph(sample, glyph, char_loc, bgcolor=bgcolor, fontcolor=fontcolor, mode=mode)
+
+        return to_mode(samples, out_mode)
 
     def create_and_save_charsets(self,
                                  test_train_split=True,
@@ -213,93 +500,552 @@ class CharImageGenerator:
                                  sample_size=(32, 32),
                                  bgcolor='#f6f6f6',
                                  fontcolor='black',
+                                 workers: int = None,
+                                 sink: sinks.Sink = None,
+                                 manifest_path: str = None,
+                                 seed: int = None,
+                                 stage_workers: dict = None,
+                                 queue_size=DEFAULT_QUEUE_SIZE,
+                                 mode='RGB',
+                                 holdout_ratio=0.,
+                                 split_path: str = None,
                                  **kwargs):
         """Create char images from charset for each font in font set.
-        Saves it into predefined directory structure.
+        Saves it into predefined directory structure, or into the given `sink`.
+
+        :param workers: number of worker processes to shard the fonts across (default None, runs in this process)
+        :param sink: sink to write the samples into (default writes PNG files into Keras-like directory structure)
+        :param manifest_path: path to the manifest of generated samples (default None, no manifest is kept),
+        samples already recorded in the manifest for the same font file and parameters are not generated again
+        :param seed: base seed the seeds of the samples are derived from (default the generator's seed,
+        random if None), the samples do not depend on the number of workers or the order of the fonts
+        :param stage_workers: number of threads of the 'render', 'augment' and 'encode' stages of the pipeline
+        (default `DEFAULT_STAGE_WORKERS`), see `save_font_charsets`
+        :param queue_size: capacity of the queues in between the pipeline stages
+        :param mode: mode of the images, one of 'RGB' (default), 'L' (8-bit grayscale) or '1' (bilevel),
+        single band images are kept single band from rendering to the output
+        :param holdout_ratio: fraction of the fonts all samples of which go into the test set (default 0),
+        see `split.SplitTable.create`
+        :param split_path: path to the train/test split table (default `<out_dir>/split.npz`), the table
+        saved by a previous run is extended for the new fonts
         """
 
         assert self.charset is not None, "Character set has not been provided."
+        check_mode(mode)
+
+        if sink is None:
+            charset_dirs = self.create_charset_dir(charset=self.charset,
+                                                   test_train_split=test_train_split,
+                                                   create_parent_dir=True)
+            sink = sinks.DirectorySink(charset_dirs)
+
+        save_kwargs = dict(
+            test_train_split=test_train_split,
+            split_ratio=split_ratio,
+            sample_size=sample_size,
+            bgcolor=bgcolor,
+            fontcolor=fontcolor,
+            augment=kwargs.get('augment', True),
+            n_samples=kwargs.get('n_samples', 5),
+            seed=random.getrandbits(32) if self._base_seed(seed) is None else self._base_seed(seed),
+            stage_workers=stage_workers,
+            queue_size=queue_size,
+            mode=mode,
+            holdout_ratio=holdout_ratio,
+        )
 
-        charset_dirs = self.create_charset_dir(charset=self.charset,
-                                               test_train_split=test_train_split,
-                                               create_parent_dir=True)
+        font_paths = {font_name: font_path(self.font_dct, font_name) for font_name in self.font_dct}
+        font_names = list(font_paths)
 
-        augment = kwargs.get('augment', True)
-        n_samples = kwargs.get('n_samples', 5)
+        if test_train_split:
+            n_samples = save_kwargs['n_samples'] if save_kwargs['augment'] else 1
+            save_kwargs['split_table'] = self._split_table(split_path or os.path.join(self.out_dir, SPLIT_FILE),
+                                                           font_names, n_samples, split_ratio=split_ratio,
+                                                           holdout_ratio=holdout_ratio, seed=save_kwargs['seed'])
+
+        manifest = None
+        if manifest_path is not None:
+            manifest = Manifest(manifest_path)
+            if manifest.fonts and not sink.resumable:
+                raise ValueError("Output of %s can not be resumed, remove the manifest '%s' to start over."
+                                 % (type(sink).__name__, manifest_path))
+
+            save_kwargs['params'] = self._manifest_params(**save_kwargs)
+            # hashes are known for the fonts from the catalog
+            font_hashes = getattr(self.font_dct, 'hashes', None) or dict()
+            save_kwargs['font_hashes'] = {
+                font_name: font_hashes.get(font_name) or archives.file_hash(path)
+                for font_name, path in font_paths.items()
+            }
+
+            # unsupported characters are never recorded
+            coverage = dict(zip(font_names, self.coverage(font_names)))
+            n_records = save_kwargs['n_samples'] if save_kwargs['augment'] else 1
+            font_names = [
+                font_name for font_name in font_names
+                if not manifest.is_font_done(font_name, save_kwargs['font_hashes'][font_name], save_kwargs['params'],
+                                             chars=itertools.compress(self.charset, coverage[font_name]),
+                                             n_samples=n_records)
+            ]
+            # only fonts interrupted before they were done have samples to be skipped
+            manifest.load_records(font_name for font_name in font_names
+                                  if manifest.is_started(font_name, save_kwargs['font_hashes'][font_name],
+                                                         save_kwargs['params']))
+
+        if not workers or workers <= 1:
+            with sink:
+                self.stage_stats = list()
+                self.save_font_charsets(font_names, sink=sink, manifest=manifest, **save_kwargs)
+
+            self._finalize_charsets(sink, manifest)
+            return
 
-        index = 0
-        mod = 1 / split_ratio
-        for char, font_name, char_img in self.generate_char_images(augment=augment,
-                                                                   n_samples=n_samples,
-                                                                   sample_size=sample_size,
-                                                                   bgcolor=bgcolor,
-                                                                   fontcolor=fontcolor):
+        # tasks are groups of fonts filling roughly one shard, every task gets its own forked sink
+        # so that the output does not depend on the scheduling
+        fonts_per_task = 1
+        if sink.shard_size:
+            fonts_per_task = max(1, sink.shard_size // (self.charset_size * save_kwargs['n_samples']))
+
+        start = time.perf_counter()
+        with concurrent.futures.ProcessPoolExecutor(max_workers=workers, initializer=_init_worker,
+                                                    initargs=self._worker_init_args(font_names)) as executor:
+            futures = list()
+            for i in range(0, len(font_names), fonts_per_task):
+                task_fonts = font_names[i:i + fonts_per_task]
+                tag = "{:05d}".format(i // fonts_per_task)
+                task_kwargs = save_kwargs
+                if test_train_split:
+                    task_kwargs = dict(save_kwargs, split_table=save_kwargs['split_table'].select(task_fonts))
+                futures.append(executor.submit(
+                    _save_font_charset_worker,
+                    task_fonts,
+                    sink.fork(tag),
+                    None if manifest is None else manifest.fork(tag, font_names=task_fonts),
+                    task_kwargs
+                ))
+
+            self.stage_stats = list()
+            for future in concurrent.futures.as_completed(futures):
+                font_sizes, stage_stats, profiler = future.result()
+                self.font_sizer.merge(font_sizes)
+                self._merge_stage_stats(stage_stats)
+                self.profiler.merge(profiler)
+
+        # the stages of all processes ran concurrently, throughput is relative to the wall time of the run
+        elapsed = time.perf_counter() - start
+        for stats in self.stage_stats:
+            stats.elapsed = elapsed
+
+        self._finalize_charsets(sink, manifest)
+
+    def _split_table(self, path: str, font_names: list, n_samples: int, split_ratio=0.2, holdout_ratio=0.,
+                     seed=0) -> SplitTable:
+        """Load the split table saved with the dataset and extend it for the new fonts, or create a new one."""
+        table = None
+        if os.path.isfile(path):
+            try:
+                table = SplitTable.load(path)
+            except (OSError, ValueError, KeyError) as e:
+                print("Ignoring invalid split table: '%s'" % path, e.args, file=sys.stderr)
+
+            if table is not None and not table.compatible(self.charset, n_samples, split_ratio, holdout_ratio):
+                print("Split parameters have changed, the split table '%s' is created again" % path, file=sys.stderr)
+                table = None
+
+        if table is None:
+            table = SplitTable.create(font_names, self.charset, n_samples, split_ratio=split_ratio,
+                                      holdout_ratio=holdout_ratio, seed=seed, coverage=self.coverage(font_names))
+        else:
+            new = [font_name for font_name in font_names if font_name not in table]
+            if not new:
+                return table
+            table = table.extend(new, coverage=self.coverage(new))
 
-            if test_train_split:
-                path = charset_dirs[index % mod != 0]
-            else:
-                path, = charset_dirs
+        table.save(path)
+        return table
+
+    @staticmethod
+    def _manifest_params(test_train_split, split_ratio, sample_size, bgcolor, fontcolor, augment, n_samples,
+                         mode='RGB', holdout_ratio=0., **_) -> str:
+        """Hash of the parameters the samples depend on, except for the seed."""
+        # defaults are left out so that manifests of the runs preceding the parameters stay valid
+        extra = dict() if mode == 'RGB' else dict(mode=mode)
+        if holdout_ratio:
+            extra['holdout_ratio'] = holdout_ratio
+        return params_hash(test_train_split=test_train_split, split_ratio=split_ratio,
+                           sample_size=tuple(sample_size), bgcolor=bgcolor, fontcolor=fontcolor,
+                           augment=augment, n_samples=n_samples, **extra)
+
+    def _merge_stage_stats(self, stage_stats: list):
+        if not self.stage_stats:
+            self.stage_stats = stage_stats
+            return
+
+        for stats, other in zip(self.stage_stats, stage_stats):
+            stats.merge(other)
 
-            char_dir = ord(char)  # The directory structure expects char ordinal
-            img_name = font_name + "_{}.png".format(index)
-            img_path = os.path.join(path, str(char_dir), img_name)
+    def _finalize_charsets(self, sink: sinks.Sink, manifest: Manifest = None):
+        sink.finalize()
+        if manifest is not None:
+            manifest.compact()
+        self.font_sizer.save()
 
-            char_img.save(fp=img_path, format='png')
+    def save_font_charset(self, font_name, sink: sinks.Sink, **kwargs) -> int:
+        """Create char images from charset for the given font and write them into the `sink`.
 
-            index = (index + 1) % n_samples
+        See `save_font_charsets` for the parameters.
 
-    def create_sprites(self, sample_size=(32, 32)):
-        """Create sprites for each font provided in fontset and saves it as .png into IMG_DIR.
+        :returns: number of images written
+        """
+        return self.save_font_charsets([font_name], sink, **kwargs)
+
+    def save_font_charsets(self, font_names: list, sink: sinks.Sink, test_train_split=True, split_ratio=0.2,
+                           sample_size=(32, 32), bgcolor='#f6f6f6', fontcolor='black',
+                           augment=True, n_samples=5, seed=0,
+                           manifest: Manifest = None, font_hashes: dict = None, params: str = None,
+                           stage_workers: dict = None, queue_size=DEFAULT_QUEUE_SIZE, mode='RGB',
+                           holdout_ratio=0., split_table: SplitTable = None) -> int:
+        """Create char images from charset for the given fonts and write them into the `sink`.
+
+        Samples pass through the pipeline of render, augment, encode and write stages, each running in
+        its own threads, so that rendering and encoding overlap with writing the files. The write stage
+        runs in a single thread in the order the samples have been rendered.
+
+        Train/test assignment is looked up in the split table and every sample is generated with its own seed
+        derived from `seed`, so that the result does not depend on the order in which the fonts are processed.
+
+        :param manifest: manifest to record the samples into, samples already recorded are skipped
+        :param font_hashes: hashes of the font files (required with `manifest`)
+        :param params: hash of the generation parameters (required with `manifest`)
+        :param stage_workers: number of threads of the 'render', 'augment' and 'encode' stages
+        (default `DEFAULT_STAGE_WORKERS`)
+        :param queue_size: capacity of the queues in between the stages
+        :param mode: mode of the images, bilevel images are rendered and augmented in grayscale
+        and thresholded in the encode stage
+        :param split_table: train/test assignment of the samples of the fonts (default computed for the fonts
+        from `split_ratio` and `holdout_ratio`), see `split.SplitTable`
+
+        :returns: number of images written
+        """
+        augmenter = AffineAugmenter(**DEFAULT_AUGMENTATION)
+        stage_workers = dict(DEFAULT_STAGE_WORKERS, **(stage_workers or dict()))
+        profiler = self.profiler
+
+        if n_samples and not augment:
+            n_samples = 1
+
+        if test_train_split and split_table is None:
+            split_table = SplitTable.create(font_names, self.charset, n_samples, split_ratio=split_ratio,
+                                            holdout_ratio=holdout_ratio, seed=seed,
+                                            coverage=self.coverage(font_names))
+
+        first = 1 if n_samples > 1 else 0
+
+        # number of samples of each font left to be written, fonts are recorded as done in the manifest
+        # once all their samples have been written
+        remaining = dict()
+
+        def record_font(font_name):
+            manifest.record_font(font_name, font_hashes[font_name], params, n_samples=n_samples,
+                                 chars=itertools.compress(self.charset, self.coverage([font_name])[0]))
+
+        def tasks():
+            for font_name in font_names:
+                supported = self.coverage([font_name])[0]
+                if not supported.all():
+                    print("Skipping characters not covered by", font_name,
+                          "".join(itertools.compress(self.charset, ~supported)), file=sys.stderr)
+
+                font_tasks = list()
+                for char in itertools.compress(self.charset, supported):
+                    indices = range(n_samples)
+                    if manifest is not None:
+                        indices = [i for i in indices
+                                   if not manifest.is_done(font_name, font_hashes[font_name], char, i, params)]
+                        if not indices:
+                            continue
+                    font_tasks.append((char, indices))
+
+                if manifest is not None:
+                    remaining[font_name] = sum(len(indices) for _, indices in font_tasks)
+                    if not remaining[font_name]:
+                        record_font(font_name)
+
+                for char, indices in font_tasks:
+                    seeds = [self.sample_seed(font_name, char, i, seed=seed) for i in range(n_samples)]
+                    yield dict(font_name=font_name, char=char, indices=indices, seeds=seeds)
+
+        def render(task):
+            try:
+                task['samples'] = self.render_char_samples(task['char'], task['font_name'], n_samples,
+                                                           sample_size=sample_size, bgcolor=bgcolor,
+                                                           fontcolor=fontcolor, mode=compose_mode(mode),
+                                                           seeds=task['seeds'])
+            except OSError:  # Skip the font completely
+                return None
+
+            return task
+
+        def augment_samples(task):
+            # If more than 1 sample is requested, the first sample is not augmented
+            samples = task['samples']
+            with profiler.timer('augment', task['font_name'], items=n_samples - first):
+                samples[first:] = augmenter.transform_batch(samples[first:], seeds=task['seeds'][first:])
+            return task
+
+        def encode(task):
+            with profiler.timer('encode', task['font_name'], items=len(task['indices'])):
+                samples = to_mode(task['samples'], mode)
+                task['samples'] = [sink.encode(samples[index]) for index in task['indices']]
+            return task
+
+        count = 0
+
+        def write(task):
+            nonlocal count
+            font_name, char = task['font_name'], task['char']
+            with profiler.timer('write', font_name, items=len(task['indices'])):
+                for index, sample in zip(task['indices'], task['samples']):
+                    subset = split_table.subset(font_name, char, index) if test_train_split else None
+
+                    output = sink.write(char, font_name, index, sample, subset=subset)
+                    if manifest is not None:
+                        manifest.record(font_name, font_hashes[font_name], char, index, seed=task['seeds'][index],
+                                        output=output, params=params, split=subset)
+                        remaining[font_name] -= 1
+                        if not remaining[font_name]:
+                            record_font(font_name)
+
+                    count += 1
+
+            return task
+
+        def n_images(task):
+            return len(task['indices'])
+
+        # statistics are reported in images, a task holds all samples of a character
+        stages = [Stage('render', render, workers=stage_workers['render'], count=n_images)]
+        if augment:
+            stages.append(Stage('augment', augment_samples, workers=stage_workers['augment'], count=n_images))
+        stages.append(Stage('encode', encode, workers=stage_workers['encode'], count=n_images))
+        stages.append(Stage('write', write, ordered=True, count=n_images))
+
+        pipeline = Pipeline(stages, queue_size=queue_size)
+        pipeline.execute(tasks())
+        self._merge_stage_stats(pipeline.stats)
+
+        if manifest is not None:
+            manifest.flush()
+
+        return count
+
+    def create_sprites(self, sample_size=(32, 32), workers: int = None, atlas=False, seed: int = None, mode='L'):
+        """Create sprites for each font provided in fontset and saves it as .png into `<out_dir>/sprites`.
         Characters given by charset are drawn on a spritesheet.
+
+        Boards existing from a previous (interrupted) run are skipped, see `render_sprite_board`
+        for the layout of the boards.
+
+        :param workers: number of worker processes to distribute the fonts among (default None, runs in this process)
+        :param atlas: whether to write also combined atlas of all fonts into `<out_dir>/sprites/atlas.npy`,
+        memory-mappable uint8 array of shape (n_fonts, n_chars, H, W) listed in `atlas.json` (default False)
+        :param seed: base seed of the random offsets of the characters (default the generator's seed)
+        :param mode: mode of the boards, 'L' (default, 8-bit grayscale) or '1' (bilevel),
+        the atlas is always grayscale
         """
         assert self.charset is not None, "Character set has not been provided."
+        if mode not in SPRITE_MODES:
+            raise ValueError("Unsupported sprite board mode '%s', expected one of %s" % (mode, SPRITE_MODES))
 
         if not self.font_dct or not self.charset:
             print("`fontset` has not been initialized", file=sys.stderr)
             return
 
-        n_samples = utils.get_near_dim_2d(len(self.charset))
-        board_color = '#f4f4f4'
-        board = utils.create_whiteboard(n_samples=n_samples, sample_size=sample_size, fill=board_color)
+        sprites_dir = os.path.join(self.out_dir, SPRITES_DIR)
+        os.makedirs(sprites_dir, exist_ok=True)
 
-        sprites_dir = "{path}/sprites".format(path=self.out_dir)
-        # Make sure sprites directory exists
-        if os.path.isdir(sprites_dir) and os.listdir(sprites_dir):
-            raise FileExistsError("Directory '%s' already exists and is not empty." % sys.stderr)
+        font_names = list(self.font_dct)
+        atlas_path = None
+        if atlas:
+            atlas_path = os.path.join(sprites_dir, SPRITE_ATLAS_FILE)
+            self._create_sprite_atlas(atlas_path, font_names, sample_size)
+        else:
+            font_names = [font_name for font_name in font_names if not self._is_sprite_done(font_name)]
 
-        os.makedirs(sprites_dir, exist_ok=True)
+        if not workers or workers <= 1 or not font_names:
+            self.save_sprites(font_names, sample_size=sample_size, atlas_path=atlas_path, seed=seed, mode=mode)
+            self.font_sizer.save()
+            return
 
-        for font_name, font in self.font_dct.items():
-            board_name = "{path}/{ttf}-board.png".format(
-                path=sprites_dir,
-                ttf=font_name)
-            if os.path.isfile(board_name):
-                print('Skipping', board_name)
+        # several fonts per task, so that the tasks are not dominated by the inter-process communication
+        fonts_per_task = max(1, len(font_names) // (4 * workers))
+        with concurrent.futures.ProcessPoolExecutor(max_workers=workers, initializer=_init_worker,
+                                                    initargs=self._worker_init_args(font_names)) as executor:
+            futures = [
+                executor.submit(_save_sprites_worker, font_names[i:i + fonts_per_task], sample_size, atlas_path,
+                                self._base_seed(seed), mode)
+                for i in range(0, len(font_names), fonts_per_task)
+            ]
+            for future in concurrent.futures.as_completed(futures):
+                font_sizes, profiler = future.result()
+                self.font_sizer.merge(font_sizes)
+                self.profiler.merge(profiler)
+
+        self.font_sizer.save()
+
+    def _sprite_board_path(self, font_name: str) -> str:
+        return os.path.join(self.out_dir, SPRITES_DIR, "{}-board.png".format(font_name))
+
+    def _is_sprite_done(self, font_name: str) -> bool:
+        if os.path.isfile(self._sprite_board_path(font_name)):
+            print('Skipping', self._sprite_board_path(font_name))
+            return True
+
+        return False
+
+    def _create_sprite_atlas(self, atlas_path: str, font_names: list, sample_size):
+        """Allocate the combined atlas and write its index, rows are filled in by `save_sprites`."""
+        import json
+
+        shape = (len(font_names), self.charset_size, sample_size[1], sample_size[0])
+        np.lib.format.open_memmap(atlas_path, mode='w+', dtype=np.uint8, shape=shape).flush()
+
+        index_path = os.path.join(os.path.dirname(atlas_path), SPRITE_ATLAS_INDEX)
+        with open(index_path, 'w') as f:
+            json.dump(dict(fonts=font_names, charset=list(self.charset), sample_size=list(sample_size)), f)
+
+    def save_sprites(self, font_names: list, sample_size=(32, 32), atlas_path: str = None, seed: int = None,
+                     mode='L'):
+        """Compose and save sprite boards of the given fonts, boards existing already are not written again.
+
+        :param atlas_path: path to the combined atlas created by `create_sprites`, rows of the fonts
+        are written into it as well
+        :param seed: base seed of the random offsets of the characters (default the generator's seed)
+        :param mode: mode of the boards, 'L' or '1'
+        """
+        atlas = None
+        # rows of the fonts in the atlas
+        font_rows = {font_name: i for i, font_name in enumerate(self.font_dct)}
+        if atlas_path is not None:
+            atlas = np.load(atlas_path, mmap_mode='r+')
+
+        cols, rows = utils.get_near_dim_2d(self.charset_size)
+        width, height = sample_size
+        for font_name in font_names:
+            try:
+                board = self.render_sprite_board(font_name, sample_size=sample_size, seed=seed)
+            except OSError:  # Skip this font - probably generates raster overflow
+                if atlas is not None:
+                    atlas[font_rows[font_name]] = ImageColor.getcolor(SPRITE_BOARD_COLOR, 'L')
                 continue
 
-            print("Creating spritesheet", board_name, "...")
-            font_board = board.copy()
+            if atlas is not None:
+                cells = board.reshape(rows, height, cols, width).transpose(0, 2, 1, 3).reshape(-1, height, width)
+                atlas[font_rows[font_name]] = cells[:self.charset_size]
 
-            init_pos = (0, 0)
-            for char in self.charset:
-                try:
-                    char_img = self.create_char_image(char=char, font_name=font_name,
-                                                      sample_size=sample_size,
-                                                      bgcolor=board_color)
-                except OSError:
-                    # Skip this font - probably generates raster overflow
-                    break
-
-                # position of char on the board - by default move on the x axis only
-                font_board.paste(char_img, box=init_pos)
-
-                pos = (init_pos[0] + sample_size[0], init_pos[1])
-                if pos[0] % font_board.width:
-                    init_pos = pos
-                else:
-                    # Move to the row bellow
-                    init_pos = (0, init_pos[1] + sample_size[1])
-
-            # save the board
-            font_board.save(fp=board_name)
-            print('Written', board_name)
+            board_name = self._sprite_board_path(font_name)
+            if atlas is None or not os.path.isfile(board_name):
+                with self.profiler.timer('sprites', font_name, items=0):
+                    Image.fromarray(to_mode(board, mode)).save(fp=board_name)
+                print('Written', board_name)
+
+        if atlas is not None:
+            atlas.flush()
+
+    def render_sprite_board(self, font_name: str, sample_size=(32, 32), bgcolor=SPRITE_BOARD_COLOR,
+                            fontcolor='black', seed: int = None) -> np.ndarray:
+        """Compose sprite board of the charset for the font.
+
+        Characters fill the cells of the board row by row, cells of the characters the font has no glyph for
+        are left blank. Glyph tiles are composed into the preallocated board directly.
+
+        :param seed: base seed of the random offsets of the characters (default the generator's seed),
+        characters are then positioned as the first samples of `create_and_save_charsets`
+
+        :returns: uint8 array of shape (rows * H, cols * W)
+        :raises OSError: if the font can not be rendered
+        """
+        font = self._get_font(font_name, sample_size)
+
+        cols, rows = utils.get_near_dim_2d(self.charset_size)
+        width, height = sample_size
+        board = np.empty((rows, height, cols, width), dtype=np.uint8)
+        # cells[r, c] is a view of the cell in the row r and the column c of the board
+        cells = board.transpose(0, 2, 1, 3)
+
+        supported = np.zeros(rows * cols, dtype=bool)
+        supported[:self.charset_size] = self.coverage([font_name])[0]
+        blank = np.flatnonzero(~supported)
+        cells[blank // cols, blank % cols] = ImageColor.getcolor(bgcolor, 'L')
+
+        seed = self._base_seed(seed)
+        with self.profiler.timer('render', font_name, items=int(supported.sum())):
+            chars = np.flatnonzero(supported)
+            seeds = None
+            if seed is not None:
+                seeds = [self.sample_seed(font_name, self.charset[i], 0, seed=seed) for i in chars]
+            char_locs = self.compile_charset(font_name, font, sample_size=sample_size).locations(chars, seeds)
+
+            for i, char_loc in zip(chars, char_locs):
+                glyph = self.atlas.get(font, self.charset[i], sample_size=sample_size)
+                compose_glyph(cells[i // cols, i % cols], glyph, char_loc, bgcolor=bgcolor, fontcolor=fontcolor,
+                              mode='L')
+
+        return board.reshape(rows * height, cols * width)
+
+    def _worker_init_args(self, font_names: list) -> tuple:
+        """Arguments of `_init_worker`, workers get the coverage computed here so that they do not read the cmaps
+        again."""
+        font_paths = {font_name: font_path(self.font_dct, font_name) for font_name in self.font_dct}
+        return (self.out_dir, font_paths, self.charset, self.font_sizer.export(), self.check_coverage,
+                dict(zip(font_names, self.coverage(font_names))), self.profiler.enabled)
+
+
+def _init_worker(out_dir, font_paths: dict, charset, font_sizes: dict = None, check_coverage=True,
+                 coverage: dict = None, profile=False):
+    """Initialize generator in the worker process - fonts are loaded again from their paths.
+
+    :param coverage: coverage rows of the fonts computed by the parent process, cmaps are not read again
+    :param profile: whether to profile the generator, the profile is returned with each task
+    """
+    global _worker_generator
+
+    font_dct = LazyFontDict(font_paths, size=DEFAULT_FONT_SIZE)
+    _worker_generator = CharImageGenerator(out_dir=out_dir, font_dct=font_dct, charset=charset,
+                                           check_coverage=check_coverage, profile=profile)
+    _worker_generator.font_sizer.merge(font_sizes or dict())
+    _worker_generator._coverage.update(coverage or dict())
+
+
+def _save_font_charset_worker(font_names: list, sink: sinks.Sink, manifest: Manifest, save_kwargs: dict) -> tuple:
+    """Save charsets of the given fonts in the worker process.
+
+    :returns: tuple (font_sizes, stage_stats, profiler), fitted font sizes, throughput of the pipeline stages
+    and profile of the task to be merged by the parent process
+    """
+    _worker_generator.stage_stats = list()
+    _worker_generator.profiler = Profiler(enabled=_worker_generator.profiler.enabled)
+    with sink:
+        _worker_generator.save_font_charsets(font_names, sink=sink, manifest=manifest, **save_kwargs)
+
+    if manifest is not None:
+        manifest.close()
+
+    font_paths = [font_path(_worker_generator.font_dct, font_name) for font_name in font_names]
+    return (_worker_generator.font_sizer.export(paths=font_paths), _worker_generator.stage_stats,
+            _worker_generator.profiler)
+
+
+def _save_sprites_worker(font_names: list, sample_size, atlas_path: str = None, seed: int = None,
+                         mode='L') -> tuple:
+    """Save sprite boards of the given fonts in the worker process.
+
+    :returns: tuple (font_sizes, profiler), fitted font sizes and profile of the task to be merged
+    by the parent process
+    """
+    _worker_generator.profiler = Profiler(enabled=_worker_generator.profiler.enabled)
+    _worker_generator.save_sprites(font_names, sample_size=sample_size, atlas_path=atlas_path, seed=seed,
+                                   mode=mode)
+
+    font_paths = [font_path(_worker_generator.font_dct, font_name) for font_name in font_names]
+    return _worker_generator.font_sizer.export(paths=font_paths), _worker_generator.profiler
@@ -0,0 +1,265 @@
+"""Manifest of generated samples - makes dataset generation incremental and resumable.
+
+The manifest is an append-only JSON lines file, each line records one sample: the font and the hash
+of the font file, the character, the sample index, the seed the sample was generated with,
+the output locator and the hash of the generation parameters.
+
+Next to it, the font summary `<manifest name>.fonts.jsonl` has one line per font once its first sample
+has been recorded and another one once all its samples have been generated. A run reads only the summary,
+sample records are read only for the fonts of the run which have been started but not finished (e.g. by an
+interrupted run), so that adding fonts to a large dataset does not read all its records.
+
+Workers append to their own part files `<manifest>.<tag>` and `<summary>.<tag>`, which are appended
+to the manifest and the summary by `Manifest.compact`.
+"""
+
+import glob
+import json
+import os
+import threading
+import typing
+
+from . import utils
+
+MANIFEST_FILE = 'manifest.jsonl'
+SUMMARY_SUFFIX = '.fonts.jsonl'
+
+
+def params_hash(**params) -> str:
+    """Return short hash of the generation parameters."""
+    return '{:08x}'.format(utils.derive_seed(*sorted(params.items())))
+
+
+def charset_hash(chars: typing.Iterable, n_samples) -> str:
+    """Return short hash of the characters of a font and the number of their samples, independent of the order."""
+    return params_hash(chars=''.join(sorted(chars)), n_samples=n_samples)
+
+
+def summary_path(path: str) -> str:
+    """Return path to the font summary of the manifest at `path`."""
+    return os.path.splitext(path)[0] + SUMMARY_SUFFIX
+
+
+def _part_paths(path: str, exclude: str = None) -> list:
+    """Return paths to the file and its part files which exist.
+
+    :param exclude: prefix of the paths to leave out, e.g. of the summary of a manifest without a suffix
+    """
+    return [part_path for part_path in [path] + sorted(glob.glob(glob.escape(path) + '.*'))
+            if os.path.isfile(part_path) and not part_path.endswith('.tmp')
+            and not (exclude and part_path.startswith(exclude))]
+
+
+def _read_lines(path: str, font_names: set = None) -> typing.Iterator[dict]:
+    """Read JSON lines of the file, only of the given fonts if `font_names` is not None."""
+    with open(path) as f:
+        for line in f:
+            try:
+                record = json.loads(line)
+            except ValueError:  # the last line might be incomplete if the run was interrupted
+                continue
+            if font_names is None or record.get('font') in font_names:
+                yield record
+
+
+class Manifest:
+    """Records of generated samples keyed by (font, char, index) and summaries of the fonts."""
+
+    def __init__(self, path: str, tag: str = None):
+        """Open manifest at `path`, the font summary (including part files) is loaded.
+
+        Manifests without a summary, written before it was introduced, are read once to create it.
+
+        :param tag: tag of the part files the new records are appended to (default None, the manifest itself)
+        """
+        self.path = path
+        self.tag = tag
+        # the latest summary line of each font
+        self.fonts = dict()
+
+        self._records = None
+        self._font_records = dict()
+        self._files = dict()
+        self._lock = threading.Lock()
+
+        if not _part_paths(summary_path(path)) and self._part_paths():
+            self._create_summary()
+
+        for part_path in _part_paths(summary_path(path)):
+            for entry in _read_lines(part_path):
+                self.fonts[entry['font']] = entry
+
+    def _create_summary(self):
+        fonts = dict()
+        for record in self.records.values():
+            fonts[record['font']] = dict(font=record['font'], font_hash=record['font_hash'], params=record['params'])
+
+        with open(summary_path(self.path), 'w') as f:
+            for entry in fonts.values():
+                f.write(json.dumps(entry, ensure_ascii=False) + '\n')
+
+    def _part_paths(self) -> list:
+        return _part_paths(self.path, exclude=summary_path(self.path))
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        state['_files'] = dict()
+        state['_lock'] = None
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self._lock = threading.Lock()
+
+    @property
+    def records(self) -> dict:
+        """All records of the manifest, the latest one of each sample. The records are read on first access."""
+        if self._records is None:
+            records = dict()
+            for part_path in self._part_paths():
+                for record in _read_lines(part_path):
+                    records[(record['font'], record['char'], record['index'])] = record
+            self._records = records
+
+        return self._records
+
+    def __len__(self):
+        return len(self.records)
+
+    def load_records(self, font_names: typing.Iterable):
+        """Read records of the given fonts, so that their samples generated before can be skipped."""
+        font_names = set(font_names) - set(self._font_records)
+        if not font_names:
+            return
+
+        for font_name in font_names:
+            self._font_records[font_name] = dict()
+        for part_path in self._part_paths():
+            for record in _read_lines(part_path, font_names):
+                self._font_records[record['font']][(record['char'], record['index'])] = record
+
+    def fork(self, tag: str, font_names: typing.Iterable = None) -> 'Manifest':
+        """Return manifest for a worker appending into its own part files.
+
+        :param font_names: fonts the worker generates, records of the other fonts are not passed to it
+        """
+        manifest = Manifest.__new__(Manifest)
+        manifest.__setstate__(self.__getstate__())
+        manifest.tag = tag if self.tag is None else "{}-{}".format(self.tag, tag)
+        manifest._records = None
+
+        if font_names is not None:
+            font_names = set(font_names)
+            manifest.fonts = {font_name: entry for font_name, entry in self.fonts.items() if font_name in font_names}
+            manifest._font_records = {font_name: records for font_name, records in self._font_records.items()
+                                      if font_name in font_names}
+
+        return manifest
+
+    def _matches(self, font_name, font_hash, params) -> typing.Optional[dict]:
+        entry = self.fonts.get(font_name)
+        if entry is not None and entry['font_hash'] == font_hash and entry['params'] == params:
+            return entry
+        return None
+
+    def is_started(self, font_name, font_hash, params) -> bool:
+        """Whether samples of the font have been recorded for the same font file and parameters."""
+        return self._matches(font_name, font_hash, params) is not None
+
+    def is_done(self, font_name, font_hash, char, index, params) -> bool:
+        """Whether the sample has been generated from the same font file with the same parameters.
+
+        Only samples of the fonts read by `load_records` are known.
+        """
+        record = self._font_records.get(font_name, dict()).get((char, index))
+        return record is not None and record['font_hash'] == font_hash and record['params'] == params
+
+    def is_font_done(self, font_name, font_hash, params, chars: typing.Iterable, n_samples) -> bool:
+        """Whether all `n_samples` samples of each of the characters have been generated for the font."""
+        entry = self._matches(font_name, font_hash, params)
+        return entry is not None and entry.get('charset') == charset_hash(chars, n_samples)
+
+    def _append(self, path: str, entry: dict):
+        if self.tag is not None:
+            path = "{}.{}".format(path, self.tag)
+
+        f = self._files.get(path)
+        if f is None:
+            os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+            f = self._files[path] = open(path, 'a')
+
+        f.write(json.dumps(entry, ensure_ascii=False) + '\n')
+
+    def record(self, font_name, font_hash, char, index, seed, output, params, **kwargs):
+        """Append record of the generated sample."""
+        record = dict(font=font_name, font_hash=font_hash, char=char, index=index,
+                      seed=seed, output=output, params=params, **kwargs)
+
+        with self._lock:
+            if not self.is_started(font_name, font_hash, params):
+                entry = dict(font=font_name, font_hash=font_hash, params=params)
+                self._append(summary_path(self.path), entry)
+                self.fonts[font_name] = entry
+
+            self._append(self.path, record)
+            if self._records is not None:
+                self._records[(font_name, char, index)] = record
+
+    def record_font(self, font_name, font_hash, params, chars: typing.Iterable, n_samples):
+        """Append summary of the font all samples of which have been generated, see `is_font_done`."""
+        entry = dict(font=font_name, font_hash=font_hash, params=params, charset=charset_hash(chars, n_samples))
+
+        with self._lock:
+            self._append(summary_path(self.path), entry)
+            self.fonts[font_name] = entry
+            self._font_records.pop(font_name, None)
+
+    def flush(self):
+        with self._lock:
+            for f in self._files.values():
+                f.flush()
+
+    def close(self):
+        with self._lock:
+            for f in self._files.values():
+                f.close()
+            self._files = dict()
+
+    def compact(self):
+        """Append part files to the manifest and rewrite the font summary, only the parts are read."""
+        self.close()
+
+        for path, part_paths in ((self.path, self._part_paths()), (summary_path(self.path),
+                                                                   _part_paths(summary_path(self.path)))):
+            part_paths = part_paths[int(os.path.isfile(path)):]
+            if not part_paths:
+                continue
+
+            with open(path, 'a') as f:
+                for part_path in part_paths:
+                    with open(part_path) as part:
+                        for line in part:
+                            if line.endswith('\n'):  # the last line might be incomplete if the run was interrupted
+                                f.write(line)
+
+            for part_path in part_paths:
+                os.remove(part_path)
+
+        # the summary is small, only the latest line of each font is kept
+        self.fonts = dict()
+        if os.path.isfile(summary_path(self.path)):
+            for entry in _read_lines(summary_path(self.path)):
+                self.fonts[entry['font']] = entry
+        self._records = None
+
+        tmp_path = summary_path(self.path) + '.tmp'
+        with open(tmp_path, 'w') as f:
+            for entry in self.fonts.values():
+                f.write(json.dumps(entry, ensure_ascii=False) + '\n')
+        os.replace(tmp_path, summary_path(self.path))
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
@@ -0,0 +1,265 @@
+"""Staged processing pipeline.
+
+Every stage runs its own pool of threads, stages are connected by bounded queues - a slow stage blocks
+the stages in front of it, so the memory stays flat no matter how many items are processed. Stages
+record how long they were busy and how long they waited for their neighbours, see `format_stats`.
+"""
+
+import queue
+import threading
+import time
+import typing
+
+DEFAULT_QUEUE_SIZE = 8
+
+_END = object()
+_POLL_INTERVAL = 0.1
+
+
+class StageStats:
+    """Throughput statistics of a stage."""
+
+    def __init__(self, name: str, workers: int):
+        self.name = name
+        self.workers = workers
+        self.items = 0
+        self.busy = 0.  # seconds spent in the stage function, summed over the workers
+        self.wait_in = 0.  # seconds spent waiting for the input
+        self.wait_out = 0.  # seconds spent waiting for the next stage to accept the output
+        self.elapsed = 0.
+
+    def merge(self, other: 'StageStats'):
+        """Add statistics of the same stage run elsewhere (e.g. in another process)."""
+        self.items += other.items
+        self.busy += other.busy
+        self.wait_in += other.wait_in
+        self.wait_out += other.wait_out
+        self.elapsed = max(self.elapsed, other.elapsed)
+
+    @property
+    def throughput(self) -> float:
+        """Items per second of the wall time."""
+        return self.items / self.elapsed if self.elapsed else 0.
+
+    @property
+    def utilization(self) -> float:
+        """Fraction of the workers' time spent doing work."""
+        total = self.busy + self.wait_in + self.wait_out
+        return self.busy / total if total else 0.
+
+    def as_dict(self) -> dict:
+        return dict(name=self.name, workers=self.workers, items=self.items, busy=self.busy, wait_in=self.wait_in,
+                    wait_out=self.wait_out, elapsed=self.elapsed, throughput=self.throughput)
+
+
+class Stage:
+    """Stage of the pipeline applying `fn` to every item."""
+
+    def __init__(self, name: str, fn: typing.Callable, workers=1, ordered=False, count: typing.Callable = None):
+        """Initialize stage.
+
+        :param fn: function called with every item, items it returns None for are dropped
+        :param workers: number of threads running the stage
+        :param ordered: whether to process the items in the order they entered the pipeline,
+        requires single worker (default False)
+        :param count: function returning number of units (e.g. images) the item consists of,
+        reported in the statistics (default every item counts as one)
+        """
+        if workers < 1:
+            raise ValueError("Stage '%s' needs at least one worker, got %d" % (name, workers))
+        if ordered and workers != 1:
+            raise ValueError("Ordered stage '%s' must run with a single worker" % name)
+
+        self.name = name
+        self.fn = fn
+        self.workers = workers
+        self.ordered = ordered
+        self.count = count
+
+
+class Pipeline:
+    """Chain of stages, each running in its own thread pool."""
+
+    def __init__(self, stages: typing.List[Stage], queue_size=DEFAULT_QUEUE_SIZE, reorder_window: int = None):
+        """Initialize pipeline.
+
+        :param stages: stages in the order the items pass through them
+        :param queue_size: capacity of the queues in between the stages
+        :param reorder_window: maximum number of items in flight in front of the last ordered stage,
+        bounds the items an ordered stage holds while waiting for a slow one (default `queue_size` per stage)
+        """
+        self.stages = stages
+        self.queue_size = queue_size
+        self.reorder_window = reorder_window or queue_size * len(stages)
+
+        ordered = [i for i, stage in enumerate(stages) if stage.ordered]
+        self._window_stage = ordered[-1] if ordered else None
+        self._window = None
+        self.stats = [StageStats(stage.name, stage.workers) for stage in stages]
+
+        self._stop = threading.Event()
+        self._error = None
+        self._lock = threading.Lock()
+
+    def _put(self, q: queue.Queue, item) -> bool:
+        while not self._stop.is_set():
+            try:
+                q.put(item, timeout=_POLL_INTERVAL)
+                return True
+            except queue.Full:
+                continue
+
+        return False
+
+    def _get(self, q: queue.Queue):
+        while not self._stop.is_set():
+            try:
+                return q.get(timeout=_POLL_INTERVAL)
+            except queue.Empty:
+                continue
+
+        return _END
+
+    def _fail(self, error: BaseException):
+        with self._lock:
+            if self._error is None:
+                self._error = error
+        self._stop.set()
+
+    def _acquire_window(self) -> bool:
+        while not self._stop.is_set():
+            if self._window.acquire(timeout=_POLL_INTERVAL):
+                return True
+
+        return False
+
+    def _feed(self, items: typing.Iterable, out_queue: queue.Queue):
+        try:
+            for seq, item in enumerate(items):
+                if self._window is not None and not self._acquire_window():
+                    return
+                if not self._put(out_queue, (seq, item)):
+                    return
+        except BaseException as e:
+            self._fail(e)
+        finally:
+            self._put(out_queue, _END)
+
+    def _work(self, stage: Stage, stats: StageStats, in_queue: queue.Queue, out_queue: queue.Queue,
+              remaining: list, window: threading.Semaphore = None):
+        pending = dict()  # out of order items of an ordered stage
+        next_seq = 0
+
+        try:
+            while True:
+                start = time.perf_counter()
+                entry = self._get(in_queue)
+                waited = time.perf_counter() - start
+
+                if entry is _END:
+                    # let the other workers of the stage know as well
+                    self._put(in_queue, _END)
+                    break
+
+                if stage.ordered:
+                    pending[entry[0]] = entry[1]
+                    entries = list()
+                    while next_seq in pending:
+                        entries.append((next_seq, pending.pop(next_seq)))
+                        next_seq += 1
+                else:
+                    entries = [entry]
+
+                for seq, item in entries:
+                    start = time.perf_counter()
+                    # dropped items are passed on, so that the ordered stages do not wait for them
+                    result = None if item is None else stage.fn(item)
+                    busy = time.perf_counter() - start
+                    units = 0 if item is None else 1 if stage.count is None else stage.count(item)
+
+                    if window is not None:
+                        window.release()
+
+                    start = time.perf_counter()
+                    if not self._put(out_queue, (seq, result)):
+                        return
+                    put = time.perf_counter() - start
+
+                    with self._lock:
+                        stats.items += units
+                        stats.busy += busy
+                        stats.wait_out += put
+
+                with self._lock:
+                    stats.wait_in += waited
+        except BaseException as e:
+            self._fail(e)
+        finally:
+            with self._lock:
+                remaining[0] -= 1
+                last = remaining[0] == 0
+            # the last worker of the stage passes the end on
+            if last:
+                self._put(out_queue, _END)
+
+    def run(self, items: typing.Iterable) -> typing.Iterator:
+        """Pass the items through the stages, yield non-None results of the last stage.
+
+        Exception raised in any of the stages stops the pipeline and is re-raised here.
+        """
+        self._stop.clear()
+        self._error = None
+        self._window = None if self._window_stage is None else threading.Semaphore(self.reorder_window)
+
+        queues = [queue.Queue(maxsize=self.queue_size) for _ in range(len(self.stages) + 1)]
+        threads = [threading.Thread(target=self._feed, args=(items, queues[0]), daemon=True)]
+        for i, (stage, stats) in enumerate(zip(self.stages, self.stats)):
+            remaining = [stage.workers]
+            threads.extend(
+                threading.Thread(target=self._work, name="{}-{}".format(stage.name, k), daemon=True,
+                                 args=(stage, stats, queues[i], queues[i + 1], remaining,
+                                       self._window if i == self._window_stage else None))
+                for k in range(stage.workers)
+            )
+
+        start = time.perf_counter()
+        for thread in threads:
+            thread.start()
+
+        try:
+            while True:
+                entry = self._get(queues[-1])
+                if entry is _END:
+                    break
+                if entry[1] is not None:
+                    yield entry[1]
+        finally:
+            self._stop.set()
+            for thread in threads:
+                thread.join()
+
+            elapsed = time.perf_counter() - start
+            for stats in self.stats:
+                stats.elapsed += elapsed
+
+        if self._error is not None:
+            raise self._error
+
+    def execute(self, items: typing.Iterable) -> int:
+        """Pass the items through the stages, return number of the non-None results."""
+        return sum(1 for _ in self.run(items))
+
+
+def format_stats(stats: typing.List[StageStats]) -> str:
+    """Format stage statistics as a table, the stage busy for the largest fraction of time is the bottleneck."""
+    lines = ["{:<10} {:>7} {:>9} {:>10} {:>7} {:>9} {:>9}".format(
+        'stage', 'workers', 'items', 'items/s', 'busy', 'wait in', 'wait out')]
+
+    bottleneck = max(stats, key=lambda s: s.utilization, default=None)
+    for s in stats:
+        total = (s.busy + s.wait_in + s.wait_out) or 1.
+        lines.append("{:<10} {:>7d} {:>9d} {:>10.1f} {:>6.0%} {:>9.0%} {:>9.0%}{}".format(
+            s.name, s.workers, s.items, s.throughput, s.busy / total, s.wait_in / total, s.wait_out / total,
+            '  <- bottleneck' if s is bottleneck else ''))
+
+    return "\n".join(lines)
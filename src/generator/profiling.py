@@ -0,0 +1,218 @@
+"""Instrumentation of the generation runs - timers and counters per stage and per font.
+
+The profiler answers where the time of a run goes (font sizing, drawing, augmentation, encoding, writes)
+and which fonts are slow or failing, see `Profiler.summary`. A disabled profiler costs a single attribute
+lookup per timed block. For a function level view, runs can be wrapped into `cprofile`.
+"""
+
+import contextlib
+import statistics
+import sys
+import threading
+import time
+import typing
+
+# fonts taking longer than this multiple of the median time per image are flagged as slow
+DEFAULT_SLOW_FACTOR = 3.
+DEFAULT_TOP_FONTS = 10
+
+
+class _Timer:
+    """Context manager adding the time spent in the block to the profiler."""
+
+    __slots__ = ('profiler', 'stage', 'font_name', 'items', 'start')
+
+    def __init__(self, profiler: 'Profiler', stage: str, font_name: str = None, items=1):
+        self.profiler = profiler
+        self.stage = stage
+        self.font_name = font_name
+        self.items = items
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.profiler.add(self.stage, time.perf_counter() - self.start, items=0 if exc_type else self.items,
+                          font_name=self.font_name, error=exc)
+        return False
+
+
+class Profiler:
+    """Timers and counters of the stages of a run, kept in total and for each font.
+
+    Safe to use from multiple threads, profilers of other processes are combined by `merge`.
+    """
+
+    def __init__(self, enabled=True):
+        self.enabled = enabled
+        # stage -> [calls, items, seconds]
+        self.stages = dict()
+        # font name -> stage -> [calls, items, seconds]
+        self.fonts = dict()
+        # font name -> list of error messages
+        self.errors = dict()
+
+        self._lock = threading.Lock()
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        del state['_lock']
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self._lock = threading.Lock()
+
+    def timer(self, stage: str, font_name: str = None, items=1):
+        """Time the block as `items` processed by the `stage` (for the font `font_name` if given).
+
+        Exception raised in the block is recorded as a failure of the font and no items are counted.
+        """
+        if not self.enabled:
+            return contextlib.nullcontext()
+
+        return _Timer(self, stage, font_name=font_name, items=items)
+
+    def add(self, stage: str, seconds: float, items=1, font_name: str = None, error: BaseException = None):
+        """Record `seconds` spent processing `items` by the `stage`."""
+        if not self.enabled:
+            return
+
+        with self._lock:
+            _accumulate(self.stages, stage, 1, items, seconds)
+            if font_name is not None:
+                _accumulate(self.fonts.setdefault(font_name, dict()), stage, 1, items, seconds)
+                if error is not None:
+                    self.errors.setdefault(font_name, list()).append(
+                        "{}: {} ({})".format(type(error).__name__, error, stage))
+
+    def failure(self, font_name: str, error: typing.Union[BaseException, str], stage: str = None):
+        """Record failure of the font which has not been raised through a timer."""
+        if not self.enabled:
+            return
+
+        message = error if isinstance(error, str) else "{}: {}".format(type(error).__name__, error)
+        with self._lock:
+            self.errors.setdefault(font_name, list()).append(
+                message if stage is None else "{} ({})".format(message, stage))
+
+    def merge(self, other: 'Profiler'):
+        """Add timers and counters of the same run profiled elsewhere (e.g. in another process)."""
+        with self._lock:
+            for stage, (calls, items, seconds) in other.stages.items():
+                _accumulate(self.stages, stage, calls, items, seconds)
+            for font_name, stages in other.fonts.items():
+                font_stages = self.fonts.setdefault(font_name, dict())
+                for stage, (calls, items, seconds) in stages.items():
+                    _accumulate(font_stages, stage, calls, items, seconds)
+            for font_name, errors in other.errors.items():
+                self.errors.setdefault(font_name, list()).extend(errors)
+
+    def font_times(self) -> dict:
+        """Return font name -> (images, seconds) of the fonts, images are the largest count of any stage."""
+        return {
+            font_name: (max(items for _, items, _ in stages.values()),
+                        sum(seconds for _, _, seconds in stages.values()))
+            for font_name, stages in self.fonts.items()
+        }
+
+    def slow_fonts(self, slow_factor=DEFAULT_SLOW_FACTOR) -> dict:
+        """Return font name -> ratio of its time per image to the median of all fonts, for the slow fonts."""
+        per_image = {font_name: seconds / images for font_name, (images, seconds) in self.font_times().items()
+                     if images}
+        if len(per_image) < 2:
+            return dict()
+
+        median = statistics.median(per_image.values())
+        if not median:
+            return dict()
+
+        return {font_name: t / median for font_name, t in per_image.items() if t > slow_factor * median}
+
+    def summary(self, slow_factor=DEFAULT_SLOW_FACTOR, top=DEFAULT_TOP_FONTS) -> str:
+        """Format the stages and the slowest, slow and failing fonts as tables.
+
+        Stage times are summed over the threads and processes, so they may exceed the wall time of the run.
+        """
+        lines = ["{:<14} {:>9} {:>9} {:>10} {:>10}".format('stage', 'calls', 'images', 'total s', 'ms/image')]
+        for stage, (calls, items, seconds) in self.stages.items():
+            lines.append("{:<14} {:>9d} {:>9d} {:>10.2f} {:>10.3f}".format(
+                stage, calls, items, seconds, 1e3 * seconds / items if items else 0.))
+
+        font_times = self.font_times()
+        slow = self.slow_fonts(slow_factor)
+        slowest = sorted(font_times, key=lambda name: font_times[name][1], reverse=True)[:top]
+        flagged = slowest + sorted(name for name in set(slow) | set(self.errors) if name not in slowest)
+        if not flagged:
+            return "\n".join(lines)
+
+        lines.append("")
+        lines.append("{:<30} {:>9} {:>10} {:>10}".format('font', 'images', 'total s', 'ms/image'))
+        for font_name in flagged:
+            images, seconds = font_times.get(font_name, (0, 0.))
+            notes = list()
+            if font_name in slow:
+                notes.append("slow ({:.1f}x median)".format(slow[font_name]))
+            if font_name in self.errors:
+                notes.append("failed: " + self.errors[font_name][0])
+            lines.append("{:<30} {:>9d} {:>10.2f} {:>10.3f}{}".format(
+                font_name[:30], images, seconds, 1e3 * seconds / images if images else 0.,
+                "  <- " + ", ".join(notes) if notes else ''))
+
+        return "\n".join(lines)
+
+
+def _accumulate(table: dict, stage: str, calls: int, items: int, seconds: float):
+    counters = table.get(stage)
+    if counters is None:
+        table[stage] = [calls, items, seconds]
+    else:
+        counters[0] += calls
+        counters[1] += items
+        counters[2] += seconds
+
+
+@contextlib.contextmanager
+def cprofile(path: str = None):
+    """Profile the block with cProfile and dump the statistics into `path` (no-op if `path` is None).
+
+    Threads started within the block are profiled as well, worker processes are not.
+    The dump can be inspected with `python -m pstats <path>` or e.g. snakeviz.
+    """
+    if path is None:
+        yield
+        return
+
+    import cProfile
+    import pstats
+
+    profiles = [cProfile.Profile()]
+
+    def profile_thread(*_):
+        # called on the first event of a new thread, the thread's own profiler replaces this hook
+        profile = cProfile.Profile()
+        try:
+            profile.enable()
+        except ValueError:  # since Python 3.12 the first profiler covers all threads
+            sys.setprofile(None)
+            return
+        profiles.append(profile)
+
+    threading.setprofile(profile_thread)
+    profiles[0].enable()
+    try:
+        yield
+    finally:
+        profiles[0].disable()
+        threading.setprofile(None)
+
+        stats = pstats.Stats(profiles[0])
+        for profile in profiles[1:]:
+            profile.disable()
+            try:
+                stats.add(profile)
+            except TypeError:  # thread did not record any call
+                continue
+        stats.dump_stats(path)
+        print("Profile written to", path, file=sys.stderr)
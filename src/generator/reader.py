@@ -0,0 +1,229 @@
+"""Read generated datasets back - memory-mapped arrays with random access and batch iteration.
+
+Sharded `.npy` output of `sinks.NpyShardSink` is first consolidated into contiguous arrays by `consolidate`,
+the resulting directory is opened by `CharDataset`.
+"""
+
+import json
+import os
+
+import numpy as np
+
+from . import sinks
+
+DATASET_FILE = 'dataset.json'
+ARRAYS = ('images', 'labels', 'fonts', 'splits', 'samples')
+
+
+def consolidate(shard_dir: str, out_dir: str = None) -> str:
+    """Concatenate `.npy` shards listed in the index into contiguous arrays.
+
+    Shards are streamed one by one into memory-mapped output, so the dataset is never held in memory.
+
+    :param shard_dir: directory containing shards and index written by `sinks.NpyShardSink`
+    :param out_dir: output directory (default `shard_dir`)
+
+    :returns: path to the consolidated dataset directory
+    """
+    out_dir = out_dir or shard_dir
+    with open(os.path.join(shard_dir, sinks.INDEX_FILE)) as f:
+        index = json.load(f)
+
+    if index['format'] != sinks.NpyShardSink.format:
+        raise ValueError("Only '%s' shards can be consolidated, got '%s'"
+                         % (sinks.NpyShardSink.format, index['format']))
+
+    shards = index['shards']
+    if not shards:
+        raise ValueError("No shards found in '%s'" % shard_dir)
+
+    size = sum(shard['size'] for shard in shards)
+
+    # global font table, shards index into their own font names
+    font_names = sorted({font_name for shard in shards for font_name in shard['font_names']})
+    font_ids = {font_name: i for i, font_name in enumerate(font_names)}
+
+    os.makedirs(out_dir, exist_ok=True)
+    out = dict()
+    for key in ARRAYS:
+        sample = np.load(os.path.join(shard_dir, "{}.{}.npy".format(shards[0]['name'], key)), mmap_mode='r')
+        out[key] = np.lib.format.open_memmap(os.path.join(out_dir, key + '.npy'), mode='w+',
+                                             dtype=sample.dtype, shape=(size,) + sample.shape[1:])
+
+    start = 0
+    for shard in shards:
+        stop = start + shard['size']
+        for key in ARRAYS:
+            array = np.load(os.path.join(shard_dir, "{}.{}.npy".format(shard['name'], key)), mmap_mode='r')
+            if key == 'fonts':
+                array = np.asarray([font_ids[name] for name in shard['font_names']], dtype=np.int32)[array]
+            out[key][start:stop] = array
+
+        start = stop
+
+    for array in out.values():
+        array.flush()
+
+    with open(os.path.join(out_dir, DATASET_FILE), 'w') as f:
+        json.dump({'size': size, 'shape': shards[0]['shape'], 'font_names': font_names}, f, indent=1)
+
+    return out_dir
+
+
+class CharDataset:
+    """Memory-mapped character image dataset.
+
+    Views (subsets, shuffled batches) index into the shared memory-mapped arrays and never copy them.
+    """
+
+    def __init__(self, path: str, indices: np.ndarray = None, _arrays: dict = None, _meta: dict = None):
+        """Open consolidated dataset at `path`.
+
+        :param indices: indices of the samples included in this view (default all samples)
+        """
+        self.path = path
+
+        if _arrays is None:
+            with open(os.path.join(path, DATASET_FILE)) as f:
+                _meta = json.load(f)
+            _arrays = {key: np.load(os.path.join(path, key + '.npy'), mmap_mode='r') for key in ARRAYS}
+            _meta['classes'] = np.unique(np.asarray(_arrays['labels']))
+
+        self._meta = _meta
+        self._arrays = _arrays
+        self.indices = indices
+
+        self.font_names = _meta['font_names']
+        self.classes = _meta['classes']  # char ordinals of all samples
+
+    @property
+    def images(self) -> np.ndarray:
+        """Memory-mapped uint8 images of all samples (not only of this view)."""
+        return self._arrays['images']
+
+    @property
+    def labels(self) -> np.ndarray:
+        return self._take('labels')
+
+    @property
+    def fonts(self) -> np.ndarray:
+        return self._take('fonts')
+
+    def _take(self, key, idx=None):
+        array = self._arrays[key]
+        if idx is None:
+            return array if self.indices is None else array[self.indices]
+
+        return array[idx if self.indices is None else self.indices[idx]]
+
+    def __len__(self):
+        return len(self._arrays['labels']) if self.indices is None else len(self.indices)
+
+    def __getitem__(self, i) -> tuple:
+        """Return (image, label) of the `i`th sample of this view."""
+        if self.indices is not None:
+            i = self.indices[i]
+        return self._arrays['images'][i], int(self._arrays['labels'][i])
+
+    def view(self, indices: np.ndarray) -> 'CharDataset':
+        """Return view of the samples at the given indices of this view."""
+        indices = np.asarray(indices, dtype=np.intp)
+        if self.indices is not None:
+            indices = self.indices[indices]
+
+        return CharDataset(self.path, indices=indices, _arrays=self._arrays, _meta=self._meta)
+
+    def subset(self, name: str) -> 'CharDataset':
+        """Return view of the 'train' or 'test' subset."""
+        split = sinks.SPLITS.index(name)
+        return self.view(np.flatnonzero(self._take('splits') == split))
+
+    @property
+    def train(self) -> 'CharDataset':
+        return self.subset(sinks.TRAIN)
+
+    @property
+    def test(self) -> 'CharDataset':
+        return self.subset(sinks.TEST)
+
+    def class_indices(self, labels: np.ndarray) -> np.ndarray:
+        """Map char ordinals to indices into `classes`."""
+        return np.searchsorted(self.classes, labels)
+
+    def get_batch(self, idx: np.ndarray) -> tuple:
+        """Return (images, labels) of the samples at the given indices of this view."""
+        idx = np.asarray(idx, dtype=np.intp)
+        if self.indices is not None:
+            idx = self.indices[idx]
+
+        # read memory-mapped rows in order, then restore the requested order
+        order = np.argsort(idx, kind='stable')
+        images = np.empty((len(idx),) + self._arrays['images'].shape[1:], dtype=self._arrays['images'].dtype)
+        images[order] = self._arrays['images'][idx[order]]
+
+        return images, np.asarray(self._arrays['labels'][idx])
+
+    def batches(self, batch_size=32, shuffle=False, seed=None, drop_last=False):
+        """Iterate over batches of (images, labels).
+
+        :param shuffle: whether to shuffle the samples (default False)
+        :param seed: seed of the shuffle
+        :param drop_last: whether to drop the last incomplete batch (default False)
+        """
+        order = np.arange(len(self))
+        if shuffle:
+            np.random.default_rng(seed).shuffle(order)
+
+        stop = len(order) - len(order) % batch_size if drop_last else len(order)
+        for start in range(0, stop, batch_size):
+            yield self.get_batch(order[start:start + batch_size])
+
+    def keras_sequence(self, batch_size=32, shuffle=True, seed=None, rescale=None):
+        """Return Keras `Sequence` yielding (images, class indices) batches.
+
+        :param rescale: factor the images are multiplied by, e.g. 1/255 (default None, keeps uint8)
+        """
+        return _sequence_class()(self, batch_size=batch_size, shuffle=shuffle, seed=seed, rescale=rescale)
+
+
+_SEQUENCE_CLASS = None
+
+
+def _sequence_class():
+    """Create `keras.utils.Sequence` subclass, Keras is imported only once it is needed."""
+    global _SEQUENCE_CLASS
+    if _SEQUENCE_CLASS is not None:
+        return _SEQUENCE_CLASS
+
+    from tensorflow import keras
+
+    class CharDatasetSequence(keras.utils.Sequence):
+        """Keras Sequence adapter of `CharDataset`."""
+
+        def __init__(self, dataset: CharDataset, batch_size=32, shuffle=True, seed=None, rescale=None):
+            super().__init__()
+            self.dataset = dataset
+            self.batch_size = batch_size
+            self.shuffle = shuffle
+            self.rescale = rescale
+
+            self.rng = np.random.default_rng(seed)
+            self.order = np.arange(len(dataset))
+            self.on_epoch_end()
+
+        def __len__(self):
+            return int(np.ceil(len(self.dataset) / self.batch_size))
+
+        def __getitem__(self, i):
+            images, labels = self.dataset.get_batch(self.order[i * self.batch_size:(i + 1) * self.batch_size])
+            if self.rescale is not None:
+                images = images.astype(np.float32) * self.rescale
+
+            return images, self.dataset.class_indices(labels)
+
+        def on_epoch_end(self):
+            if self.shuffle:
+                self.rng.shuffle(self.order)
+
+    _SEQUENCE_CLASS = CharDatasetSequence
+    return _SEQUENCE_CLASS
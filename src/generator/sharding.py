@@ -0,0 +1,119 @@
+"""Generation split across machines - every node owns the fonts hashed into its shard.
+
+Fonts are assigned to `num_shards` shards by a stable hash of the font name, so nodes agree on the
+partition without any coordination, as long as they are given the same font set. Node `i` writes
+its output into `<prefix>/shard-<i>-of-<num_shards>`, once all nodes are done `merge_shards` combines
+the shard manifests and indexes into one dataset at `<prefix>`.
+
+Samples do not depend on the shard they are generated in (see `CharImageGenerator.sample_seed`),
+with a common seed the merged dataset is the same as that of a single run.
+"""
+
+import json
+import os
+import time
+
+from . import sinks, utils
+from .manifest import MANIFEST_FILE, Manifest
+
+SHARD_DIR_FORMAT = 'shard-{}-of-{}'
+
+
+def font_shard(font_name: str, num_shards: int) -> int:
+    """Return index of the shard owning the font, stable across processes and machines."""
+    return utils.derive_seed('shard', font_name) % num_shards
+
+
+def shard_fonts(font_names, shard_index: int, num_shards: int) -> list:
+    """Return the fonts owned by the shard, in the given order."""
+    check_shard(shard_index, num_shards)
+    return [font_name for font_name in font_names if font_shard(font_name, num_shards) == shard_index]
+
+
+def check_shard(shard_index: int, num_shards: int):
+    """Raise ValueError if the shard index is out of range."""
+    if num_shards < 1 or not 0 <= shard_index < num_shards:
+        raise ValueError("Invalid shard %d of %d, expected 0 <= shard index < number of shards"
+                         % (shard_index, num_shards))
+
+
+def shard_dir(prefix: str, shard_index: int, num_shards: int) -> str:
+    """Return output directory of the shard."""
+    return os.path.join(prefix, SHARD_DIR_FORMAT.format(shard_index, num_shards))
+
+
+def merge_shards(prefix: str, num_shards: int, manifest_file=MANIFEST_FILE) -> dict:
+    """Combine outputs of all the shards in `prefix` into one dataset.
+
+    Manifests of the shards are merged into `<prefix>/<manifest_file>`, each record gets the `shard` its output
+    is relative to. Indexes of the sharded output formats are merged into `<prefix>/index.json`, listing the
+    shard files under their paths relative to `prefix`, so that e.g. `reader.consolidate(prefix)` reads
+    the whole dataset.
+
+    :returns: summary of the merge - number of the merged records and samples in the indexes
+    :raises ValueError: if any of the shards is missing
+    """
+    dirs = [shard_dir(prefix, i, num_shards) for i in range(num_shards)]
+    missing = [path for path in dirs if not os.path.isdir(path)]
+    if missing:
+        raise ValueError("Missing output of %d of %d shards: %s" % (len(missing), num_shards, ", ".join(missing)))
+
+    summary = {'shards': num_shards, 'records': None, 'size': None}
+
+    manifests = [os.path.join(path, manifest_file) for path in dirs]
+    if any(os.path.isfile(path) for path in manifests):
+        summary['records'] = _merge_manifests(os.path.join(prefix, manifest_file), dirs, manifests)
+
+    indexes = [os.path.join(path, sinks.INDEX_FILE) for path in dirs]
+    if any(os.path.isfile(path) for path in indexes):
+        summary['size'] = _merge_indexes(prefix, dirs, indexes)
+
+    return summary
+
+
+def _merge_manifests(path: str, dirs: list, manifests: list) -> int:
+    count = 0
+    tmp_path = path + '.tmp'
+    with open(tmp_path, 'w') as f:
+        for dir_path, manifest_path in zip(dirs, manifests):
+            if not os.path.isfile(manifest_path):
+                continue
+
+            # part files of an interrupted shard are included, the records are the latest of each sample
+            shard = os.path.basename(dir_path)
+            for record in Manifest(manifest_path).records.values():
+                f.write(json.dumps(dict(record, shard=shard), ensure_ascii=False) + '\n')
+                count += 1
+    os.replace(tmp_path, path)
+
+    return count
+
+
+def _merge_indexes(prefix: str, dirs: list, indexes: list) -> int:
+    merged = None
+    for path, index_path in zip(dirs, indexes):
+        if not os.path.isfile(index_path):
+            continue
+
+        with open(index_path) as f:
+            index = json.load(f)
+
+        if merged is None:
+            merged = dict(index, shards=list())
+        elif index['format'] != merged['format']:
+            raise ValueError("Shards of different formats can not be merged, got '%s' and '%s'"
+                             % (merged['format'], index['format']))
+
+        relpath = os.path.relpath(path, prefix)
+        for shard in index['shards']:
+            shard = dict(shard, name=os.path.join(relpath, shard['name']))
+            if 'file' in shard:
+                shard['file'] = os.path.join(relpath, shard['file'])
+            merged['shards'].append(shard)
+
+    merged['size'] = sum(shard['size'] for shard in merged['shards'])
+    merged['created'] = time.time()
+    with open(os.path.join(prefix, sinks.INDEX_FILE), 'w') as f:
+        json.dump(merged, f, indent=1)
+
+    return merged['size']
@@ -0,0 +1,348 @@
+"""Output sinks the generated samples are written into.
+
+`DirectorySink` writes one PNG per sample into Keras-like directory structure, shard sinks write
+fixed-size shards which can be copied around cheaply and memory-mapped by the readers.
+"""
+
+import copy
+import glob
+import io
+import json
+import os
+import tarfile
+import time
+import uuid
+
+import numpy as np
+
+from PIL import Image
+
+TRAIN = 'train'
+TEST = 'test'
+SPLITS = (TRAIN, TEST)
+
+INDEX_FILE = 'index.json'
+DEFAULT_SHARD_SIZE = 10000
+
+
+class Sink:
+    """Base class of output sinks.
+
+    Sinks open their files lazily on the first write, so that unused sink can be pickled and
+    forked for the worker processes.
+    """
+
+    shard_size = None
+    resumable = False  # whether samples can be added into the existing output
+
+    def write(self, char: chr, font_name: str, index: int, image, subset: str = None) -> str:
+        """Write the sample.
+
+        :param char: character of the sample
+        :param font_name: name of the font the sample was generated with
+        :param index: index of the sample of the given (font, char)
+        :param image: PIL image, uint8 array or the sample returned by `encode`
+        :param subset: one of `SPLITS`, None if the dataset is not split
+
+        :returns: locator of the written sample
+        """
+        raise NotImplementedError
+
+    def encode(self, image):
+        """Encode the sample for `write`, might be called from multiple threads at once.
+
+        Sinks storing compressed images encode them here, so that the encoding can run in parallel
+        with writing of the previous samples.
+        """
+        return image
+
+    def fork(self, tag: str) -> 'Sink':
+        """Return sink for a worker, writing into files distinguished by `tag`."""
+        return copy.copy(self)
+
+    def close(self):
+        """Flush buffered samples and close files."""
+
+    def finalize(self):
+        """Write the dataset index, called once all (forked) sinks are closed."""
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+
+def encode_image(image, img_format='png') -> bytes:
+    """Encode PIL image, uint8 or bool (bilevel) array into bytes of the given image format."""
+    if not isinstance(image, Image.Image):
+        image = Image.fromarray(image)
+
+    buffer = io.BytesIO()
+    image.save(buffer, format=img_format)
+
+    return buffer.getvalue()
+
+
+class DirectorySink(Sink):
+    """Write one PNG per sample into `<charset_dir>/<char ordinal>/<font name>_<index>.png`."""
+
+    resumable = True
+
+    def __init__(self, charset_dirs: list, img_format='png'):
+        """Initialize sink.
+
+        :param charset_dirs: charset directories as created by `CharImageGenerator.create_charset_dir`,
+        either [test_dir, train_dir] or [charset_dir] if the dataset is not split
+        """
+        self.charset_dirs = charset_dirs
+        self.img_format = img_format
+
+    def encode(self, image):
+        return encode_image(image, self.img_format)
+
+    def write(self, char, font_name, index, image, subset=None):
+        if subset is None:
+            path, = self.charset_dirs
+        else:
+            path = self.charset_dirs[subset == TRAIN]
+
+        char_dir = ord(char)  # The directory structure expects char ordinal
+        img_name = font_name + "_{}.{}".format(index, self.img_format)
+        img_path = os.path.join(path, str(char_dir), img_name)
+
+        if isinstance(image, bytes):
+            with open(img_path, 'wb') as f:
+                f.write(image)
+            return img_path
+
+        if not isinstance(image, Image.Image):
+            image = Image.fromarray(image)
+        image.save(fp=img_path, format=self.img_format)
+
+        return img_path
+
+
+class ShardSink(Sink):
+    """Base class of sinks writing samples in fixed-size shards into `out_dir`.
+
+    Shards are tagged by the run of the sink (shared by its forks), the index lists only the shards
+    of the run and shards left in `out_dir` by previous runs are removed.
+    """
+
+    format = None
+
+    def __init__(self, out_dir: str, shard_size=DEFAULT_SHARD_SIZE, tag: str = None):
+        self.out_dir = out_dir
+        self.shard_size = shard_size
+        self.tag = tag
+        self.run = uuid.uuid4().hex
+
+        self._shard_count = 0
+
+    def fork(self, tag):
+        sink = copy.copy(self)
+        sink.tag = tag if self.tag is None else "{}-{}".format(self.tag, tag)
+        return sink
+
+    def _shard_name(self, count) -> str:
+        prefix = "shard" if self.tag is None else "shard-{}".format(self.tag)
+        return "{}-{:05d}".format(prefix, count)
+
+    def _next_shard_name(self) -> str:
+        name = self._shard_name(self._shard_count)
+        self._shard_count += 1
+        os.makedirs(self.out_dir, exist_ok=True)
+
+        return name
+
+    def _write_shard_meta(self, name, meta: dict):
+        with open(os.path.join(self.out_dir, name + '.json'), 'w') as f:
+            json.dump(dict(meta, run=self.run), f)
+
+    def finalize(self):
+        """Collect metadata of the shards of the run into the dataset index, remove shards of previous runs."""
+        shards = list()
+        for meta_path in sorted(glob.glob(os.path.join(glob.escape(self.out_dir), 'shard*.json'))):
+            try:
+                with open(meta_path) as f:
+                    meta = json.load(f)
+            except ValueError:  # metadata of a shard of an interrupted run
+                meta = dict(name=os.path.basename(meta_path)[:-len('.json')])
+
+            if meta.get('run') == self.run:
+                shards.append(meta)
+                continue
+
+            stale = glob.glob(os.path.join(glob.escape(self.out_dir), glob.escape(meta['name']) + '.*'))
+            for path in stale:
+                os.remove(path)
+
+        index = {
+            'format': self.format,
+            'shard_size': self.shard_size,
+            'size': sum(shard['size'] for shard in shards),
+            'created': time.time(),
+            'shards': shards,
+        }
+
+        with open(os.path.join(self.out_dir, INDEX_FILE), 'w') as f:
+            json.dump(index, f, indent=1)
+
+        return index
+
+
+class NpyShardSink(ShardSink):
+    """Write samples into uncompressed `.npy` shards which can be memory-mapped.
+
+    Each shard `<name>` consists of `<name>.images.npy` (uint8 images, bool images if bilevel),
+    `<name>.labels.npy` (char ordinals), `<name>.fonts.npy` (indices into the font names listed in `<name>.json`),
+    `<name>.splits.npy` (index into `SPLITS`, -1 if not split) and `<name>.samples.npy` (sample indices).
+    """
+
+    format = 'npy'
+
+    def __init__(self, out_dir, shard_size=DEFAULT_SHARD_SIZE, tag=None):
+        super().__init__(out_dir, shard_size=shard_size, tag=tag)
+
+        self._images = None
+        self._k = 0
+
+    def _allocate(self, sample: np.ndarray):
+        self._images = np.empty((self.shard_size,) + sample.shape, dtype=sample.dtype)
+        self._labels = np.empty(self.shard_size, dtype=np.int32)
+        self._fonts = np.empty(self.shard_size, dtype=np.int32)
+        self._splits = np.empty(self.shard_size, dtype=np.int8)
+        self._samples = np.empty(self.shard_size, dtype=np.int32)
+        self._font_names = dict()
+        self._k = 0
+
+    def write(self, char, font_name, index, image, subset=None):
+        sample = np.asarray(image)
+        # bilevel samples are kept bool
+        if sample.dtype != bool:
+            sample = sample.astype(np.uint8, copy=False)
+        if self._images is None:
+            self._allocate(sample)
+
+        if self._images.shape[1:] != sample.shape:
+            raise ValueError("Sample of shape {} does not match the shard shape {}"
+                             .format(sample.shape, self._images.shape[1:]))
+
+        k = self._k
+        self._images[k] = sample
+        self._labels[k] = ord(char)
+        self._fonts[k] = self._font_names.setdefault(font_name, len(self._font_names))
+        self._splits[k] = -1 if subset is None else SPLITS.index(subset)
+        self._samples[k] = index
+        self._k += 1
+
+        locator = "{}:{}".format(self._shard_name(self._shard_count), k)
+        if self._k == self.shard_size:
+            self.flush()
+
+        return locator
+
+    def flush(self):
+        """Write the buffered samples as a shard."""
+        if not self._k:
+            return
+
+        name = self._next_shard_name()
+        arrays = {
+            'images': self._images,
+            'labels': self._labels,
+            'fonts': self._fonts,
+            'splits': self._splits,
+            'samples': self._samples,
+        }
+        for key, array in arrays.items():
+            np.save(os.path.join(self.out_dir, "{}.{}.npy".format(name, key)), array[:self._k])
+
+        self._write_shard_meta(name, {
+            'name': name,
+            'size': self._k,
+            'shape': list(self._images.shape[1:]),
+            'font_names': sorted(self._font_names, key=self._font_names.get),
+        })
+
+        self._font_names = dict()
+        self._k = 0
+
+    def close(self):
+        self.flush()
+
+
+class TarShardSink(ShardSink):
+    """Write samples into WebDataset-style tar shards.
+
+    Every sample is stored as `<key>.png` with `<key>.cls` holding the char ordinal and `<key>.json`
+    holding the sample metadata.
+    """
+
+    format = 'tar'
+
+    def __init__(self, out_dir, shard_size=DEFAULT_SHARD_SIZE, tag=None, img_format='png'):
+        super().__init__(out_dir, shard_size=shard_size, tag=tag)
+        self.img_format = img_format
+
+        self._tar = None
+        self._k = 0
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        state['_tar'] = None
+        return state
+
+    def _add_member(self, name, data: bytes):
+        info = tarfile.TarInfo(name=name)
+        info.size = len(data)
+        info.mtime = int(time.time())
+        self._tar.addfile(info, io.BytesIO(data))
+
+    def encode(self, image):
+        return encode_image(image, self.img_format)
+
+    def write(self, char, font_name, index, image, subset=None):
+        if self._tar is None:
+            self._name = self._next_shard_name()
+            self._tar = tarfile.open(os.path.join(self.out_dir, self._name + '.tar'), mode='w')
+            self._k = 0
+
+        data = image if isinstance(image, bytes) else encode_image(image, self.img_format)
+
+        key = "{}_{}_{}".format(font_name, ord(char), index)
+        meta = {'char': char, 'label': ord(char), 'font': font_name, 'index': index, 'split': subset}
+
+        self._add_member(key + '.' + self.img_format, data)
+        self._add_member(key + '.cls', str(ord(char)).encode())
+        self._add_member(key + '.json', json.dumps(meta).encode())
+        self._k += 1
+
+        locator = "{}.tar:{}".format(self._name, key)
+        if self._k == self.shard_size:
+            self.close()
+
+        return locator
+
+    def close(self):
+        if self._tar is None:
+            return
+
+        self._tar.close()
+        self._tar = None
+        self._write_shard_meta(self._name, {'name': self._name, 'size': self._k, 'file': self._name + '.tar'})
+
+
+SINKS = {
+    NpyShardSink.format: NpyShardSink,
+    TarShardSink.format: TarShardSink,
+}
+
+
+def create_shard_sink(fmt: str, out_dir: str, **kwargs) -> ShardSink:
+    """Create shard sink of the given format."""
+    try:
+        return SINKS[fmt](out_dir, **kwargs)
+    except KeyError:
+        raise ValueError("Unknown output format '%s', expected one of %s" % (fmt, sorted(SINKS))) from None
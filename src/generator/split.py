@@ -0,0 +1,165 @@
+"""Train/test split of the dataset - assignment table of every (font, char, sample) computed up front.
+
+The split is stratified by character and font - of the samples of each character of a font, the same fraction
+goes into the test set, which samples do is decided by a stable hash of the font name, the character and the
+sample index. Fonts can also be held out, i.e. all their samples are test samples, a font is held out by a stable
+hash of its name. The split of a font therefore does not depend on the other fonts of the run, incremental runs,
+parallel writers and the shards of a run split among several nodes all agree with a single run.
+
+The table is saved with the dataset, parallel writers, incremental runs and readers then look the split up
+instead of recomputing it.
+"""
+
+import os
+
+import numpy as np
+
+from . import sinks, utils
+
+SPLIT_FILE = 'split.npz'
+_GOLDEN = np.uint64(0x9E3779B97F4A7C15)
+
+
+def _mix(keys: np.ndarray) -> np.ndarray:
+    """Scramble uint64 keys by the finalizer of splitmix64, element-wise."""
+    with np.errstate(over='ignore'):
+        z = keys ^ (keys >> np.uint64(30))
+        z = z * np.uint64(0xBF58476D1CE4E5B9)
+        z = z ^ (z >> np.uint64(27))
+        z = z * np.uint64(0x94D049BB133111EB)
+        return z ^ (z >> np.uint64(31))
+
+
+def _uniform(keys: np.ndarray) -> np.ndarray:
+    """Map uint64 keys to floats uniformly distributed in [0, 1)."""
+    return (_mix(keys) >> np.uint64(11)) * 2. ** -53
+
+
+def is_held_out(font_name: str, holdout_ratio: float, seed=0) -> bool:
+    """Whether all samples of the font are test samples."""
+    return holdout_ratio > 0 and utils.derive_seed('holdout', seed, font_name) < holdout_ratio * 2 ** 32
+
+
+class SplitTable:
+    """Subsets of the samples of each (font, char, sample index), see `create`."""
+
+    def __init__(self, font_names: list, charset: list, n_samples: int, table: np.ndarray, split_ratio=0.2,
+                 holdout_ratio=0., seed=0):
+        """Initialize table.
+
+        :param table: int8 array of shape (n_fonts, n_chars, n_samples) of indices into `sinks.SPLITS`
+        """
+        self.font_names = list(font_names)
+        self.charset = list(charset)
+        self.n_samples = n_samples
+        self.table = table
+        self.split_ratio = split_ratio
+        self.holdout_ratio = holdout_ratio
+        self.seed = seed
+
+        self._fonts = {font_name: i for i, font_name in enumerate(self.font_names)}
+        self._chars = {char: j for j, char in enumerate(self.charset)}
+
+    @classmethod
+    def create(cls, font_names: list, charset: list, n_samples: int, split_ratio=0.2, holdout_ratio=0., seed=0,
+               coverage: np.ndarray = None) -> 'SplitTable':
+        """Compute split of the samples of the fonts.
+
+        :param split_ratio: fraction of the samples of each character of each font in the test set (default 0.2),
+        if it is not a multiple of `1 / n_samples`, the fraction is met on average
+        :param holdout_ratio: fraction of the fonts all samples of which are in the test set (default 0, none),
+        fonts are held out by a hash of their names, so that the fraction is not exact
+        :param seed: seed of the assignment
+        :param coverage: font x char coverage matrix (default all characters covered), samples of the characters
+        a font does not cover are not generated and are left in the train set
+        """
+        font_names = list(font_names)
+        table = cls._assign(font_names, charset, n_samples, split_ratio, holdout_ratio, seed, coverage)
+        return cls(font_names, charset, n_samples, table, split_ratio=split_ratio, holdout_ratio=holdout_ratio,
+                   seed=seed)
+
+    @staticmethod
+    def _assign(font_names, charset, n_samples, split_ratio, holdout_ratio, seed, coverage=None) -> np.ndarray:
+        n_fonts, n_chars = len(font_names), len(charset)
+        table = np.zeros((n_fonts, n_chars, n_samples), dtype=np.int8)
+        if not n_fonts or not n_chars or not n_samples:
+            return table
+
+        held_out = np.array([is_held_out(font_name, holdout_ratio, seed) for font_name in font_names], dtype=bool)
+        table[held_out] = sinks.SPLITS.index(sinks.TEST)
+
+        covered = np.ones((n_fonts, n_chars), dtype=bool) if coverage is None else np.asarray(coverage, dtype=bool)
+        covered = covered & ~held_out[:, np.newaxis]
+
+        font_keys = np.array([utils.derive_seed('split', seed, font_name) for font_name in font_names],
+                             dtype=np.uint64)
+        char_keys = np.array([utils.derive_seed('split', char) for char in charset], dtype=np.uint64)
+        pair_keys = _mix((font_keys[:, np.newaxis] << np.uint64(32)) | char_keys)
+
+        # every (font, char) pair has the integral part of its share of test samples, the fractional part
+        # is the probability of one more test sample
+        share = split_ratio * n_samples
+        n_test = int(share) + (_uniform(pair_keys) < share - int(share))
+
+        # samples of the pair are ranked by their hashes, the first ones are the test samples
+        keys = _uniform(pair_keys[..., np.newaxis] + np.arange(1, n_samples + 1, dtype=np.uint64) * _GOLDEN)
+        ranks = np.argsort(np.argsort(keys, axis=2), axis=2)
+        test = (ranks < n_test[..., np.newaxis]) & covered[..., np.newaxis]
+        table[test] = sinks.SPLITS.index(sinks.TEST)
+
+        return table
+
+    def compatible(self, charset: list, n_samples: int, split_ratio=0.2, holdout_ratio=0.) -> bool:
+        """Whether the table can be extended for a run with the given parameters.
+
+        The seed of the table is kept by the extension, so that the split does not change with the seed of the run.
+        """
+        return (list(charset) == self.charset and n_samples == self.n_samples and split_ratio == self.split_ratio
+                and holdout_ratio == self.holdout_ratio)
+
+    def extend(self, font_names: list, coverage: np.ndarray = None) -> 'SplitTable':
+        """Return table including also the given fonts, fonts in the table already keep their assignment.
+
+        :param coverage: coverage matrix of the `font_names`
+        """
+        new = [i for i, font_name in enumerate(font_names) if font_name not in self._fonts]
+        if not new:
+            return self
+
+        new_names = [font_names[i] for i in new]
+        table = self._assign(new_names, self.charset, self.n_samples, self.split_ratio, self.holdout_ratio,
+                             self.seed, None if coverage is None else np.asarray(coverage)[new])
+
+        return SplitTable(self.font_names + new_names, self.charset, self.n_samples,
+                          np.concatenate([self.table, table]), split_ratio=self.split_ratio,
+                          holdout_ratio=self.holdout_ratio, seed=self.seed)
+
+    def select(self, font_names: list) -> 'SplitTable':
+        """Return table of the given fonts, e.g. to be passed to a worker."""
+        rows = [self._fonts[font_name] for font_name in font_names]
+        return SplitTable(font_names, self.charset, self.n_samples, self.table[rows], split_ratio=self.split_ratio,
+                          holdout_ratio=self.holdout_ratio, seed=self.seed)
+
+    def subset(self, font_name: str, char: chr, index: int) -> str:
+        """Return subset of the sample, one of `sinks.SPLITS`."""
+        return sinks.SPLITS[self.table[self._fonts[font_name], self._chars[char], index]]
+
+    def __contains__(self, font_name):
+        return font_name in self._fonts
+
+    def save(self, path: str):
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        # np.savez appends the suffix to the temporary file name unless it has it already
+        tmp_path = "{}.{}.tmp.npz".format(path, os.getpid())
+        np.savez(tmp_path, table=self.table, font_names=np.array(self.font_names, dtype=str),
+                 charset=np.array(self.charset, dtype=str),
+                 params=np.array([self.split_ratio, self.holdout_ratio], dtype=np.float64), seed=self.seed)
+        os.replace(tmp_path, path)
+
+    @classmethod
+    def load(cls, path: str) -> 'SplitTable':
+        with np.load(path) as f:
+            split_ratio, holdout_ratio = f['params'].tolist()
+            table = f['table']
+            return cls(f['font_names'].tolist(), f['charset'].tolist(), table.shape[2], table,
+                       split_ratio=split_ratio, holdout_ratio=holdout_ratio, seed=int(f['seed']))
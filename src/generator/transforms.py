@@ -0,0 +1,236 @@
+"""Batched affine augmentation - lightweight replacement of Keras ImageDataGenerator.random_transform"""
+
+import numpy as np
+
+FILL_MODES = ('nearest', 'constant', 'reflect', 'wrap')
+# parameters of Keras ImageDataGenerator supported by `AffineAugmenter`
+AUGMENTATION_PARAMS = ('rotation_range', 'width_shift_range', 'height_shift_range', 'shear_range', 'zoom_range',
+                       'horizontal_flip', 'vertical_flip', 'fill_mode', 'cval')
+
+
+def transform_matrix(theta, shear, zx, zy, shape, tx=None, ty=None) -> np.ndarray:
+    """Compose rotation, shear and zoom into a single affine matrix per sample.
+
+    Follows the convention of Keras: angles are in degrees, the matrix maps output (row, col)
+    coordinates to the input ones and the transformation is centered in the image.
+
+    :param theta: rotation angles, array of shape (N,)
+    :param shear: shear angles, array of shape (N,)
+    :param zx: zoom along rows, array of shape (N,)
+    :param zy: zoom along columns, array of shape (N,)
+    :param shape: (height, width) of the images
+    :param tx: shift along rows in pixels, array of shape (N,) (default no shift)
+    :param ty: shift along columns in pixels, array of shape (N,) (default no shift)
+
+    :returns: array of shape (N, 3, 3)
+    """
+    theta = np.deg2rad(np.asarray(theta, dtype=np.float64))
+    shear = np.deg2rad(np.asarray(shear, dtype=np.float64))
+    zx = np.asarray(zx, dtype=np.float64)
+    zy = np.asarray(zy, dtype=np.float64)
+
+    cos, sin = np.cos(theta), np.sin(theta)
+
+    # rotation @ shear @ zoom multiplied out
+    a = np.empty((theta.shape[0], 3, 3))
+    a[:, 0, 0] = cos * zx
+    a[:, 0, 1] = (-cos * np.sin(shear) - sin * np.cos(shear)) * zy
+    a[:, 1, 0] = sin * zx
+    a[:, 1, 1] = (-sin * np.sin(shear) + cos * np.cos(shear)) * zy
+    a[:, 2] = (0, 0, 1)
+
+    # center the transformation: offset @ a @ reset
+    o = np.array([shape[0] / 2 - 0.5, shape[1] / 2 - 0.5])
+    a[:, :2, 2] = o - a[:, :2, :2] @ o
+
+    if tx is not None or ty is not None:
+        # rotation @ shift - the shift is applied before the rotation, as Keras does
+        tx = np.zeros_like(theta) if tx is None else np.asarray(tx, dtype=np.float64)
+        ty = np.zeros_like(theta) if ty is None else np.asarray(ty, dtype=np.float64)
+        a[:, 0, 2] += cos * tx - sin * ty
+        a[:, 1, 2] += sin * tx + cos * ty
+
+    return a
+
+
+def _fill_indices(idx, size, fill_mode):
+    """Map (possibly out of range) indices into the valid range according to `fill_mode`."""
+    if fill_mode == 'wrap':
+        return idx % size
+    if fill_mode == 'reflect':
+        # d c b a | a b c d | d c b a
+        period = 2 * size
+        idx = idx % period
+        return np.where(idx >= size, period - 1 - idx, idx)
+
+    return np.clip(idx, 0, size - 1)
+
+
+def affine_transform(batch: np.ndarray, matrices: np.ndarray, fill_mode='nearest', cval=0.) -> np.ndarray:
+    """Apply affine transformation to each image in the batch using bilinear interpolation.
+
+    :param batch: array of shape (N, H, W) or (N, H, W, C)
+    :param matrices: array of shape (N, 3, 3) mapping output (row, col) coordinates to the input ones
+    :param fill_mode: one of {'nearest', 'constant', 'reflect', 'wrap'}, points outside the boundaries
+    of the input are filled according to the given mode
+    :param cval: value used for points outside the boundaries when `fill_mode` is 'constant'
+
+    :returns: transformed batch of the same shape and dtype
+    """
+    height, width = batch.shape[1:3]
+    src = matrices[:, :2, :2] @ pixel_grid(height, width, dtype=np.float64) + matrices[:, :2, 2:]  # (N, 2, H*W)
+
+    return cast_like(interpolate(batch, src, fill_mode=fill_mode, cval=cval), batch)
+
+
+def pixel_grid(height, width, dtype=np.float32) -> np.ndarray:
+    """Return (row, col) coordinates of all pixels of an image, array of shape (2, H*W)."""
+    rows, cols = np.mgrid[0:height, 0:width]
+    return np.stack([rows.ravel(), cols.ravel()]).astype(dtype)
+
+
+def interpolate(batch: np.ndarray, src: np.ndarray, fill_mode='nearest', cval=0.) -> np.ndarray:
+    """Sample each image of the batch at the given coordinates using bilinear interpolation.
+
+    :param batch: array of shape (N, H, W) or (N, H, W, C)
+    :param src: input (row, col) coordinates of each output pixel, array of shape (N, 2, H*W)
+    :param fill_mode: see `affine_transform`
+    :param cval: see `affine_transform`
+
+    :returns: float array of the shape of the batch, float32 if `src` is float32, pixels are not rounded
+    """
+    if fill_mode not in FILL_MODES:
+        raise ValueError("Invalid fill mode '%s', expected one of %s" % (fill_mode, FILL_MODES))
+
+    n, height, width = batch.shape[:3]
+    channels = batch.shape[3:]
+    pixels = batch.reshape(n, height * width, -1)
+
+    r0 = np.floor(src[:, 0]).astype(np.intp)
+    c0 = np.floor(src[:, 1]).astype(np.intp)
+    fr = (src[:, 0] - r0)[..., np.newaxis]
+    fc = (src[:, 1] - c0)[..., np.newaxis]
+
+    batch_offset = (np.arange(n) * height * width)[:, np.newaxis]
+    flat = pixels.reshape(n * height * width, -1)
+
+    def gather(r, c):
+        values = flat[batch_offset + _fill_indices(r, height, fill_mode) * width
+                      + _fill_indices(c, width, fill_mode)].astype(np.float32)
+        if fill_mode == 'constant':
+            outside = (r < 0) | (r >= height) | (c < 0) | (c >= width)
+            values[outside] = cval
+        return values
+
+    out = ((gather(r0, c0) * (1 - fc) + gather(r0, c0 + 1) * fc) * (1 - fr)
+           + (gather(r0 + 1, c0) * (1 - fc) + gather(r0 + 1, c0 + 1) * fc) * fr)
+
+    return out.reshape((n, height, width) + channels)
+
+
+def cast_like(out: np.ndarray, batch: np.ndarray) -> np.ndarray:
+    """Cast interpolated images into the dtype of the batch, integer images are rounded and clipped in place."""
+    if np.issubdtype(batch.dtype, np.integer):
+        info = np.iinfo(batch.dtype)
+        out = np.clip(np.rint(out, out=out), info.min, info.max, out=out)
+
+    return out.astype(batch.dtype, copy=False)
+
+
+class AffineAugmenter:
+    """Random shift, shear, zoom, rotation and flips of image batches.
+
+    Accepts the same geometric parameters as Keras ImageDataGenerator (see `AUGMENTATION_PARAMS`),
+    all transformations of a sample are composed into a single affine matrix and the whole batch
+    is transformed at once.
+    """
+
+    def __init__(self, rotation_range=0., shear_range=0., zoom_range=0., fill_mode='nearest', cval=0., seed=None,
+                 width_shift_range=0., height_shift_range=0., horizontal_flip=False, vertical_flip=False):
+        """Initialize augmenter.
+
+        :param rotation_range: degree range for random rotations
+        :param shear_range: shear angle in counter-clockwise direction in degrees
+        :param zoom_range: range for random zoom, [1 - zoom_range, 1 + zoom_range] if float
+        :param fill_mode: one of {'nearest', 'constant', 'reflect', 'wrap'}
+        :param cval: value used for points outside the boundaries when `fill_mode` is 'constant'
+        :param seed: seed of the random number generator
+        :param width_shift_range: range of horizontal shifts, fraction of the width if < 1, pixels otherwise
+        :param height_shift_range: range of vertical shifts, fraction of the height if < 1, pixels otherwise
+        :param horizontal_flip: whether to randomly flip the samples horizontally
+        :param vertical_flip: whether to randomly flip the samples vertically
+        """
+        if np.isscalar(zoom_range):
+            zoom_range = (1 - zoom_range, 1 + zoom_range)
+        elif len(zoom_range) != 2:
+            raise ValueError("`zoom_range` should be a float or a tuple or list of two floats, "
+                             "received: %s" % (zoom_range,))
+
+        self.rotation_range = rotation_range
+        self.shear_range = shear_range
+        self.zoom_range = tuple(zoom_range)
+        self.fill_mode = fill_mode
+        self.cval = cval
+        self.width_shift_range = width_shift_range
+        self.height_shift_range = height_shift_range
+        self.horizontal_flip = horizontal_flip
+        self.vertical_flip = vertical_flip
+
+        self.rng = np.random.default_rng(seed)
+
+    def random_matrices(self, n, shape, rng: np.random.Generator = None) -> np.ndarray:
+        """Draw random transformation matrices for `n` samples of given shape."""
+        rng = rng or self.rng
+
+        theta = rng.uniform(-self.rotation_range, self.rotation_range, n) if self.rotation_range else np.zeros(n)
+        shear = rng.uniform(-self.shear_range, self.shear_range, n) if self.shear_range else np.zeros(n)
+        if self.zoom_range[0] == 1 and self.zoom_range[1] == 1:
+            zx = zy = np.ones(n)
+        else:
+            zx, zy = rng.uniform(self.zoom_range[0], self.zoom_range[1], (2, n))
+
+        # shifts are drawn only if requested, so that the other parameters do not depend on them
+        tx = ty = None
+        if self.height_shift_range:
+            tx = rng.uniform(-self.height_shift_range, self.height_shift_range, n)
+            tx *= shape[0] if self.height_shift_range < 1 else 1
+        if self.width_shift_range:
+            ty = rng.uniform(-self.width_shift_range, self.width_shift_range, n)
+            ty *= shape[1] if self.width_shift_range < 1 else 1
+
+        return transform_matrix(theta, shear, zx, zy, shape=shape, tx=tx, ty=ty)
+
+    def random_flips(self, n, rng: np.random.Generator = None) -> tuple:
+        """Draw which of `n` samples are flipped horizontally and vertically."""
+        rng = rng or self.rng
+        horizontal = rng.random(n) < 0.5 if self.horizontal_flip else np.zeros(n, dtype=bool)
+        vertical = rng.random(n) < 0.5 if self.vertical_flip else np.zeros(n, dtype=bool)
+
+        return horizontal, vertical
+
+    def transform_batch(self, batch: np.ndarray, rng: np.random.Generator = None, seeds=None) -> np.ndarray:
+        """Apply random transformation to each image of the batch of shape (N, H, W) or (N, H, W, C).
+
+        :param rng: random number generator the parameters of all samples are drawn from (default `self.rng`)
+        :param seeds: seed of each sample, the parameters of a sample then depend only on its seed
+        """
+        shape = batch.shape[1:3]
+        if seeds is None:
+            matrices = self.random_matrices(batch.shape[0], shape=shape, rng=rng)
+            horizontal, vertical = self.random_flips(batch.shape[0], rng=rng)
+        else:
+            rngs = [np.random.default_rng(seed) for seed in seeds]
+            matrices = np.concatenate([self.random_matrices(1, shape=shape, rng=r) for r in rngs])
+            flips = [self.random_flips(1, rng=r) for r in rngs]
+            horizontal = np.concatenate([h for h, _ in flips]) if flips else np.zeros(0, dtype=bool)
+            vertical = np.concatenate([v for _, v in flips]) if flips else np.zeros(0, dtype=bool)
+
+        out = affine_transform(batch, matrices, fill_mode=self.fill_mode, cval=self.cval)
+        out[horizontal] = out[horizontal, :, ::-1]
+        out[vertical] = out[vertical, ::-1]
+
+        return out
+
+    def random_transform(self, x: np.ndarray, rng: np.random.Generator = None) -> np.ndarray:
+        """Apply random transformation to a single image of shape (H, W) or (H, W, C)."""
+        return self.transform_batch(x[np.newaxis], rng=rng)[0]
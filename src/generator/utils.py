@@ -10,6 +10,29 @@ def get_file_name(file):
     return re.search(r"([^/]+)\.(\w+)$", file).group(1)
 
 
+def file_hash(path, algorithm='sha1', chunk_size=1 << 20) -> str:
+    """Return hex digest of the file content."""
+    import hashlib
+
+    digest = hashlib.new(algorithm)
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(chunk_size), b''):
+            digest.update(chunk)
+
+    return digest.hexdigest()
+
+
+def derive_seed(*keys) -> int:
+    """Derive 32-bit seed from the given keys.
+
+    Unlike `hash`, the result is stable across processes and interpreter runs.
+    """
+    import hashlib
+
+    digest = hashlib.sha256(repr(keys).encode('utf-8')).digest()
+    return int.from_bytes(digest[:4], 'little')
+
+
 def get_near_dim_2d(number, mode='wide') -> tuple:
     """Try to factor the number into two similiar dimensions."""
     from numpy import prod, argmin
@@ -24,30 +47,24 @@ def get_near_dim_2d(number, mode='wide') -> tuple:
     return tuple(sorted(shape, reverse=(mode == 'wide')))
 
 
-def estimate_font_size(font, text, fit_size, eps=3) -> int:
+def estimate_font_size(font, text, fit_size, eps=3, font_cache=None) -> int:
     """Estimate font size based on given text and fit_size.
 
-    :returns: ImageFont object.
-    """
+    The size is searched by bisection, fonts of tried sizes are loaded via `font_cache`.
 
-    font_size = font.size
-    w, h = font.getsize(text)
-    _err = max(fit_size) - max(w, h)
-
-    # Create pseudo-font that will be adjusted and tested against the fit_size
-    _font = font
-    while abs(_err) > eps:
-        w, h = _font.getsize(text)
-        _err = max(fit_size) - max(w, h)
+    :returns: font size
+    """
+    from .fontfit import fit_font_size
 
-        font_size += 1 if _err > 0 else -1
-        _font = ImageFont.truetype(font=font.path, encoding='utf-8', size=int(font_size))
+    return fit_font_size(font.path, text, fit_size=fit_size, eps=eps,
+                         font_cache=font_cache, size_hint=font.size)
 
-    return _font.size
 
+def create_whiteboard(shape=None, n_samples=None, fill='#f4f4f4', sample_size=(32, 32), mode='RGBA') -> Image.Image:
+    """Computes and Creates white board (background) for the given font.
 
-def create_whiteboard(shape=None, n_samples=None, fill='#f4f4f4', sample_size=(32, 32)) -> Image.Image:
-    """Computes and Creates white board (background) for the given font."""
+    :param mode: mode of the board, e.g. 'L' for single band boards (default 'RGBA')
+    """
     if not any([n_samples, shape]):
         print("Either `n_samples` or `shape` must be provided.")
         return
@@ -60,27 +77,31 @@ def create_whiteboard(shape=None, n_samples=None, fill='#f4f4f4', sample_size=(3
         assert len(shape) == 2, "expected `shape` argument to be 2-D vector, but is %i-D vector" % len(shape)
         bg_size = shape
 
-    return Image.new(mode='RGBA', size=bg_size, color=fill)
+    return Image.new(mode=mode, size=bg_size, color=fill)
 
 
-def get_text_loc_in_sample(text, font: ImageFont, sample_size, offset='random'):
-    """Calculates location of text on the given sample background."""
-    from functools import reduce
-    from numpy import subtract, floor_divide
+def get_text_loc_in_sample(text, font: ImageFont, sample_size, offset='random', rng: random.Random = None):
+    """Calculates location of text on the given sample background.
+
+    :param rng: random number generator for the random offset (default module `random`)
+    """
+    return get_text_loc(text_size=font.getsize(text), text_offset=font.getoffset(text),
+                        sample_size=sample_size, offset=offset, rng=rng)
 
-    fo_x, fo_y = font.getoffset(text)
-    font_offset = (fo_x, fo_y)
+
+def get_text_loc(text_size, text_offset, sample_size, offset='random', rng: random.Random = None):
+    """Calculates location of text of given metrics on the given sample background.
+
+    :param rng: random number generator for the random offset (default module `random`)
+    """
+    fo_x, fo_y = text_offset
 
     if offset == 'random':
         # add a little bit of entropy
+        rng = rng or random
         rand_factor = min(sample_size) // 10
-        font_offset = (
-            fo_x + random.randint(-rand_factor, rand_factor),
-            fo_y + random.randint(-rand_factor, rand_factor),
-        )
+        fo_x += rng.randint(-rand_factor, rand_factor)
+        fo_y += rng.randint(-rand_factor, rand_factor)
 
     # location of char in the sample
-    char_loc = reduce(subtract, (sample_size, font.getsize(text), font_offset))
-    char_loc = floor_divide(char_loc, 2)
-
-    return char_loc
+    return (sample_size[0] - text_size[0] - fo_x) // 2, (sample_size[1] - text_size[1] - fo_y) // 2
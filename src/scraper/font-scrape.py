@@ -7,96 +7,68 @@ NOTES
 - usually, the data you scrape should not be used for commercial purposes
 """
 
+import argparse
 import os
 import sys
 
-import re
-import requests
-
-from bs4 import BeautifulSoup
-
-
-BASE_URL = 'https://www.ceskefonty.cz/'
-FONT_DIR = os.path.abspath('fonts')
-
-
-response = requests.get(BASE_URL)
-soup = BeautifulSoup(response.content, 'html.parser')
-
-page_label = soup.find('div', attrs={'id': 'pages-top'})
-pages = page_label.find_all('li')[-1].text
-
-try:
-    # Get number of pages
-    pages = int(pages)
-except ValueError:
-    print("Wrong page index:", pages or '-', file=sys.stderr)
-    exit(1)
-
-# Create font directory
-# TODO: fix TOCTOU - implement file lock
-if not os.path.isdir(FONT_DIR):
-    os.mkdir(FONT_DIR)
-else:
-    if input("fonts folder already exists! Continue? [y/N]: ").lower() != 'y':
-        print("Exiting", file=sys.stderr)
+# the crawler lives next to this script, see scraper.py
+sys.path.insert(0, os.path.dirname(os.path.realpath(__file__)))
+
+from scraper import BASE_URL, DEFAULT_RATE, DEFAULT_WORKERS, FontScraper  # noqa: E402
+
+
+def parse_args(argv):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+
+    parser.add_argument(
+        '-o', '--font-dir',
+        default=os.path.abspath('fonts'),
+        help="Directory the fonts are downloaded into (`fonts` in the working directory by default)."
+    )
+    parser.add_argument(
+        '--base-url',
+        default=BASE_URL,
+        help="Url of the first listing page."
+    )
+    parser.add_argument(
+        '-j', '--workers',
+        type=int,
+        default=DEFAULT_WORKERS,
+        help="Maximum number of concurrent requests."
+    )
+    parser.add_argument(
+        '--rate',
+        type=float,
+        default=DEFAULT_RATE,
+        help="Maximum number of requests per second to a single host, 0 disables the limit."
+    )
+    parser.add_argument(
+        '--manifest',
+        help="Path to the download manifest, fonts recorded in it are not downloaded again "
+             "(`downloads.jsonl` in the font directory by default)."
+    )
+    parser.add_argument(
+        '-n', '--pages',
+        type=int,
+        help="Scrape only the first N listing pages."
+    )
+
+    return parser.parse_args(argv)
+
+
+def main(argv):
+    args = parse_args(argv)
+
+    scraper = FontScraper(args.font_dir, base_url=args.base_url, workers=args.workers, rate=args.rate,
+                          manifest_path=args.manifest)
+    try:
+        paths = scraper.scrape(pages=args.pages)
+    except ValueError as e:
+        print(e, file=sys.stderr)
         exit(1)
 
-_response_fail = 1
-for page in range(1, pages + 1):
-    url = BASE_URL + "?pg={page}".format(page=page)
-
-    # check for consecutive response fails
-    _response_fail = max(0, _response_fail - 1)
-
-    response = requests.get(url)
-    if not response.content:
-        print("Failed to get response from:", url, file=sys.stderr)
-        _response_fail += 1
-        if _response_fail >= 3:
-            exit(1)
-        continue
-
-    soup = BeautifulSoup(response.content, 'html.parser')
-
-    # Get detail urls - lambda prevents duplicate urls
-    details = soup.find_all(
-            lambda t: len(dict.get(t.attrs, 'class', [])) == 1,
-            attrs={'class': lambda c: c == 'detail'}
-            )
-
-    for detail in details:
-        detail_url = detail.find('a').get('href')
-        detail_content = requests.get(detail_url).content
-
-        # get download url
-        detail_sup = BeautifulSoup(detail_content, 'html.parser')
-        download_url = detail_sup.find(
-                'p', attrs={'class': 'detail'}
-                ).find('a').get('href')
-
-        search = re.search(r"([^/]+)\.(\w+)$", download_url)
-        if search is None:
-            print("Skipped url:", download_url, file=sys.stderr)
-            continue
-
-        font_name = search.group(1)
-        suffix = search.group(2)
-        file_name = "{}.{}".format(font_name, suffix)
-
-        font_dir = os.path.join(FONT_DIR, font_name)
-        try:
-            os.mkdir(font_dir)
-        except FileExistsError:
-            print("Skipped", font_name, file=sys.stderr)
-            continue
-
-        print("Downloading", font_name, "...")
-        content = requests.get(download_url).content
-
-        if content and type(content) is bytes:
-            with open(os.path.join(font_dir, file_name), 'wb') as font_file:
-                font_file.write(content)
+    print("Downloaded", len(paths), "fonts into", scraper.font_dir)
 
-            print("Written", font_dir)
 
+if __name__ == '__main__':
+    main(sys.argv[1:])
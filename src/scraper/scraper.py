@@ -0,0 +1,246 @@
+"""Concurrent font scraper.
+
+Listing pages, detail pages and font downloads are fetched by a pool of threads sharing one pooled HTTP
+session. Requests to each host are rate limited, downloads are streamed to disk and recorded in a download
+manifest, so that interrupted scraping can be resumed without fetching the same fonts again.
+
+NOTES
+-----
+- you should check a website’s Terms and Conditions before you scrape it
+- be careful to read the statements about legal use of data
+- usually, the data you scrape should not be used for commercial purposes
+"""
+
+import concurrent.futures
+import json
+import os
+import re
+import sys
+import threading
+import time
+
+from urllib.parse import urljoin, urlsplit
+
+import requests
+
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+BASE_URL = 'https://www.ceskefonty.cz/'
+DOWNLOAD_MANIFEST_FILE = 'downloads.jsonl'
+
+DEFAULT_WORKERS = 8
+DEFAULT_RATE = 4.  # requests per second per host
+CHUNK_SIZE = 64 * 1024
+
+
+def create_session(pool_size=DEFAULT_WORKERS, retries=3) -> requests.Session:
+    """Create session keeping up to `pool_size` connections per host alive, failed requests are retried."""
+    session = requests.Session()
+    adapter = HTTPAdapter(
+        pool_connections=pool_size,
+        pool_maxsize=pool_size,
+        max_retries=Retry(total=retries, backoff_factor=0.5, status_forcelist=(429, 500, 502, 503, 504)),
+    )
+    session.mount('http://', adapter)
+    session.mount('https://', adapter)
+
+    return session
+
+
+class RateLimiter:
+    """Limit the number of requests per second to each host, shared by all threads."""
+
+    def __init__(self, rate=DEFAULT_RATE):
+        """Initialize limiter.
+
+        :param rate: maximum number of requests per second to a single host, None or 0 disables the limit
+        """
+        self.interval = 1. / rate if rate else 0.
+        self._next = dict()
+        self._lock = threading.Lock()
+
+    def wait(self, url: str):
+        """Block until the next request to the host of `url` is allowed."""
+        if not self.interval:
+            return
+
+        host = urlsplit(url).netloc
+        with self._lock:
+            now = time.monotonic()
+            slot = max(now, self._next.get(host, now))
+            self._next[host] = slot + self.interval
+
+        if slot > now:
+            time.sleep(slot - now)
+
+
+class DownloadManifest:
+    """Append-only JSON lines record of finished downloads keyed by the download url."""
+
+    def __init__(self, path: str):
+        self.path = path
+        self.records = dict()
+        self._lock = threading.Lock()
+
+        if os.path.isfile(path):
+            with open(path) as f:
+                for line in f:
+                    try:
+                        record = json.loads(line)
+                    except ValueError:  # the last line might be incomplete if the run was interrupted
+                        continue
+                    self.records[record['url']] = record
+
+    def __contains__(self, url):
+        return url in self.records
+
+    def __len__(self):
+        return len(self.records)
+
+    def record(self, url, font_name, path, size):
+        record = dict(url=url, font=font_name, path=path, size=size)
+        with self._lock:
+            with open(self.path, 'a') as f:
+                f.write(json.dumps(record, ensure_ascii=False) + '\n')
+            self.records[url] = record
+
+
+class FontScraper:
+    """Scrape fonts listed on the pages of the font website into `font_dir/<font name>/`."""
+
+    def __init__(self, font_dir: str, base_url=BASE_URL, workers=DEFAULT_WORKERS, rate=DEFAULT_RATE,
+                 manifest_path: str = None, session: requests.Session = None, timeout=30):
+        """Initialize scraper.
+
+        :param font_dir: directory the fonts are downloaded into
+        :param base_url: url of the first listing page
+        :param workers: maximum number of concurrent requests
+        :param rate: maximum number of requests per second to a single host
+        :param manifest_path: path to the download manifest (default `font_dir/downloads.jsonl`)
+        :param session: session to be used (default pooled session sized for `workers`)
+        :param timeout: timeout of a single request in seconds
+        """
+        self.font_dir = os.path.abspath(font_dir)
+        self.base_url = base_url
+        self.workers = workers
+        self.timeout = timeout
+
+        self.session = session or create_session(pool_size=workers)
+        self.limiter = RateLimiter(rate)
+        self.manifest = DownloadManifest(manifest_path or os.path.join(self.font_dir, DOWNLOAD_MANIFEST_FILE))
+
+    def get(self, url: str, **kwargs) -> requests.Response:
+        """Rate limited GET request, raises `requests.HTTPError` on error status."""
+        self.limiter.wait(url)
+        response = self.session.get(url, timeout=self.timeout, **kwargs)
+        response.raise_for_status()
+
+        return response
+
+    def _soup(self, url: str):
+        from bs4 import BeautifulSoup
+
+        return BeautifulSoup(self.get(url).content, 'html.parser')
+
+    def page_count(self) -> int:
+        """Get number of listing pages from the first page."""
+        soup = self._soup(self.base_url)
+
+        page_label = soup.find('div', attrs={'id': 'pages-top'})
+        pages = page_label.find_all('li')[-1].text if page_label is not None else ''
+
+        try:
+            return int(pages)
+        except ValueError:
+            raise ValueError("Wrong page index: %s" % (pages or '-')) from None
+
+    def page_url(self, page: int) -> str:
+        return self.base_url + "?pg={page}".format(page=page)
+
+    def detail_urls(self, page: int) -> list:
+        """Get urls of the font detail pages listed on the given page."""
+        soup = self._soup(self.page_url(page))
+
+        # Get detail urls - lambda prevents duplicate urls
+        details = soup.find_all(
+            lambda t: len(dict.get(t.attrs, 'class', [])) == 1,
+            attrs={'class': lambda c: c == 'detail'}
+        )
+
+        return [urljoin(self.base_url, detail.find('a').get('href')) for detail in details]
+
+    def download_url(self, detail_url: str) -> str:
+        """Get font download url from the detail page."""
+        soup = self._soup(detail_url)
+
+        return urljoin(detail_url, soup.find('p', attrs={'class': 'detail'}).find('a').get('href'))
+
+    def download(self, url: str) -> str:
+        """Stream the font file into `font_dir/<font name>/`, return path to the file or None if skipped."""
+        if url in self.manifest:
+            return None
+
+        search = re.search(r"([^/]+)\.(\w+)$", urlsplit(url).path)
+        if search is None:
+            print("Skipped url:", url, file=sys.stderr)
+            return None
+
+        font_name = search.group(1)
+        file_name = "{}.{}".format(font_name, search.group(2))
+
+        font_dir = os.path.join(self.font_dir, font_name)
+        os.makedirs(font_dir, exist_ok=True)
+        path = os.path.join(font_dir, file_name)
+
+        print("Downloading", font_name, "...")
+        size = 0
+        with self.get(url, stream=True) as response:
+            # write into a temporary file first, so that an interrupted download is never taken as complete
+            with open(path + '.part', 'wb') as font_file:
+                for chunk in response.iter_content(chunk_size=CHUNK_SIZE):
+                    font_file.write(chunk)
+                    size += len(chunk)
+
+        if not size:
+            os.remove(path + '.part')
+            print("Empty response from:", url, file=sys.stderr)
+            return None
+
+        os.replace(path + '.part', path)
+        self.manifest.record(url, font_name, os.path.relpath(path, self.font_dir), size)
+
+        print("Written", font_dir)
+        return path
+
+    def _map(self, executor, fn, items) -> list:
+        """Apply `fn` to the items concurrently, failures are reported and skipped."""
+        futures = {executor.submit(fn, item): item for item in items}
+
+        results = list()
+        for future in concurrent.futures.as_completed(futures):
+            try:
+                results.append((futures[future], future.result()))
+            except (requests.RequestException, AttributeError, ValueError) as e:
+                print("Failed to scrape:", futures[future], "-", e, file=sys.stderr)
+
+        return results
+
+    def scrape(self, pages: int = None) -> list:
+        """Scrape fonts from all (or the first `pages`) listing pages.
+
+        :returns: paths to the newly downloaded font files
+        """
+        os.makedirs(self.font_dir, exist_ok=True)
+
+        pages = pages or self.page_count()
+        with concurrent.futures.ThreadPoolExecutor(max_workers=self.workers) as executor:
+            details = self._map(executor, self.detail_urls, range(1, pages + 1))
+            detail_urls = sorted({url for _, urls in details for url in urls})
+
+            downloads = self._map(executor, self.download_url, detail_urls)
+            download_urls = sorted({url for _, url in downloads} - set(self.manifest.records))
+
+            paths = self._map(executor, self.download, download_urls)
+
+        return sorted(path for _, path in paths if path is not None)
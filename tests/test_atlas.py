@@ -0,0 +1,81 @@
+import random
+import unittest
+
+import numpy as np
+from PIL import Image, ImageDraw, ImageFont
+
+from src.generator import utils
+from src.generator.atlas import CompiledCharset, GlyphAtlas
+from src.generator import imgen
+from src.generator.imgen import DEFAULT_FONT_PATH, CharImageGenerator
+
+
+class GlyphAtlasTests(unittest.TestCase):
+    """Tests for glyph atlas."""
+    TEST_CHARSET = ['A', 'a', '0', '.', '&', '^']
+
+    def test_render_matches_draw(self):
+        """Check that composed glyph matches the character drawn by PIL."""
+        font = ImageFont.truetype(DEFAULT_FONT_PATH, size=24)
+        atlas = GlyphAtlas()
+
+        for char in self.TEST_CHARSET:
+            expected = Image.new(mode='RGB', color='#f6f6f6', size=(32, 32))
+            char_loc = utils.get_text_loc_in_sample(char, font, sample_size=(32, 32), offset=None)
+            ImageDraw.Draw(expected).text(xy=tuple(char_loc), text=char, font=font, fill='black')
+
+            char_img = atlas.render(font, char, sample_size=(32, 32), offset=None)
+            self.assertTrue(np.array_equal(np.asarray(expected), np.asarray(char_img)), msg=char)
+
+    def test_glyph_cached(self):
+        font = ImageFont.truetype(DEFAULT_FONT_PATH, size=24)
+        atlas = GlyphAtlas()
+
+        for _ in range(3):
+            atlas.render(font, 'A')
+
+        self.assertEqual((atlas.misses, atlas.hits), (1, 2))
+
+    def test_memory_budget(self):
+        font = ImageFont.truetype(DEFAULT_FONT_PATH, size=24)
+        glyph_size = GlyphAtlas().get(font, 'A').nbytes
+        atlas = GlyphAtlas(max_bytes=glyph_size)
+
+        for char in self.TEST_CHARSET:
+            atlas.get(font, char)
+
+        self.assertLessEqual(atlas.nbytes, glyph_size)
+        self.assertEqual(len(atlas), 1)
+
+    def test_compiled_charset_locations(self):
+        """Check that the batch placement matches `utils.get_text_loc` of each sample."""
+        font = ImageFont.truetype(DEFAULT_FONT_PATH, size=24)
+        compiled = CompiledCharset(font, self.TEST_CHARSET, sample_size=(32, 28))
+        self.assertEqual(compiled.metrics.shape, (len(self.TEST_CHARSET), 4))
+
+        chars = [0, 3, 3, 5]
+        seeds = [7, 8, 9, 10]
+        expected = [utils.get_text_loc(text_size=font.getsize(self.TEST_CHARSET[i]),
+                                       text_offset=font.getoffset(self.TEST_CHARSET[i]), sample_size=(32, 28),
+                                       rng=random.Random(seed)) for i, seed in zip(chars, seeds)]
+        self.assertEqual(compiled.locations(chars, seeds=seeds).tolist(), [list(loc) for loc in expected])
+
+        locs = compiled.locations(chars, offset=None)
+        self.assertEqual(locs[1].tolist(), list(utils.get_text_loc_in_sample('.', font, (32, 28), offset=None)))
+
+    def test_compiled_charsets_cached(self):
+        """Metrics are cached by the font path and bounded, characters outside the charset are rendered too."""
+        gen = CharImageGenerator(charset=self.TEST_CHARSET, seed=0)
+        font = gen._get_font('default', (32, 32))
+
+        compiled = gen.compile_charset('default', font, sample_size=(32, 32))
+        self.assertIs(gen.compile_charset('default', font, sample_size=(32, 32)), compiled)
+        self.assertEqual(list(gen._compiled), [(DEFAULT_FONT_PATH, font.size, (32, 32))])
+
+        for size in range(imgen.COMPILED_CHARSETS + 1):
+            gen.compile_charset('default', font, sample_size=(size + 8, 32))
+        self.assertEqual(len(gen._compiled), imgen.COMPILED_CHARSETS)
+
+        samples = gen.render_char_samples('Z', 'default', 2, seeds=[1, 2], mode='L')
+        self.assertEqual(samples.shape, (2, 32, 32))
+        self.assertTrue((samples < 128).any())
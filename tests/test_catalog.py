@@ -0,0 +1,139 @@
+import os
+import shutil
+import tempfile
+import unittest
+
+from PIL import ImageFont
+
+from src.generator import CharImageGenerator
+from src.generator import catalog
+from src.generator.imgen import DEFAULT_FONT_PATH
+
+
+class FontCatalogTests(unittest.TestCase):
+    """Tests for the font catalog."""
+
+    def setUp(self):
+        self.font_dir = tempfile.mkdtemp()
+        for name in ('a', 'b'):
+            os.mkdir(os.path.join(self.font_dir, name))
+            shutil.copy(DEFAULT_FONT_PATH, os.path.join(self.font_dir, name, name + '.ttf'))
+
+    def test_read_cmap(self):
+        with open(DEFAULT_FONT_PATH, 'rb') as f:
+            codes = catalog.read_cmap(f.read())
+
+        self.assertIn(ord('A'), codes)
+        self.assertNotIn(ord('中'), codes)
+        self.assertRaises(ValueError, catalog.read_cmap, b'not a font')
+
+    def test_update_is_incremental(self):
+        font_catalog = catalog.FontCatalog()
+        self.assertEqual(len(font_catalog.update(self.font_dir)), 2)
+        self.assertEqual(font_catalog.update(self.font_dir), [])
+
+        path = os.path.join(self.font_dir, 'a', 'a.ttf')
+        os.utime(path, (0, 0))
+        self.assertEqual(font_catalog.update(self.font_dir), [path])
+
+        os.remove(path)
+        font_catalog.update(self.font_dir)
+        self.assertNotIn(path, font_catalog)
+
+    def test_invalid_font(self):
+        with open(os.path.join(self.font_dir, 'broken.ttf'), 'wb') as f:
+            f.write(b'not a font')
+
+        font_catalog = catalog.FontCatalog()
+        font_catalog.update(self.font_dir)
+
+        self.assertEqual(len(font_catalog), 3)
+        self.assertEqual(sorted(font_catalog.font_dict()), ['a', 'b'])
+
+    def test_partial_downloads_ignored(self):
+        shutil.copy(DEFAULT_FONT_PATH, os.path.join(self.font_dir, 'c.ttf.part'))
+
+        font_catalog = catalog.FontCatalog()
+        font_catalog.update(self.font_dir)
+        self.assertEqual(len(font_catalog), 2)
+
+    def test_save_and_load(self):
+        catalog_path = os.path.join(tempfile.mkdtemp(), catalog.CATALOG_FILE)
+        font_catalog = catalog.FontCatalog(catalog_path)
+        font_catalog.update(self.font_dir)
+        font_catalog.save()
+
+        loaded = catalog.FontCatalog(catalog_path)
+        self.assertEqual(loaded.fonts, font_catalog.fonts)
+        self.assertEqual(loaded.update(self.font_dir), [])
+
+        path = os.path.join(self.font_dir, 'a', 'a.ttf')
+        self.assertTrue(loaded.covers(path, 'Aa0'))
+        self.assertFalse(loaded.covers(path, 'A中'))
+        self.assertEqual(loaded.fonts[path]['family'], ImageFont.truetype(path).getname()[0])
+
+    def test_coverage_matrix(self):
+        font_catalog = catalog.FontCatalog()
+        font_catalog.update(self.font_dir)
+
+        paths = [os.path.join(self.font_dir, name, name + '.ttf') for name in ('a', 'b')]
+        matrix = catalog.coverage_matrix(paths + ['missing.ttf'], ['A', '中', 'é', 'Ab'], catalog=font_catalog)
+
+        # coverage of the missing font is unknown
+        self.assertSequenceEqual(matrix.tolist(), [[True, False, True, True]] * 2 + [[True] * 4])
+        self.assertTrue((catalog.coverage_matrix(paths, ['A', '中', 'é', 'Ab']) == matrix[:2]).all())
+
+    def test_lazy_font_dict(self):
+        font_catalog = catalog.FontCatalog()
+        font_catalog.update(self.font_dir)
+
+        font_dct = font_catalog.font_dict()
+        self.assertEqual(font_dct._fonts, {})
+        self.assertEqual(catalog.font_path(font_dct, 'a'), os.path.join(self.font_dir, 'a', 'a.ttf'))
+        self.assertEqual(font_dct._fonts, {})
+
+        self.assertIs(font_dct['a'], font_dct['a'])
+        self.assertEqual(list(font_dct._fonts), ['a'])
+
+    def test_generator_load(self):
+        charset_path = os.path.join(self.font_dir, 'charset.txt')
+        with open(charset_path, 'w') as f:
+            f.write('A\nb\n')
+
+        gen = CharImageGenerator.load(charset_path=charset_path, fonts_path=self.font_dir)
+        self.assertTrue(os.path.isfile(os.path.join(self.font_dir, catalog.CATALOG_FILE)))
+
+        # both fonts are copies of the same file, it is loaded once
+        images, labels, _ = gen.render_batch(sample_size=(16, 16))
+        self.assertEqual(images.shape, (2, 16, 16, 3))
+
+    def test_archives(self):
+        """Fonts are read straight out of the zip archives, identical fonts are loaded once."""
+        import zipfile
+
+        with open(os.path.join(self.font_dir, 'c.ttf'), 'wb') as f:
+            f.write(b'not a font')
+        with zipfile.ZipFile(os.path.join(self.font_dir, 'a', 'a.zip'), 'w') as f:
+            f.write(DEFAULT_FONT_PATH, 'fonts/zipped.ttf')
+            f.write(os.path.join(self.font_dir, 'c.ttf'), 'broken.ttf')
+            f.writestr('readme.txt', 'license')
+        with open(os.path.join(self.font_dir, 'broken.zip'), 'wb') as f:
+            f.write(b'not an archive')
+
+        zipped = catalog.archives.join_path(os.path.join(self.font_dir, 'a', 'a.zip'), 'fonts/zipped.ttf')
+        font_catalog = catalog.FontCatalog()
+        font_catalog.update(self.font_dir, workers=2)
+
+        self.assertEqual(len(font_catalog), 5)
+        self.assertEqual(font_catalog.fonts[zipped]['hash'], font_catalog.fonts[
+            os.path.join(self.font_dir, 'a', 'a.ttf')]['hash'])
+        self.assertEqual(font_catalog.update(self.font_dir), [])
+        self.assertEqual(list(font_catalog.duplicates().values()), [sorted([
+            os.path.join(self.font_dir, 'a', 'a.ttf'), zipped, os.path.join(self.font_dir, 'b', 'b.ttf')])])
+
+        self.assertEqual(sorted(font_catalog.font_dict()), ['a', 'b', 'zipped'])
+        font_dct = font_catalog.font_dict(unique=True)
+        self.assertEqual(list(font_dct), ['a'])
+
+        gen = CharImageGenerator(font_dct=catalog.LazyFontDict({'zipped': zipped}), charset=['A'])
+        self.assertEqual(gen.render_batch()[0].shape, (1, 32, 32, 3))
@@ -2,14 +2,33 @@ import os
 import tempfile
 import unittest
 
+import numpy as np
 from numpy import array_equal
 from skimage import io
 
 from src.generator import data_augmentation as daug
 
 
-TEST_DATA_ONES = os.path.abspath('test_data/49')
-TEST_DATA_THREES = os.path.abspath('test_data/51')
+TEST_DATA_ONES = None
+TEST_DATA_THREES = None
+
+
+def setUpModule():
+    """Draw test images of the characters '1' and '3' into a temporary directory."""
+    from PIL import Image, ImageDraw, ImageFont
+    global TEST_DATA_ONES, TEST_DATA_THREES
+
+    test_data = tempfile.mkdtemp(prefix='test_', suffix='_images')
+    TEST_DATA_ONES = os.path.join(test_data, '49')
+    TEST_DATA_THREES = os.path.join(test_data, '51')
+
+    font = ImageFont.load_default()
+    for char, path in (('1', TEST_DATA_ONES), ('3', TEST_DATA_THREES)):
+        os.makedirs(path)
+        for i in range(3):
+            image = Image.new(mode='RGB', size=(32, 32), color='#f6f6f6')
+            ImageDraw.Draw(image).text(xy=(12 + i, 10 - i), text=char, font=font, fill='black')
+            image.save(os.path.join(path, 'sample_{}.png'.format(i)))
 
 
 class TestDataAugmentation(unittest.TestCase):
@@ -18,7 +37,7 @@ class TestDataAugmentation(unittest.TestCase):
     def test_random_rotation(self):
         """Test random rotation."""
         images = [
-            io.imread(os.path.join(TEST_DATA_ONES, fp), as_grey=True)
+            io.imread(os.path.join(TEST_DATA_ONES, fp), as_gray=True)
             for fp in os.listdir(TEST_DATA_ONES)
         ]
         img = images[0]
@@ -30,7 +49,7 @@ class TestDataAugmentation(unittest.TestCase):
     def test_random_noise(self):
         """Test random noise."""
         images = [
-            io.imread(os.path.join(TEST_DATA_ONES, fp), as_grey=True)
+            io.imread(os.path.join(TEST_DATA_ONES, fp), as_gray=True)
             for fp in os.listdir(TEST_DATA_ONES)
         ]
         img = images[0]
@@ -42,7 +61,7 @@ class TestDataAugmentation(unittest.TestCase):
     def test_random_translation(self):
         """Test random translation."""
         images = [
-            io.imread(os.path.join(TEST_DATA_ONES, fp), as_grey=True)
+            io.imread(os.path.join(TEST_DATA_ONES, fp), as_gray=True)
             for fp in os.listdir(TEST_DATA_ONES)
         ]
         img = images[0]
@@ -54,7 +73,7 @@ class TestDataAugmentation(unittest.TestCase):
     def test_random_warp(self):
         """Test random warp."""
         images = [
-            io.imread(os.path.join(TEST_DATA_ONES, fp), as_grey=True)
+            io.imread(os.path.join(TEST_DATA_ONES, fp), as_gray=True)
             for fp in os.listdir(TEST_DATA_ONES)
         ]
         img = images[0]
@@ -63,6 +82,79 @@ class TestDataAugmentation(unittest.TestCase):
         self.assertTrue(transformed_img.any())
         self.assertFalse(array_equal(img, transformed_img))
 
+    def test_batch_random_warp(self):
+        """Test batched random warp shifts rows as np.roll does."""
+        img = io.imread(os.path.join(TEST_DATA_ONES, os.listdir(TEST_DATA_ONES)[0]), as_gray=True)
+        batch = np.stack([img, img[::-1]])
+
+        rng = np.random.default_rng(0)
+        a = img.shape[1] / rng.integers(4, 8, size=2, endpoint=True)
+        w = rng.uniform(-1.0, 1.0, size=2) / img.shape[0]
+
+        warped = daug.batch_random_warp(batch, rng=np.random.default_rng(0))
+        for k in range(len(batch)):
+            for i in range(img.shape[0]):
+                shift = int(np.ceil(a[k] * np.sin(2.0 * np.pi * i * w[k])))
+                self.assertTrue(array_equal(warped[k, i], np.roll(batch[k, i], shift)))
+
+    def test_batch_transformations(self):
+        """Test batched transformations keep the shape of the stack."""
+        img = io.imread(os.path.join(TEST_DATA_ONES, os.listdir(TEST_DATA_ONES)[0]), as_gray=True)
+        batch = np.stack([img, img]).astype(np.float32)
+
+        for transformation in daug.BATCH_TRANSFORMATIONS.values():
+            transformed = transformation(batch, rng=np.random.default_rng(0))
+            self.assertEqual(transformed.shape, batch.shape)
+            self.assertFalse(array_equal(batch, transformed))
+
+    def test_transform_batch_seeds(self):
+        """With seeds, transformed images do not depend on the way they are batched."""
+        rng = np.random.default_rng(0)
+        images = list(rng.random((6, 16, 16)).astype(np.float32))
+        transformations = [daug.random_rotation, daug.random_noise, daug.random_translation, daug.random_warp] * 2
+        transformations = transformations[:6]
+        seeds = list(range(6))
+
+        whole = daug._transform_batch(images, transformations, seeds=seeds)
+        halves = (daug._transform_batch(images[:3], transformations[:3], seeds=seeds[:3]) +
+                  daug._transform_batch(images[3:], transformations[3:], seeds=seeds[3:]))
+
+        for a, b in zip(whole, halves):
+            self.assertTrue(array_equal(a, b))
+
+    def test_batch_random_chain(self):
+        """Fused chain of one transformation matches the separate transformation, the chain keeps the dtype."""
+        rng = np.random.default_rng(0)
+        images = (rng.random((4, 16, 16)) * 255).astype(np.uint8)
+
+        for transformation in (daug.random_translation, daug.random_warp):
+            separate = daug.BATCH_TRANSFORMATIONS[transformation](images, rng=np.random.default_rng(1))
+            fused = daug.batch_random_chain(images, rng=np.random.default_rng(1), chain=(transformation,))
+            self.assertTrue(array_equal(separate, fused), msg=transformation.__name__)
+
+        separate = daug.batch_random_rotation(images, rng=np.random.default_rng(1))
+        fused = daug.batch_random_chain(images, rng=np.random.default_rng(1), chain=(daug.random_rotation,))
+        self.assertLessEqual(np.abs(separate.astype(int) - fused).max(), 1)
+
+        chained = daug.batch_random_chain(images / np.float32(255), rng=np.random.default_rng(1))
+        self.assertEqual(chained.dtype, np.float32)
+        self.assertTrue(0 <= chained.min() and chained.max() <= 1)
+        self.assertRaises(ValueError, daug.batch_random_chain, images, chain=(daug.random_chain,))
+
+    def test_apply_random_transform_chain(self):
+        """Test fused chain applied to every image is the same for any batch size."""
+        outputs = list()
+        for batch_size in (1, 3):
+            output_folder = tempfile.mkdtemp(prefix='test_', suffix='_augment')
+            daug.apply_random_transformation(input_folder=TEST_DATA_ONES, output_folder=output_folder, limit=4,
+                                             batch_size=batch_size, seed=0, chain=daug.DEFAULT_CHAIN)
+            outputs.append([io.imread(os.path.join(output_folder, '49', f))
+                            for f in sorted(os.listdir(os.path.join(output_folder, '49')))])
+
+        self.assertEqual(len(outputs[0]), 4)
+        for a, b in zip(*outputs):
+            self.assertTrue(array_equal(a, b))
+
     def test_apply_random_transform(self):
         """Test random transformation."""
         output_folder = tempfile.mkdtemp(prefix='test_', suffix='_augment')
@@ -78,3 +170,20 @@ class TestDataAugmentation(unittest.TestCase):
             len(os.listdir(os.path.join(output_folder, '49'))),
             limit
         )
+
+    def test_apply_random_transform_batched(self):
+        """Test random transformation in batches with multiple workers."""
+        output_folder = tempfile.mkdtemp(prefix='test_', suffix='_augment')
+        limit = 5
+        daug.apply_random_transformation(
+            input_folder=TEST_DATA_ONES,
+            output_folder=output_folder,
+            limit=limit,
+            workers=2,
+            batch_size=2
+        )
+
+        self.assertEqual(
+            len(os.listdir(os.path.join(output_folder, '49'))),
+            limit
+        )
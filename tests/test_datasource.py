@@ -0,0 +1,93 @@
+import unittest
+
+import numpy as np
+
+from src.generator import CharImageGenerator
+from src.generator.datasource import GeneratedDataset, prefetch
+
+
+class GeneratedDatasetTests(unittest.TestCase):
+    """Tests for the on-the-fly dataset."""
+
+    TEST_CHARSET = ['A', 'a', '0', '.', '&', '^', '中']
+
+    def setUp(self):
+        self.gen = CharImageGenerator(charset=self.TEST_CHARSET, seed=0)
+
+    def test_keys(self):
+        dataset = GeneratedDataset(self.gen, n_samples=3)
+
+        # the font has no glyph for the last character
+        self.assertEqual(len(dataset), 6 * 3)
+        self.assertEqual(dataset.key(0), ('default', 'A', 0))
+        self.assertEqual(dataset.key(len(dataset) - 1), ('default', '^', 2))
+
+    def test_get_batch(self):
+        dataset = GeneratedDataset(self.gen, n_samples=3, mode='L', sample_size=(24, 16))
+        images, labels = dataset.get_batch([0, 4, 17])
+
+        self.assertEqual(images.shape, (3, 16, 24))
+        self.assertEqual(images.dtype, np.uint8)
+        self.assertSequenceEqual(labels.tolist(), [ord('A'), ord('a'), ord('^')])
+
+        # bilevel samples are the thresholded grayscale ones
+        bilevel, _ = GeneratedDataset(self.gen, n_samples=3, mode='1', sample_size=(24, 16)).get_batch([0, 4, 17])
+        self.assertEqual(bilevel.dtype, bool)
+        self.assertTrue((bilevel == (images >= 128)).all())
+
+    def test_samples_of_the_dataset(self):
+        """Without fresh epochs, the samples are those of `create_and_save_charsets`."""
+        dataset = GeneratedDataset(self.gen, n_samples=3, fresh=False)
+        images, _ = dataset.get_batch(range(6), epoch=5)
+
+        for image, i in zip(images, range(6)):
+            font_name, char, index = dataset.key(i)
+            self.assertTrue((image == self.gen.generate_sample(font_name, char, index, n_samples=3)).all())
+
+    def test_batches(self):
+        dataset = GeneratedDataset(self.gen, n_samples=3)
+
+        def epoch(**kwargs):
+            return np.concatenate([images for images, _ in dataset.batches(batch_size=4, **kwargs)])
+
+        self.assertEqual(len(epoch()), len(dataset))
+        # independent of the number of workers, fresh samples every epoch
+        self.assertTrue((epoch(workers=1) == epoch(workers=3)).all())
+        self.assertFalse((epoch(epoch=0) == epoch(epoch=1)).all())
+
+        self.assertEqual(len(list(dataset.batches(batch_size=4, drop_last=True))), len(dataset) // 4)
+        self.assertEqual(len(list(dataset.stream(batch_size=len(dataset), epochs=3))), 3)
+
+    def test_prefetch(self):
+        self.assertEqual(list(prefetch(lambda x: x * x, range(10), workers=3, depth=2)), [x * x for x in range(10)])
+
+        # the consumer may stop early
+        stream = prefetch(lambda x: x, iter(int, 1))
+        self.assertEqual(next(stream), 0)
+        stream.close()
+
+    def test_keras_sequence(self):
+        try:
+            import tensorflow  # noqa: F401
+        except ImportError:
+            self.skipTest("tensorflow is not installed")
+
+        dataset = GeneratedDataset(self.gen, n_samples=3)
+        sequence = dataset.keras_sequence(batch_size=4, rescale=1 / 255)
+
+        self.assertEqual(len(sequence), 5)
+        images, classes = sequence[0]
+        self.assertEqual(images.shape, (4, 32, 32, 3))
+        self.assertLessEqual(images.max(), 1.)
+        self.assertTrue((classes < len(dataset.classes)).all())
+
+        sequence.on_epoch_end()
+        self.assertEqual(sequence.epoch, 1)
+        self.assertEqual(len(sequence[4][0]), 2)
+
+        # sequences share the thread pool, closing a sequence cancels its prefetched batches
+        other = dataset.keras_sequence(batch_size=4)
+        self.assertIs(other._executor, sequence._executor)
+        other[0]
+        other.close()
+        self.assertFalse(other._pending)
@@ -0,0 +1,52 @@
+import os
+import tempfile
+import unittest
+
+from src.generator import fontfit
+from src.generator.imgen import DEFAULT_FONT_PATH
+
+
+class FontFitTests(unittest.TestCase):
+    """Tests for font size fitting."""
+
+    def test_font_cache_lru(self):
+        cache = fontfit.FontCache(maxsize=2)
+        font = cache.get(DEFAULT_FONT_PATH, 10)
+
+        self.assertIs(cache.get(DEFAULT_FONT_PATH, 10), font)
+        cache.get(DEFAULT_FONT_PATH, 11)
+        cache.get(DEFAULT_FONT_PATH, 12)
+
+        self.assertEqual(len(cache), 2)
+        self.assertIsNot(cache.get(DEFAULT_FONT_PATH, 10), font)
+
+    def test_fit_font_size(self):
+        cache = fontfit.FontCache()
+        size = fontfit.fit_font_size(DEFAULT_FONT_PATH, 'H', fit_size=(32, 32), font_cache=cache)
+
+        self.assertLessEqual(max(cache.get(DEFAULT_FONT_PATH, size).getsize('H')), 32)
+        self.assertGreater(max(cache.get(DEFAULT_FONT_PATH, size + 1).getsize('H')), 32)
+
+    def test_empty_cache_used(self):
+        """An empty cache of the caller is used, not replaced by a new one."""
+        cache = fontfit.FontCache()
+        self.assertIs(fontfit.FontSizeEstimator(font_cache=cache).fonts, cache)
+
+        fontfit.fit_font_size(DEFAULT_FONT_PATH, 'H', fit_size=(32, 32), font_cache=cache)
+        self.assertGreater(len(cache), 0)
+
+    def test_estimator_persists_sizes(self):
+        fd, cache_path = tempfile.mkstemp(suffix='.json')
+        os.close(fd)
+        os.remove(cache_path)
+
+        estimator = fontfit.FontSizeEstimator(cache_path=cache_path)
+        size = estimator.estimate(DEFAULT_FONT_PATH, sample_size=(32, 32))
+        estimator.save()
+
+        self.assertTrue(os.path.isfile(cache_path))
+
+        estimator = fontfit.FontSizeEstimator(cache_path=cache_path)
+        self.assertEqual(estimator.estimate(DEFAULT_FONT_PATH, sample_size=(32, 32)), size)
+        # the size has been loaded from the cache, no font had to be loaded
+        self.assertEqual(estimator.fonts.misses, 0)
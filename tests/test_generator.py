@@ -3,6 +3,7 @@ import tempfile
 import unittest
 
 from src.generator import CharImageGenerator
+from src.generator import utils
 
 
 class GeneratorTests(unittest.TestCase):
@@ -74,12 +75,185 @@ class GeneratorTests(unittest.TestCase):
         gen.create_and_save_charsets(test_train_split=True, n_samples=n_samples, augment=True)
 
         # check that the dataset has been split into the test and train directory
-        self.assertEqual(set(os.listdir(prefix)), {'test_data', 'train_data'})
+        self.assertEqual(set(os.listdir(prefix)), {'test_data', 'train_data', 'split.npz'})
         #   and that they are not empty
         expected_img_count = len(self.TEST_CHARSET) * n_samples
         img_count = 0
         for root, _, walkfiles in os.walk(prefix):
-            img_count += len(walkfiles)
+            img_count += sum(f.endswith('.png') for f in walkfiles)
 
         self.assertEqual(img_count, expected_img_count, msg="Number of created images"
                                                             " does not match the expected value.")
+        # pipeline statistics count images
+        self.assertEqual([stats.items for stats in gen.stage_stats], [expected_img_count] * 4)
+
+    def test_create_and_save_charsets_parallel(self):
+        """Check that parallel generation produces the same directory structure as the sequential one."""
+        n_samples = 3
+
+        def list_files(prefix):
+            return sorted(
+                os.path.relpath(os.path.join(root, f), prefix)
+                for root, _, walkfiles in os.walk(prefix) for f in walkfiles
+            )
+
+        def read_file(prefix, path):
+            with open(os.path.join(prefix, path), 'rb') as f:
+                return f.read()
+
+        prefix = tempfile.mkdtemp()
+        gen = CharImageGenerator(out_dir=prefix, charset=self.TEST_CHARSET)
+        gen.create_and_save_charsets(test_train_split=True, n_samples=n_samples, augment=True, seed=0)
+
+        parallel_prefix = tempfile.mkdtemp()
+        gen = CharImageGenerator(out_dir=parallel_prefix, charset=self.TEST_CHARSET)
+        gen.create_and_save_charsets(test_train_split=True, n_samples=n_samples, augment=True, seed=0, workers=2)
+
+        # same train/test assignment and the same images
+        files = list_files(prefix)
+        self.assertEqual(files, list_files(parallel_prefix))
+        for path in files:
+            self.assertEqual(read_file(prefix, path), read_file(parallel_prefix, path), msg=path)
+
+    def test_seed(self):
+        """Samples depend only on the seed, any sample of the dataset can be regenerated."""
+        import numpy as np
+        from PIL import Image
+
+        def generate(seed):
+            gen = CharImageGenerator(charset=self.TEST_CHARSET, seed=seed)
+            return [np.asarray(img) for _, _, img in gen.generate_char_images(augment=True, n_samples=3)]
+
+        self.assertTrue(all((a == b).all() for a, b in zip(generate(3), generate(3))))
+        self.assertFalse(all((a == b).all() for a, b in zip(generate(3), generate(4))))
+
+        prefix = tempfile.mkdtemp()
+        gen = CharImageGenerator(out_dir=prefix, charset=self.TEST_CHARSET, seed=3)
+        gen.create_and_save_charsets(test_train_split=False, n_samples=3, augment=True)
+        for index in range(3):
+            path = os.path.join(prefix, 'charset', str(ord('A')), 'default_{}.png'.format(index))
+            self.assertTrue((np.asarray(Image.open(path)) == gen.generate_sample('default', 'A', index,
+                                                                                 n_samples=3)).all())
+
+        # the first, not augmented sample is positioned as in the batch
+        images, labels, _ = gen.render_batch()
+        self.assertTrue((images[0] == gen.generate_sample('default', 'A', 0, n_samples=3)).all())
+
+    def test_render_batch(self):
+        import numpy as np
+        gen = CharImageGenerator(charset=self.TEST_CHARSET)
+
+        images, labels, font_indices = gen.render_batch(sample_size=(32, 24))
+        self.assertEqual(images.shape, (len(self.TEST_CHARSET), 24, 32, 3))
+        self.assertEqual(images.dtype, np.uint8)
+        self.assertSequenceEqual(labels.tolist(), [ord(c) for c in self.TEST_CHARSET])
+        self.assertFalse(font_indices.any())
+
+        images, _, _ = gen.render_batch(grayscale=True)
+        self.assertEqual(images.shape, (len(self.TEST_CHARSET), 32, 32))
+        # every character has been drawn
+        self.assertTrue((images.min(axis=(1, 2)) < images.max(axis=(1, 2))).all())
+
+    def test_modes(self):
+        """Single band modes are kept single band from rendering to the written files."""
+        import numpy as np
+        from PIL import Image
+
+        gen = CharImageGenerator(charset=self.TEST_CHARSET, seed=0)
+        gray, _, _ = gen.render_batch(mode='L')
+        bilevel, _, _ = gen.render_batch(mode='1')
+        self.assertEqual(bilevel.dtype, bool)
+        self.assertTrue((bilevel == (gray >= 128)).all())
+
+        with self.assertRaises(ValueError):
+            gen.render_batch(mode='CMYK')
+
+        prefix = tempfile.mkdtemp()
+        gen = CharImageGenerator(out_dir=prefix, charset=self.TEST_CHARSET, seed=0)
+        gen.create_and_save_charsets(test_train_split=False, n_samples=2, augment=True, mode='1')
+        for index in range(2):
+            image = Image.open(os.path.join(prefix, 'charset', str(ord('A')), 'default_{}.png'.format(index)))
+            self.assertEqual(image.mode, '1')
+            self.assertTrue((np.asarray(image) == gen.generate_sample('default', 'A', index, n_samples=2,
+                                                                      mode='1')).all())
+
+    def test_skip_unsupported_chars(self):
+        """Characters the font has no glyph for are not generated."""
+        charset = self.TEST_CHARSET + ['中']
+        gen = CharImageGenerator(charset=charset)
+
+        self.assertSequenceEqual(gen.coverage().tolist(), [[True] * len(self.TEST_CHARSET) + [False]])
+
+        _, labels, _ = gen.render_batch()
+        self.assertNotIn(ord('中'), labels.tolist())
+        self.assertEqual(len(list(gen.generate_char_images())), len(self.TEST_CHARSET))
+
+        gen = CharImageGenerator(charset=charset, check_coverage=False)
+        self.assertEqual(len(list(gen.generate_char_images())), len(charset))
+
+    def test_create_sprites_rerun(self):
+        """Existing sprite boards are skipped, so that an interrupted run can be resumed."""
+        prefix = tempfile.mkdtemp()
+        gen = CharImageGenerator(out_dir=prefix, charset=self.TEST_CHARSET)
+        gen.create_sprites()
+        gen.create_sprites()
+
+        self.assertEqual(os.listdir(os.path.join(prefix, 'sprites')), ['default-board.png'])
+
+    def test_create_sprites_atlas(self):
+        """Boards and the combined atlas hold the same tiles, cells of unsupported characters are blank."""
+        import json
+        import numpy as np
+        from PIL import Image, ImageFont
+
+        charset = self.TEST_CHARSET + ['中']
+        font_dct = {name: ImageFont.truetype('fonts/default.ttf', size=20) for name in ('a', 'b', 'c')}
+        prefix = tempfile.mkdtemp()
+        gen = CharImageGenerator(out_dir=prefix, font_dct=font_dct, charset=charset)
+        gen.create_sprites(sample_size=(16, 16), workers=2, atlas=True)
+
+        sprites_dir = os.path.join(prefix, 'sprites')
+        with open(os.path.join(sprites_dir, 'atlas.json')) as f:
+            self.assertEqual(json.load(f)['fonts'], ['a', 'b', 'c'])
+
+        atlas = np.load(os.path.join(sprites_dir, 'atlas.npy'))
+        self.assertEqual(atlas.shape, (3, len(charset), 16, 16))
+        # the last character is not covered by the font
+        self.assertTrue((atlas[:, -1] == atlas[0, -1, 0, 0]).all())
+        self.assertTrue((atlas[:, :-1].min(axis=(2, 3)) < atlas[:, :-1].max(axis=(2, 3))).all())
+
+        cols, _ = utils.get_near_dim_2d(len(charset))
+        board = np.asarray(Image.open(os.path.join(sprites_dir, 'b-board.png')))
+        for i in range(len(charset)):
+            row, col = divmod(i, cols)
+            self.assertTrue((board[16 * row:16 * (row + 1), 16 * col:16 * (col + 1)] == atlas[1, i]).all())
+
+    def test_check_coverage_parallel(self):
+        """Workers respect `check_coverage` of the parent generator."""
+        charset = self.TEST_CHARSET + ['中']
+        prefix = tempfile.mkdtemp()
+        gen = CharImageGenerator(out_dir=prefix, charset=charset, check_coverage=False)
+        gen.create_and_save_charsets(test_train_split=False, n_samples=1, augment=False, workers=2)
+
+        self.assertEqual(len(os.listdir(os.path.join(prefix, 'charset', str(ord('中'))))), 1)
+
+    def test_profile_parallel(self):
+        """Profiles of the worker processes are merged into the generator's profiler."""
+        n_samples = 3
+        gen = CharImageGenerator(out_dir=tempfile.mkdtemp(), charset=self.TEST_CHARSET, profile=True)
+        gen.create_and_save_charsets(test_train_split=True, n_samples=n_samples, augment=True, workers=2)
+
+        expected_img_count = len(self.TEST_CHARSET) * n_samples
+        self.assertEqual(gen.profiler.stages['write'][1], expected_img_count)
+        self.assertEqual(gen.profiler.font_times()['default'][0], expected_img_count)
+        self.assertIn('augment', gen.profiler.summary())
+
+    def test_generate_char_images_augmentation_params(self):
+        gen = CharImageGenerator(charset=self.TEST_CHARSET)
+
+        images = list(gen.generate_char_images(augment=True, n_samples=2, width_shift_range=0.1,
+                                               horizontal_flip=True))
+        self.assertEqual(len(images), len(self.TEST_CHARSET) * 2)
+
+        with self.assertRaises(ValueError):
+            list(gen.generate_char_images(augment=True, brightness_range=(0.5, 1.5)))
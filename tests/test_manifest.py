@@ -0,0 +1,106 @@
+import json
+import os
+import shutil
+import tempfile
+import unittest
+
+from src.generator import CharImageGenerator
+from src.generator.manifest import MANIFEST_FILE, Manifest, summary_path
+
+
+class ManifestTests(unittest.TestCase):
+    """Tests for incremental generation with manifest."""
+    TEST_CHARSET = ['A', 'a', '0', '.', '&', '^']
+
+    @staticmethod
+    def count_images(prefix):
+        return sum(f.endswith('.png') for _, _, walkfiles in os.walk(os.path.join(prefix, 'data')) for f in walkfiles)
+
+    def generate(self, prefix, **kwargs):
+        gen = CharImageGenerator(out_dir=os.path.join(prefix, 'data'), charset=self.TEST_CHARSET)
+        gen.create_and_save_charsets(manifest_path=os.path.join(prefix, MANIFEST_FILE), **kwargs)
+
+    def test_manifest_records(self):
+        prefix = tempfile.mkdtemp()
+        self.generate(prefix, n_samples=3, seed=0)
+
+        manifest = Manifest(os.path.join(prefix, MANIFEST_FILE))
+        self.assertEqual(len(manifest), len(self.TEST_CHARSET) * 3)
+
+        record = manifest.records[('default', 'A', 1)]
+        self.assertTrue(os.path.isfile(record['output']))
+        self.assertIsInstance(record['seed'], int)
+
+    def test_rerun_skips_generated(self):
+        prefix = tempfile.mkdtemp()
+        self.generate(prefix, n_samples=3)
+        self.assertEqual(self.count_images(prefix), len(self.TEST_CHARSET) * 3)
+
+        # nothing is generated again, the images recorded in the manifest are trusted
+        shutil.rmtree(os.path.join(prefix, 'data'))
+        self.generate(prefix, n_samples=3)
+        self.assertEqual(self.count_images(prefix), 0)
+
+        # new samples are generated for the new parameters
+        self.generate(prefix, n_samples=4)
+        self.assertEqual(self.count_images(prefix), len(self.TEST_CHARSET) * 4)
+
+    def test_parallel_manifest_compacted(self):
+        prefix = tempfile.mkdtemp()
+        self.generate(prefix, n_samples=2, workers=2)
+
+        self.assertEqual(sorted(os.listdir(prefix)), ['data', 'manifest.fonts.jsonl', MANIFEST_FILE])
+        self.assertEqual(len(Manifest(os.path.join(prefix, MANIFEST_FILE))), len(self.TEST_CHARSET) * 2)
+
+    def test_changed_charset(self):
+        prefix = tempfile.mkdtemp()
+        self.generate(prefix, n_samples=2)
+
+        # same number of characters, but 'D' has never been generated
+        gen = CharImageGenerator(out_dir=os.path.join(prefix, 'data'), charset=self.TEST_CHARSET[:-1] + ['D'])
+        gen.create_and_save_charsets(manifest_path=os.path.join(prefix, MANIFEST_FILE), n_samples=2)
+
+        manifest = Manifest(os.path.join(prefix, MANIFEST_FILE))
+        self.assertIn(('default', 'D', 1), manifest.records)
+        self.assertEqual(len(manifest), (len(self.TEST_CHARSET) + 1) * 2)
+
+    def test_summary_read_only(self):
+        """Fonts done are known from the summary, their records are not read."""
+        prefix = tempfile.mkdtemp()
+        self.generate(prefix, n_samples=2)
+
+        manifest = Manifest(os.path.join(prefix, MANIFEST_FILE))
+        self.assertEqual(set(manifest.fonts), {'default'})
+        self.assertIn('charset', manifest.fonts['default'])
+        self.assertIsNone(manifest._records)
+
+    def test_resume_interrupted_font(self):
+        """Records of a font which has not been finished are read and its generated samples skipped."""
+        prefix = tempfile.mkdtemp()
+        self.generate(prefix, n_samples=2)
+
+        # as if the run was interrupted - the font is started, one record is missing
+        path = os.path.join(prefix, MANIFEST_FILE)
+        with open(path) as f:
+            lines = f.readlines()
+        with open(path, 'w') as f:
+            f.writelines(lines[:-1])
+        with open(summary_path(path)) as f:
+            entry = json.loads(f.readline())
+        with open(summary_path(path), 'w') as f:
+            f.write(json.dumps({key: entry[key] for key in ('font', 'font_hash', 'params')}) + '\n')
+
+        shutil.rmtree(os.path.join(prefix, 'data'))
+        self.generate(prefix, n_samples=2)
+        self.assertEqual(self.count_images(prefix), 1)
+        self.assertEqual(len(Manifest(path)), len(self.TEST_CHARSET) * 2)
+
+    def test_manifest_without_summary(self):
+        """Summary is created for manifests written before it was introduced."""
+        prefix = tempfile.mkdtemp()
+        self.generate(prefix, n_samples=2)
+        os.remove(summary_path(os.path.join(prefix, MANIFEST_FILE)))
+
+        shutil.rmtree(os.path.join(prefix, 'data'))
+        self.generate(prefix, n_samples=2)
+        self.assertEqual(self.count_images(prefix), 0)
@@ -0,0 +1,85 @@
+import random
+import threading
+import time
+import unittest
+
+from src.generator.pipeline import Pipeline, Stage, format_stats
+
+
+class PipelineTests(unittest.TestCase):
+    """Tests for the staged pipeline."""
+
+    @staticmethod
+    def jitter(x):
+        time.sleep(random.uniform(0, 0.002))
+        return x
+
+    def test_ordering(self):
+        written = list()
+        pipeline = Pipeline([
+            Stage('square', lambda x: self.jitter(x * x), workers=4),
+            Stage('write', lambda x: written.append(x) or x, ordered=True),
+        ], queue_size=2)
+
+        self.assertEqual(list(pipeline.run(range(50))), [x * x for x in range(50)])
+        self.assertEqual(written, [x * x for x in range(50)])
+        self.assertEqual(pipeline.stats[0].items, 50)
+
+    def test_dropped_items(self):
+        pipeline = Pipeline([
+            Stage('filter', lambda x: self.jitter(x) if x % 3 else None, workers=3),
+            Stage('double', lambda x: 2 * x, ordered=True, count=lambda x: 2),
+        ])
+
+        self.assertEqual(list(pipeline.run(range(10))), [2 * x for x in range(10) if x % 3])
+        # dropped items are not counted, every item of the last stage counts as 2
+        self.assertEqual(pipeline.stats[1].items, 2 * len([x for x in range(10) if x % 3]))
+        self.assertIn('double', format_stats(pipeline.stats))
+
+    def test_error_propagation(self):
+        def fail(x):
+            if x == 7:
+                raise KeyError(x)
+            return x
+
+        pipeline = Pipeline([Stage('fail', fail, workers=2), Stage('write', lambda x: x, ordered=True)])
+        with self.assertRaises(KeyError):
+            pipeline.execute(range(1000))
+
+        def items():
+            yield 1
+            raise ValueError('source')
+
+        with self.assertRaises(ValueError):
+            Pipeline([Stage('identity', lambda x: x)]).execute(items())
+
+    def test_backpressure(self):
+        pulled = list()
+        release = threading.Event()
+
+        def items():
+            for x in range(1000):
+                pulled.append(x)
+                yield x
+
+        def write(x):
+            release.wait()
+            return x
+
+        queue_size = 2
+        pipeline = Pipeline([
+            Stage('work', lambda x: x, workers=2),
+            Stage('write', write, ordered=True),
+        ], queue_size=queue_size)
+
+        results = list()
+        thread = threading.Thread(target=lambda: results.extend(pipeline.run(items())))
+        thread.start()
+        time.sleep(0.3)
+
+        # the source is not consumed further than the queues and the reorder window allow
+        self.assertLessEqual(len(pulled), pipeline.reorder_window + 2)
+
+        release.set()
+        thread.join()
+        self.assertEqual(results, list(range(1000)))
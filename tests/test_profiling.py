@@ -0,0 +1,68 @@
+import os
+import pickle
+import tempfile
+import threading
+import unittest
+
+from src.generator.profiling import Profiler, cprofile
+
+
+class ProfilerTests(unittest.TestCase):
+    """Tests for the run instrumentation."""
+
+    def test_timer(self):
+        profiler = Profiler()
+        with profiler.timer('render', 'a', items=3):
+            pass
+        with self.assertRaises(OSError):
+            with profiler.timer('render', 'b', items=3):
+                raise OSError('raster overflow')
+
+        calls, items, seconds = profiler.stages['render']
+        self.assertEqual((calls, items), (2, 3))
+        self.assertGreaterEqual(seconds, 0.)
+        self.assertEqual(list(profiler.errors), ['b'])
+        self.assertIn('raster overflow', profiler.summary())
+
+    def test_disabled(self):
+        profiler = Profiler(enabled=False)
+        with profiler.timer('render', 'a'):
+            pass
+        profiler.failure('a', 'broken')
+
+        self.assertEqual((profiler.stages, profiler.fonts, profiler.errors), ({}, {}, {}))
+
+    def test_slow_fonts(self):
+        profiler = Profiler()
+        for font_name in 'abc':
+            profiler.add('render', 1., items=10, font_name=font_name)
+        profiler.add('render', 10., items=10, font_name='slow')
+
+        self.assertEqual(list(profiler.slow_fonts()), ['slow'])
+        self.assertIn('slow (', profiler.summary())
+
+    def test_merge(self):
+        profiler, other = Profiler(), Profiler()
+        profiler.add('write', 1., items=2, font_name='a')
+        other.add('write', 2., items=3, font_name='a')
+        other.failure('b', OSError('missing'))
+
+        profiler.merge(pickle.loads(pickle.dumps(other)))
+        self.assertEqual(profiler.stages['write'], [2, 5, 3.])
+        self.assertEqual(profiler.font_times()['a'], (5, 3.))
+        self.assertEqual(profiler.errors, {'b': ['OSError: missing']})
+
+    def test_cprofile(self):
+        import pstats
+
+        def work():
+            return sum(i * i for i in range(1000))
+
+        path = os.path.join(tempfile.mkdtemp(), 'run.prof')
+        with cprofile(path):
+            thread = threading.Thread(target=work)
+            thread.start()
+            thread.join()
+
+        functions = [function for _, _, function in pstats.Stats(path).stats]
+        self.assertIn('work', functions)
@@ -0,0 +1,46 @@
+import tempfile
+import unittest
+
+import numpy as np
+
+from src.generator import reader
+from src.generator import sinks
+
+
+class ReaderTests(unittest.TestCase):
+    """Tests for memory-mapped dataset reader."""
+
+    def setUp(self):
+        self.shard_dir = tempfile.mkdtemp()
+        with sinks.NpyShardSink(self.shard_dir, shard_size=4) as sink:
+            for i in range(10):
+                subset = sinks.TEST if i % 5 == 0 else sinks.TRAIN
+                sink.write(chr(ord('A') + i % 3), 'font_%d' % (i % 2), i, np.full((8, 8), i, dtype=np.uint8),
+                           subset=subset)
+        sink.finalize()
+
+        self.dataset = reader.CharDataset(reader.consolidate(self.shard_dir))
+
+    def test_random_access(self):
+        self.assertEqual(len(self.dataset), 10)
+        self.assertIsInstance(self.dataset.images, np.memmap)
+
+        image, label = self.dataset[7]
+        self.assertEqual(image[0, 0], 7)
+        self.assertEqual(label, ord('B'))
+        self.assertEqual(self.dataset.font_names[self.dataset.fonts[7]], 'font_1')
+
+    def test_subsets(self):
+        test, train = self.dataset.test, self.dataset.train
+
+        self.assertEqual(len(test), 2)
+        self.assertEqual(len(train), 8)
+        self.assertEqual([int(image[0, 0]) for image, _ in (test[0], test[1])], [0, 5])
+
+    def test_shuffled_batches(self):
+        batches = list(self.dataset.batches(batch_size=4, shuffle=True, seed=0))
+        self.assertEqual([len(labels) for _, labels in batches], [4, 4, 2])
+
+        images = np.concatenate([images for images, _ in batches])
+        self.assertEqual(sorted(images[:, 0, 0].tolist()), list(range(10)))
+        self.assertNotEqual(images[:, 0, 0].tolist(), list(range(10)))
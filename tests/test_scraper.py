@@ -0,0 +1,107 @@
+import os
+import tempfile
+import threading
+import time
+import unittest
+
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from src.scraper.scraper import FontScraper, RateLimiter
+
+FONT_DATA = {name: os.urandom(200 * 1024) for name in ('FontA', 'FontB', 'FontC')}
+
+PAGES = {
+    '/': '<div id="pages-top"><ul><li>1</li><li>2</li></ul></div>',
+    '/?pg=1': '<div class="detail"><a href="/detail/FontA">A</a></div>'
+              '<div class="detail"><a href="/detail/FontB">B</a></div>',
+    '/?pg=2': '<div class="detail"><a href="/detail/FontC">C</a></div>',
+}
+PAGES.update({
+    '/detail/' + name: '<p class="detail"><a href="/files/{}.zip">Download</a></p>'.format(name)
+    for name in FONT_DATA
+})
+
+
+class FontSiteHandler(BaseHTTPRequestHandler):
+    """Stand-in of the font website."""
+
+    requests = list()
+
+    def do_GET(self):
+        self.requests.append(self.path)
+
+        if self.path.startswith('/files/'):
+            body = FONT_DATA.get(self.path[len('/files/'):-len('.zip')])
+        else:
+            body = PAGES.get(self.path, '').encode() or None
+
+        if body is None:
+            self.send_error(404)
+            return
+
+        self.send_response(200)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+class ScraperTests(unittest.TestCase):
+    """Tests for the font scraper run against a local server."""
+
+    @classmethod
+    def setUpClass(cls):
+        cls.server = ThreadingHTTPServer(('127.0.0.1', 0), FontSiteHandler)
+        cls.base_url = 'http://127.0.0.1:{}/'.format(cls.server.server_address[1])
+        threading.Thread(target=cls.server.serve_forever, daemon=True).start()
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.server.shutdown()
+        cls.server.server_close()
+
+    def setUp(self):
+        FontSiteHandler.requests.clear()
+
+    def test_scrape(self):
+        font_dir = tempfile.mkdtemp()
+        scraper = FontScraper(font_dir, base_url=self.base_url, workers=4, rate=None)
+
+        paths = scraper.scrape()
+        self.assertEqual(len(paths), len(FONT_DATA))
+        for name, data in FONT_DATA.items():
+            with open(os.path.join(font_dir, name, name + '.zip'), 'rb') as f:
+                self.assertEqual(f.read(), data)
+
+        self.assertEqual(len(scraper.manifest), len(FONT_DATA))
+        self.assertFalse([f for _, _, files in os.walk(font_dir) for f in files if f.endswith('.part')])
+
+    def test_resume_from_manifest(self):
+        font_dir = tempfile.mkdtemp()
+        FontScraper(font_dir, base_url=self.base_url, rate=None).scrape(pages=1)
+        FontSiteHandler.requests.clear()
+
+        paths = FontScraper(font_dir, base_url=self.base_url, rate=None).scrape()
+        self.assertEqual(paths, [os.path.join(font_dir, 'FontC', 'FontC.zip')])
+
+        downloads = [path for path in FontSiteHandler.requests if path.startswith('/files/')]
+        self.assertEqual(downloads, ['/files/FontC.zip'])
+
+    def test_missing_page(self):
+        font_dir = tempfile.mkdtemp()
+        scraper = FontScraper(font_dir, base_url=self.base_url, rate=None)
+
+        # the missing page is reported and skipped
+        self.assertEqual(len(scraper.scrape(pages=3)), len(FONT_DATA))
+
+    def test_rate_limiter(self):
+        limiter = RateLimiter(rate=50)
+
+        start = time.monotonic()
+        for _ in range(6):
+            limiter.wait('http://a.test/')
+        limiter.wait('http://b.test/')  # other hosts are not delayed
+
+        self.assertGreaterEqual(time.monotonic() - start, 5 / 50)
@@ -0,0 +1,64 @@
+import json
+import os
+import tempfile
+import unittest
+
+from src.generator import CharImageGenerator
+from src.generator import reader, sharding, sinks
+from src.generator.imgen import DEFAULT_FONT_PATH
+
+
+class ShardingTests(unittest.TestCase):
+    """Tests for the generation split across nodes."""
+    TEST_CHARSET = ['A', 'a', '0']
+    FONT_NAMES = ['font-{}'.format(i) for i in range(8)]
+
+    def generator(self, out_dir):
+        from PIL import ImageFont
+
+        font_dct = {name: ImageFont.truetype(DEFAULT_FONT_PATH, size=20) for name in self.FONT_NAMES}
+        return CharImageGenerator(out_dir=out_dir, font_dct=font_dct, charset=self.TEST_CHARSET, seed=0)
+
+    def test_shard_fonts(self):
+        shards = [sharding.shard_fonts(self.FONT_NAMES, i, 3) for i in range(3)]
+
+        # every font is owned by exactly one shard, independent of the order of the fonts
+        self.assertEqual(sorted(sum(shards, [])), self.FONT_NAMES)
+        self.assertEqual(sharding.shard_fonts(self.FONT_NAMES[::-1], 1, 3), shards[1][::-1])
+        self.assertRaises(ValueError, sharding.shard_fonts, self.FONT_NAMES, 3, 3)
+
+    def test_merge_shards(self):
+        prefix = tempfile.mkdtemp()
+        n_samples = 2
+        self.assertRaises(ValueError, sharding.merge_shards, prefix, 2)
+
+        for i in range(2):
+            out_dir = sharding.shard_dir(prefix, i, 2)
+            gen = self.generator(out_dir)
+            gen.select_fonts(sharding.shard_fonts(gen.font_dct, i, 2))
+            gen.create_and_save_charsets(n_samples=n_samples, sink=sinks.NpyShardSink(out_dir, shard_size=10),
+                                         manifest_path=os.path.join(out_dir, 'manifest.jsonl'))
+
+        summary = sharding.merge_shards(prefix, 2)
+        expected_size = len(self.FONT_NAMES) * len(self.TEST_CHARSET) * n_samples
+        self.assertEqual(summary['size'], expected_size)
+        self.assertEqual(summary['records'], expected_size)
+
+        with open(os.path.join(prefix, 'manifest.jsonl')) as f:
+            records = [json.loads(line) for line in f]
+        self.assertEqual({record['shard'] for record in records}, {'shard-0-of-2', 'shard-1-of-2'})
+
+        # the merged dataset is that of a single run
+        dataset = reader.CharDataset(reader.consolidate(prefix, os.path.join(prefix, 'merged')))
+        self.assertEqual(len(dataset), expected_size)
+
+        single_dir = tempfile.mkdtemp()
+        self.generator(single_dir).create_and_save_charsets(n_samples=n_samples, sink=sinks.NpyShardSink(single_dir))
+        single = reader.CharDataset(reader.consolidate(single_dir))
+
+        # samples are also in the same train/test subsets
+        def samples(data):
+            return {(data.font_names[font], label, index): (image.tobytes(), split) for image, label, font, index, split
+                    in zip(data.images, data.labels, data.fonts, data._take('samples'), data._take('splits'))}
+
+        self.assertEqual(samples(dataset), samples(single))
@@ -0,0 +1,80 @@
+import json
+import os
+import tarfile
+import tempfile
+import unittest
+
+import numpy as np
+
+from src.generator import CharImageGenerator
+from src.generator import sinks
+
+
+class SinksTests(unittest.TestCase):
+    """Tests for output sinks."""
+    TEST_CHARSET = ['A', 'a', '0', '.', '&', '^']
+
+    def test_npy_shard_sink(self):
+        out_dir = tempfile.mkdtemp()
+        with sinks.NpyShardSink(out_dir, shard_size=4) as sink:
+            for i in range(10):
+                sink.write('A', 'font', i, np.full((8, 8), i, dtype=np.uint8), subset=sinks.TRAIN)
+        index = sink.finalize()
+
+        self.assertEqual(index['size'], 10)
+        self.assertEqual([shard['size'] for shard in index['shards']], [4, 4, 2])
+
+        images = np.load(os.path.join(out_dir, 'shard-00001.images.npy'), mmap_mode='r')
+        self.assertEqual(images.shape, (4, 8, 8))
+        self.assertEqual(images[0, 0, 0], 4)
+
+    def test_tar_shard_sink(self):
+        out_dir = tempfile.mkdtemp()
+        with sinks.TarShardSink(out_dir, shard_size=2) as sink:
+            for i in range(3):
+                sink.write('A', 'font', i, np.zeros((8, 8), dtype=np.uint8))
+        index = sink.finalize()
+
+        self.assertEqual(len(index['shards']), 2)
+        with tarfile.open(os.path.join(out_dir, 'shard-00000.tar')) as tar:
+            self.assertEqual(tar.getnames(), ['font_65_0.png', 'font_65_0.cls', 'font_65_0.json',
+                                              'font_65_1.png', 'font_65_1.cls', 'font_65_1.json'])
+
+    def test_create_and_save_charsets_npy(self):
+        n_samples = 3
+        out_dir = tempfile.mkdtemp()
+        gen = CharImageGenerator(out_dir=out_dir, charset=self.TEST_CHARSET)
+        gen.create_and_save_charsets(n_samples=n_samples, augment=True, sink=sinks.NpyShardSink(out_dir))
+
+        with open(os.path.join(out_dir, sinks.INDEX_FILE)) as f:
+            index = json.load(f)
+
+        self.assertEqual(index['size'], len(self.TEST_CHARSET) * n_samples)
+        labels = np.load(os.path.join(out_dir, 'shard-00000.labels.npy'))
+        self.assertEqual(set(labels.tolist()), set(ord(c) for c in self.TEST_CHARSET))
+
+    def test_create_and_save_charsets_npy_grayscale(self):
+        out_dir = tempfile.mkdtemp()
+        gen = CharImageGenerator(out_dir=out_dir, charset=self.TEST_CHARSET)
+        gen.create_and_save_charsets(n_samples=2, augment=True, sink=sinks.NpyShardSink(out_dir), mode='L')
+
+        images = np.load(os.path.join(out_dir, 'shard-00000.images.npy'), mmap_mode='r')
+        self.assertEqual(images.shape, (len(self.TEST_CHARSET) * 2, 32, 32))
+        self.assertEqual(images.dtype, np.uint8)
+
+    def test_stale_shards_removed(self):
+        out_dir = tempfile.mkdtemp()
+        with sinks.NpyShardSink(out_dir, shard_size=2) as sink:
+            for i in range(6):
+                sink.write('A', 'old-font', i, np.zeros((8, 8), dtype=np.uint8))
+        sink.finalize()
+
+        # the next run writes fewer shards, shards of the previous run are not indexed
+        with sinks.NpyShardSink(out_dir, shard_size=4) as sink:
+            for i in range(3):
+                sink.write('A', 'font', i, np.zeros((8, 8), dtype=np.uint8))
+        index = sink.finalize()
+
+        self.assertEqual(index['size'], 3)
+        self.assertEqual([shard['font_names'] for shard in index['shards']], [['font']])
+        self.assertFalse(os.path.exists(os.path.join(out_dir, 'shard-00002.images.npy')))
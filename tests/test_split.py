@@ -0,0 +1,68 @@
+import os
+import tempfile
+import unittest
+
+import numpy as np
+
+from src.generator import CharImageGenerator
+from src.generator import sinks
+from src.generator.split import SPLIT_FILE, SplitTable
+
+TEST = sinks.SPLITS.index(sinks.TEST)
+
+
+class SplitTableTests(unittest.TestCase):
+    """Tests for the train/test split table."""
+    CHARSET = ['A', 'a', '0', '.']
+    FONT_NAMES = ['font-{}'.format(i) for i in range(20)]
+
+    def test_stratified(self):
+        coverage = np.ones((len(self.FONT_NAMES), len(self.CHARSET)), dtype=bool)
+        coverage[:4, 0] = False
+        table = SplitTable.create(self.FONT_NAMES, self.CHARSET, 5, split_ratio=0.2, seed=0, coverage=coverage)
+
+        self.assertEqual(table.table.shape, (20, 4, 5))
+        # the same fraction of the covered samples of every character is in the test set
+        test = table.table == TEST
+        self.assertEqual(test[4:, 0].sum(), 16)
+        self.assertSequenceEqual(test.sum(axis=(0, 2))[1:].tolist(), [20] * 3)
+        self.assertFalse(test[:4, 0].any())
+
+        self.assertTrue((SplitTable.create(self.FONT_NAMES, self.CHARSET, 5, seed=0, coverage=coverage).table
+                         == table.table).all())
+        self.assertIn(table.subset('font-3', 'a', 2), sinks.SPLITS)
+
+    def test_holdout_and_extend(self):
+        table = SplitTable.create(self.FONT_NAMES, self.CHARSET, 3, split_ratio=0.2, holdout_ratio=0.3, seed=1)
+        held_out = (table.table == TEST).all(axis=(1, 2))
+        self.assertTrue(0 < held_out.sum() < len(self.FONT_NAMES))
+
+        # the split of a font does not depend on the other fonts, e.g. of the other shards
+        subset = SplitTable.create(self.FONT_NAMES[5:10], self.CHARSET, 3, split_ratio=0.2, holdout_ratio=0.3, seed=1)
+        self.assertTrue((subset.table == table.table[5:10]).all())
+        self.assertTrue((table.table == TEST).any() and (table.table != TEST).any())
+
+        # new fonts do not change the assignment of the fonts in the table
+        extended = table.extend(self.FONT_NAMES + ['new-font'])
+        self.assertTrue((extended.table[:-1] == table.table).all())
+        self.assertEqual(extended.select(['font-2']).table.tolist(), table.table[2:3].tolist())
+
+        path = os.path.join(tempfile.mkdtemp(), SPLIT_FILE)
+        extended.save(path)
+        loaded = SplitTable.load(path)
+        self.assertEqual(loaded.font_names, extended.font_names)
+        self.assertTrue((loaded.table == extended.table).all())
+        self.assertTrue(loaded.compatible(self.CHARSET, 3, split_ratio=0.2, holdout_ratio=0.3))
+        self.assertFalse(loaded.compatible(self.CHARSET, 5, split_ratio=0.2, holdout_ratio=0.3))
+
+    def test_generator_follows_table(self):
+        prefix = tempfile.mkdtemp()
+        gen = CharImageGenerator(out_dir=prefix, charset=self.CHARSET, seed=0)
+        gen.create_and_save_charsets(n_samples=5, augment=True)
+
+        table = SplitTable.load(os.path.join(prefix, SPLIT_FILE))
+        for char in self.CHARSET:
+            for index in range(5):
+                subset_dir = 'test_data' if table.subset('default', char, index) == sinks.TEST else 'train_data'
+                path = os.path.join(prefix, subset_dir, 'charset', str(ord(char)), 'default_{}.png'.format(index))
+                self.assertTrue(os.path.isfile(path), msg=path)
@@ -0,0 +1,59 @@
+import unittest
+
+import numpy as np
+
+from src.generator import transforms
+
+
+class TransformsTests(unittest.TestCase):
+    """Tests for batched affine augmentation."""
+
+    def setUp(self):
+        self.batch = np.random.RandomState(0).randint(0, 256, size=(4, 32, 32, 3)).astype(np.uint8)
+
+    def test_identity(self):
+        augmenter = transforms.AffineAugmenter()
+        transformed = augmenter.transform_batch(self.batch)
+
+        self.assertEqual(transformed.dtype, np.uint8)
+        self.assertTrue(np.array_equal(transformed, self.batch))
+
+    def test_rotation(self):
+        batch = self.batch[..., 0].astype(np.float32)
+        n = batch.shape[0]
+        matrices = transforms.transform_matrix([90] * n, [0] * n, [1] * n, [1] * n, shape=batch.shape[1:3])
+        rotated = transforms.affine_transform(batch, matrices)
+
+        self.assertTrue(np.allclose(rotated, np.rot90(batch, k=-1, axes=(1, 2)), atol=1e-3))
+
+    def test_seeded_reproducible(self):
+        params = dict(shear_range=0.2, zoom_range=0.2, rotation_range=15, seed=42)
+        first = transforms.AffineAugmenter(**params).transform_batch(self.batch)
+        second = transforms.AffineAugmenter(**params).transform_batch(self.batch)
+
+        self.assertEqual(first.shape, self.batch.shape)
+        self.assertTrue(np.array_equal(first, second))
+        self.assertFalse(np.array_equal(first, self.batch))
+
+    def test_invalid_fill_mode(self):
+        augmenter = transforms.AffineAugmenter(rotation_range=15, fill_mode='mirror')
+
+        with self.assertRaises(ValueError):
+            augmenter.transform_batch(self.batch)
+
+    def test_shift(self):
+        batch = self.batch[..., 0].astype(np.float32)
+        n = batch.shape[0]
+        matrices = transforms.transform_matrix([0] * n, [0] * n, [1] * n, [1] * n, shape=batch.shape[1:3],
+                                               tx=[2] * n, ty=[-3] * n)
+        shifted = transforms.affine_transform(batch, matrices, fill_mode='wrap')
+
+        self.assertTrue(np.allclose(shifted, np.roll(batch, (-2, 3), axis=(1, 2))))
+
+    def test_flips(self):
+        augmenter = transforms.AffineAugmenter(horizontal_flip=True, vertical_flip=True, seed=0)
+        transformed = augmenter.transform_batch(np.repeat(self.batch[:1], 16, axis=0))
+
+        flips = {self.batch[0].tobytes(): 'none', self.batch[0, :, ::-1].tobytes(): 'h',
+                 self.batch[0, ::-1].tobytes(): 'v', self.batch[0, ::-1, ::-1].tobytes(): 'hv'}
+        self.assertEqual({flips[sample.tobytes()] for sample in transformed}, {'none', 'h', 'v', 'hv'})